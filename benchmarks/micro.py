@@ -0,0 +1,392 @@
+"""Microbenchmarks for the orchestrator, in-memory backends and framing.
+
+    python benchmarks/micro.py run --output benchmarks/baseline.json
+    python benchmarks/micro.py compare benchmarks/baseline.json new.json
+
+Each scenario drives the components directly (no sockets), runs `--repeat`
+times on fresh state and keeps the fastest run, which is the least noisy
+estimate of the code's cost. `compare` exits with status 1 if any scenario
+is slower than the baseline by more than `--threshold`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Tuple
+from mamamia.core.models import RetryPolicy
+from mamamia.core.protocol import Command, pack_message, read_message
+from mamamia.server.orchestrator import Orchestrator
+from mamamia.server.storage.in_memory import InMemoryStorage
+from mamamia.server.state.in_memory import InMemoryStateStore
+from mamamia.server.lease.in_memory import InMemoryLeaseManager
+from mamamia.server.cache import FrameCache
+from mamamia.server.registry import LogRegistry
+from mamamia.server.tcp import TcpFrontend
+
+# A scenario takes a size multiplier and returns (operations, seconds).
+Scenario = Callable[[float], Awaitable[Tuple[int, float]]]
+SCENARIOS: Dict[str, Scenario] = {}
+
+LOG = "bench"
+GROUP = "g"
+
+
+def scenario(fn: Scenario) -> Scenario:
+    SCENARIOS[fn.__name__] = fn
+    return fn
+
+
+def make_orchestrator(retry_policy: RetryPolicy = None) -> Orchestrator:
+    return Orchestrator(
+        InMemoryStorage(),
+        InMemoryStateStore(),
+        InMemoryLeaseManager(),
+        retry_policy=retry_policy,
+    )
+
+
+async def fill(orch: Orchestrator, count: int, payload=None):
+    await orch.storage.append_batch(
+        LOG, [(payload if payload is not None else i, None, None) for i in range(count)]
+    )
+
+
+@scenario
+async def produce(scale: float) -> Tuple[int, float]:
+    """Single-message appends through Orchestrator.produce."""
+    orch = make_orchestrator()
+    n = int(20_000 * scale)
+    start = time.perf_counter()
+    for i in range(n):
+        await orch.produce(LOG, {"i": i}, {"ts": 0})
+    return n, time.perf_counter() - start
+
+
+@scenario
+async def produce_batch(scale: float) -> Tuple[int, float]:
+    """Appends in batches of 100 through Orchestrator.produce_batch."""
+    orch = make_orchestrator()
+    n = int(100_000 * scale)
+    batch = [({"i": i}, None, None) for i in range(100)]
+    start = time.perf_counter()
+    for _ in range(n // 100):
+        await orch.produce_batch(LOG, batch)
+    return n, time.perf_counter() - start
+
+
+@scenario
+async def acquire_settle(scale: float) -> Tuple[int, float]:
+    """The basic consume cycle on a backlog: acquire_next then settle."""
+    orch = make_orchestrator()
+    n = int(10_000 * scale)
+    await fill(orch, n)
+    start = time.perf_counter()
+    for _ in range(n):
+        msg = await orch.acquire_next(LOG, GROUP, "c")
+        await orch.settle(LOG, GROUP, msg.id, "c", True)
+    return n, time.perf_counter() - start
+
+
+@scenario
+async def deep_inflight(scale: float) -> Tuple[int, float]:
+    """Acquires while thousands of earlier messages are leased and unsettled,
+    so every scan has to step over the in-flight prefix."""
+    orch = make_orchestrator()
+    depth = int(5_000 * scale)
+    n = int(2_000 * scale)
+    await fill(orch, depth + n)
+    for _ in range(depth):
+        await orch.acquire_next(LOG, GROUP, "holder", duration=3600)
+    start = time.perf_counter()
+    for _ in range(n):
+        await orch.acquire_next(LOG, GROUP, "c")
+    return n, time.perf_counter() - start
+
+
+@scenario
+async def acquire_batch(scale: float) -> Tuple[int, float]:
+    """Leases and settles in batches of 100 with acquire_batch/settle_batch."""
+    orch = make_orchestrator()
+    n = int(50_000 * scale)
+    await fill(orch, n)
+    start = time.perf_counter()
+    done = 0
+    while done < n:
+        messages = await orch.acquire_batch(LOG, GROUP, "c", max_messages=100)
+        await orch.settle_batch(
+            LOG, GROUP, "c", [(m.id, True, None) for m in messages]
+        )
+        done += len(messages)
+    return done, time.perf_counter() - start
+
+
+@scenario
+async def many_groups(scale: float) -> Tuple[int, float]:
+    """Hundreds of consumer groups taking turns on one log."""
+    orch = make_orchestrator()
+    groups = [f"g{i}" for i in range(200)]
+    per_group = max(1, int(50 * scale))
+    await fill(orch, per_group)
+    start = time.perf_counter()
+    for _ in range(per_group):
+        for group in groups:
+            msg = await orch.acquire_next(LOG, group, "c")
+            await orch.settle(LOG, group, msg.id, "c", True)
+    return per_group * len(groups), time.perf_counter() - start
+
+
+@scenario
+async def high_retry(scale: float) -> Tuple[int, float]:
+    """Every delivery fails twice before succeeding (no backoff delay)."""
+    orch = make_orchestrator(RetryPolicy(max_retries=5, base_delay=0))
+    n = int(3_000 * scale)
+    await fill(orch, n)
+    ops = 0
+    start = time.perf_counter()
+    attempts: Dict[int, int] = {}
+    while True:
+        msg = await orch.acquire_next(LOG, GROUP, "c")
+        if msg is None:
+            break
+        attempts[msg.id] = attempts.get(msg.id, 0) + 1
+        await orch.settle(LOG, GROUP, msg.id, "c", attempts[msg.id] > 2)
+        ops += 1
+    return ops, time.perf_counter() - start
+
+
+@scenario
+async def large_payload(scale: float) -> Tuple[int, float]:
+    """Produce and acquire 256KB payloads."""
+    orch = make_orchestrator()
+    n = int(500 * scale)
+    payload = b"x" * (256 * 1024)
+    start = time.perf_counter()
+    for _ in range(n):
+        await orch.produce(LOG, payload)
+    for _ in range(n):
+        msg = await orch.acquire_next(LOG, GROUP, "c")
+        await orch.settle(LOG, GROUP, msg.id, "c", True)
+    return n, time.perf_counter() - start
+
+
+@scenario
+async def fan_out(scale: float) -> Tuple[int, float]:
+    """Ten groups batch-acquire the same structured messages through the
+    command handler, with the shared encoded-message cache."""
+    frontend = TcpFrontend(LogRegistry(), frame_cache=FrameCache())
+    n = int(2_000 * scale)
+    items = [{"k": j, "v": "x" * 16} for j in range(50)]
+    await frontend.registry.get_orchestrator(LOG).produce_batch(
+        LOG, [({"i": i, "items": items}, None, None) for i in range(n)]
+    )
+    start = time.perf_counter()
+    for g in range(10):
+        body = {
+            "log_id": LOG,
+            "group_id": f"g{g}",
+            "client_id": "c",
+            "max_messages": 100,
+        }
+        for _ in range(n // 100):
+            await frontend.process_command(Command.ACQUIRE_BATCH, body)
+    return n * 10, time.perf_counter() - start
+
+
+async def _frame_roundtrip(body, n: int) -> Tuple[int, float]:
+    reader = asyncio.StreamReader()
+    start = time.perf_counter()
+    for _ in range(n):
+        reader.feed_data(pack_message(Command.ACQUIRE_NEXT, body))
+        await read_message(reader)
+    return n, time.perf_counter() - start
+
+
+@scenario
+async def frame_small(scale: float) -> Tuple[int, float]:
+    """pack_message + read_message of a typical small message response."""
+    body = {
+        "message": {
+            "id": 12345,
+            "log_id": LOG,
+            "payload": {"order_id": 1, "amount": 9.99},
+            "metadata": {"ts": 1.0},
+            "key": None,
+        }
+    }
+    return await _frame_roundtrip(body, int(50_000 * scale))
+
+
+@scenario
+async def frame_large(scale: float) -> Tuple[int, float]:
+    """pack_message + read_message of a 1MB payload."""
+    body = {"message": {"id": 1, "log_id": LOG, "payload": b"x" * (1024 * 1024)}}
+    return await _frame_roundtrip(body, int(300 * scale))
+
+
+# Run in a fresh interpreter per sample: prints the import time and whether
+# pydantic came along with it.
+_IMPORT_PROBE = """\
+import sys, time
+start = time.perf_counter()
+import {modules}
+print(time.perf_counter() - start, "pydantic" in sys.modules)
+"""
+
+
+async def _cold_import(modules: str, scale: float) -> Tuple[int, float]:
+    n = max(1, int(10 * scale))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    total = 0.0
+    for _ in range(n):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE.format(modules=modules)],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=env,
+        ).stdout.split()
+        if out[1] == "True":
+            raise RuntimeError(f"Importing {modules} loaded pydantic")
+        total += float(out[0])
+    return n, total
+
+
+@scenario
+async def import_async(scale: float) -> Tuple[int, float]:
+    """Cold import of the asyncio producer and consumer clients."""
+    return await _cold_import("mamamia.client.producer, mamamia.client.consumer", scale)
+
+
+@scenario
+async def import_sync(scale: float) -> Tuple[int, float]:
+    """Cold import of the blocking clients."""
+    return await _cold_import("mamamia.client.sync", scale)
+
+
+async def run_scenarios(names: List[str], repeat: int, scale: float) -> dict:
+    results = {}
+    for name in names:
+        timings = []
+        ops = 0
+        for _ in range(repeat):
+            ops, seconds = await SCENARIOS[name](scale)
+            timings.append(seconds)
+        best = min(timings)
+        results[name] = {
+            "ops": ops,
+            "seconds": best,
+            "median_seconds": statistics.median(timings),
+            "ops_per_sec": ops / best if best > 0 else 0.0,
+            "us_per_op": best / ops * 1e6 if ops else 0.0,
+        }
+        print(
+            f"{name:<16} {results[name]['ops_per_sec']:>12.0f} ops/s "
+            f"{results[name]['us_per_op']:>10.2f} us/op"
+        )
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Prints a comparison and returns the scenarios that regressed."""
+    regressions = []
+    print(f"{'Scenario':<16} {'Baseline':>12} {'Current':>12} {'Change':>8}")
+    for name, base in baseline["results"].items():
+        now = current["results"].get(name)
+        if now is None:
+            print(f"{name:<16} {base['ops_per_sec']:>12.0f} {'missing':>12}")
+            continue
+        change = now["ops_per_sec"] / base["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<16} {base['ops_per_sec']:>12.0f} {now['ops_per_sec']:>12.0f} "
+            f"{change:>+7.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mamamia microbenchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run scenarios and save the results")
+    run.add_argument("--output", help="Write results as JSON to this path")
+    run.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="Comma-separated scenarios to run",
+    )
+    run.add_argument("--repeat", type=int, default=3, help="Runs per scenario")
+    run.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier on scenario sizes"
+    )
+    run.add_argument(
+        "--baseline", help="Compare against this baseline after running"
+    )
+    run.add_argument("--threshold", type=float, default=0.10)
+
+    cmp = commands.add_parser("compare", help="Compare two result files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Allowed slowdown as a fraction of baseline throughput",
+    )
+
+    commands.add_parser("list", help="List scenarios")
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name, fn in SCENARIOS.items():
+            print(f"{name:<16} {fn.__doc__}")
+        return
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    names = args.scenarios.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    results = asyncio.run(run_scenarios(names, args.repeat, args.scale))
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "scale": args.scale,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        sys.exit(1 if compare(baseline, report, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,20 @@ import statistics
 import argparse
 import json
 import os
+import tempfile
 from datetime import datetime
 from mamamia.server.registry import LogRegistry
 from mamamia.server.tcp import TcpFrontend
 from mamamia.client.producer import ProducerClient
 from mamamia.client.consumer import ConsumerClient
-from mamamia.client.transport import TcpTransport
+from mamamia.client.transport import TcpTransport, UnixTransport
+from mamamia.client.inprocess import InProcessTransport
 
+TRANSPORTS = ("tcp", "unix", "inprocess")
 
-async def run_producer_bench(addr, log_id, count, producer_id, shared_state):
-    host, port = addr.split(":")
-    transport = TcpTransport(host, int(port))
+
+async def run_producer_bench(make_transport, log_id, count, producer_id, shared_state):
+    transport = make_transport()
     producer = ProducerClient(transport, log_id)
 
     for i in range(count):
@@ -27,9 +30,10 @@ async def run_producer_bench(addr, log_id, count, producer_id, shared_state):
     return count
 
 
-async def run_consumer_bench(addr, log_id, group_id, target_count, shared_state):
-    host, port = addr.split(":")
-    transport = TcpTransport(host, int(port))
+async def run_consumer_bench(
+    make_transport, log_id, group_id, target_count, shared_state
+):
+    transport = make_transport()
     consumer = ConsumerClient(transport, log_id, group_id)
     processed_locally = 0
     latencies = []
@@ -74,18 +78,47 @@ async def monitor_metrics(shared_state, metrics_log, stop_event):
         await asyncio.sleep(0.1)
 
 
-async def run_scenario(addr, scenario, internal_server=False):
+async def run_scenario(
+    addr, scenario, internal_server=False, backend="memory", transport="tcp"
+):
     server_task = None
     server = None
+    registry = None
+    tmp_dir = None
 
     if internal_server:
-        registry = LogRegistry()
+        tmp_dir = tempfile.TemporaryDirectory()
+        registry = LogRegistry(
+            backend=backend, sqlite_path=os.path.join(tmp_dir.name, "bench.db")
+        )
         registry.start_reaper(interval=30.0)
-        server = TcpFrontend(registry, host="127.0.0.1", port=9002)
+        server = TcpFrontend(
+            registry,
+            host="127.0.0.1",
+            port=9002,
+            unix_path=os.path.join(tmp_dir.name, "bench.sock"),
+        )
         server_task = asyncio.create_task(server.start())
         await asyncio.sleep(1)
         addr = "127.0.0.1:9002"
 
+    if transport == "unix":
+        unix_path = server.unix_path if server else addr
+
+        def make_transport():
+            return UnixTransport(unix_path)
+
+    elif transport == "inprocess":
+
+        def make_transport():
+            return InProcessTransport(server)
+
+    else:
+        host, port = addr.split(":")
+
+        def make_transport():
+            return TcpTransport(host, int(port))
+
     log_id = f"bench-{int(time.time())}"
     group_id = "bench-group"
     msgs = scenario["msgs"]
@@ -111,12 +144,14 @@ async def run_scenario(addr, scenario, internal_server=False):
     producer_tasks = []
     for i in range(producers):
         count = msgs_per_producer + (1 if i < msgs % producers else 0)
-        producer_tasks.append(run_producer_bench(addr, log_id, count, i, shared_state))
+        producer_tasks.append(
+            run_producer_bench(make_transport, log_id, count, i, shared_state)
+        )
 
     consumer_tasks = []
     for i in range(consumers):
         consumer_tasks.append(
-            run_consumer_bench(addr, log_id, group_id, msgs, shared_state)
+            run_consumer_bench(make_transport, log_id, group_id, msgs, shared_state)
         )
 
     results = await asyncio.gather(
@@ -146,6 +181,8 @@ async def run_scenario(addr, scenario, internal_server=False):
 
     metrics = {
         "name": scenario["name"],
+        "backend": backend if internal_server else "external",
+        "transport": transport,
         "msgs": msgs,
         "producers": producers,
         "consumers": consumers,
@@ -168,6 +205,10 @@ async def run_scenario(addr, scenario, internal_server=False):
             await server_task
         except asyncio.CancelledError:
             pass
+    if registry:
+        await registry.close()
+    if tmp_dir:
+        tmp_dir.cleanup()
 
     return metrics
 
@@ -178,6 +219,8 @@ def generate_html_report(results, output_path):
         rows += f"""
         <tr>
             <td>{r["name"]}</td>
+            <td>{r["backend"]}</td>
+            <td>{r["transport"]}</td>
             <td>{r["msgs"]}</td>
             <td>{r["producers"]}</td>
             <td>{r["consumers"]}</td>
@@ -218,6 +261,8 @@ def generate_html_report(results, output_path):
                 <thead>
                     <tr>
                         <th>Scenario</th>
+                        <th>Backend</th>
+                        <th>Transport</th>
                         <th>Messages</th>
                         <th>Producers</th>
                         <th>Consumers</th>
@@ -264,11 +309,13 @@ def generate_html_report(results, output_path):
 
 def print_cli_report(results):
     print("\n" + "=" * 90)
-    print(f"{'Scenario':<25} | {'TPS':<10} | {'Avg Lat':<10} | {'P95 Lat':<10}")
+    print(
+        f"{'Scenario':<25} | {'Backend':<8} | {'Transport':<9} | {'TPS':<10} | {'Avg Lat':<10} | {'P95 Lat':<10}"
+    )
     print("-" * 90)
     for r in results:
         print(
-            f"{r['name']:<25} | {r['c_throughput']:<10.2f} | {r['avg_latency']:<10.2f} | {r['p95_latency']:<10.2f}"
+            f"{r['name']:<25} | {r['backend']:<8} | {r['transport']:<9} | {r['c_throughput']:<10.2f} | {r['avg_latency']:<10.2f} | {r['p95_latency']:<10.2f}"
         )
     print("=" * 90 + "\n")
 
@@ -284,6 +331,18 @@ async def main():
     parser.add_argument(
         "--internal-server", action="store_true", help="Use internal server"
     )
+    parser.add_argument(
+        "--backends",
+        default="memory",
+        help="Comma-separated state/lease backends to compare with the internal server (e.g. memory,sqlite)",
+    )
+
+    parser.add_argument(
+        "--transports",
+        default="tcp",
+        help=f"Comma-separated client transports to compare ({', '.join(TRANSPORTS)}); "
+        "inprocess needs the internal server, and unix takes the socket path as --addr for an external one",
+    )
 
     args = parser.parse_args()
 
@@ -294,11 +353,25 @@ async def main():
     with open(args.config, "r") as f:
         config = json.load(f)
 
+    backends = args.backends.split(",") if args.internal_server else ["external"]
+    transports = args.transports.split(",")
+    for transport in transports:
+        if transport not in TRANSPORTS:
+            print(f"Error: unknown transport {transport!r}")
+            return
+    if "inprocess" in transports and not args.internal_server:
+        print("Error: the inprocess transport requires --internal-server")
+        return
+
     results = []
     for scenario in config["scenarios"]:
-        print(f"Running scenario: {scenario['name']}...")
-        metrics = await run_scenario(args.addr, scenario, args.internal_server)
-        results.append(metrics)
+        for backend in backends:
+            for transport in transports:
+                print(f"Running scenario: {scenario['name']} ({backend}, {transport})...")
+                metrics = await run_scenario(
+                    args.addr, scenario, args.internal_server, backend, transport
+                )
+                results.append(metrics)
 
     if config.get("output", {}).get("cli", True):
         print_cli_report(results)
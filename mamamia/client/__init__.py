@@ -0,0 +1,43 @@
+"""Client API.
+
+Names are resolved on first use, so `from mamamia.client import
+SyncProducerClient` loads only the blocking client (no asyncio), and the
+pydantic models (`Message`, `MessageState`, `RetryPolicy`) are imported only
+if asked for. The clients themselves exchange plain dicts and never need
+them.
+"""
+
+from importlib import import_module
+from typing import Any
+
+_EXPORTS = {
+    "AdminClient": "mamamia.client.admin",
+    "ConsumerClient": "mamamia.client.consumer",
+    "ProducerClient": "mamamia.client.producer",
+    "StreamConsumerClient": "mamamia.client.stream",
+    "ConnectionPool": "mamamia.client.sync",
+    "SyncConsumerClient": "mamamia.client.sync",
+    "SyncProducerClient": "mamamia.client.sync",
+    "TcpTransport": "mamamia.client.transport",
+    "UnixTransport": "mamamia.client.transport",
+    "InProcessTransport": "mamamia.client.inprocess",
+    "ThrottledError": "mamamia.core.protocol",
+    "Message": "mamamia.core.models",
+    "MessageState": "mamamia.core.models",
+    "RetryPolicy": "mamamia.core.models",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,276 @@
+import msgpack
+from typing import IO, Any, Dict, List, Optional, Union
+from mamamia.core.blobs import parse_ref
+from mamamia.core.protocol import Command
+from mamamia.client.transport import ITransport, TcpTransport
+
+# Header of a snapshot file written by AdminClient.export_snapshot().
+SNAPSHOT_FORMAT = "mamamia-snapshot"
+# Version 2 added the scheduled messages; version 1 files still import.
+SNAPSHOT_VERSION = 2
+# Snapshot entries fetched per EXPORT_LOG request (the server caps the byte
+# budget at half a frame), and message ids per EXPORT_GROUP request.
+SNAPSHOT_PAGE_BYTES = 4 * 1024 * 1024
+SNAPSHOT_PAGE_SIZE = 100000
+
+
+def _open_snapshot(path: str, mode: str) -> IO[bytes]:
+    """Opens a snapshot file, gzip-compressed if the path ends in .gz."""
+    if path.endswith(".gz"):
+        import gzip
+
+        return gzip.open(path, mode)  # type: ignore[return-value]
+    return open(path, mode)
+
+
+class AdminClient:
+    def __init__(self, transport_or_addr: Union[str, ITransport]):
+        if isinstance(transport_or_addr, str):
+            if ":" in transport_or_addr:
+                host, port_str = transport_or_addr.split(":", 1)
+                port = int(port_str)
+            else:
+                host = transport_or_addr
+                port = 9000
+            self.transport = TcpTransport(host, port)
+        else:
+            self.transport = transport_or_addr
+
+    async def close(self):
+        await self.transport.close()
+
+    async def read_dead_letters(
+        self, log_id: str, offset: int = 0, limit: int = 100
+    ) -> Dict[str, Any]:
+        """Returns {"messages": [...], "next_offset": int} from log_id's DLQ."""
+        return await self.transport.request(
+            Command.READ_DLQ, {"log_id": log_id, "offset": offset, "limit": limit}
+        )
+
+    async def read_all_dead_letters(
+        self, log_id: str, page_size: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Reads log_id's whole DLQ page by page."""
+        letters: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page = await self.read_dead_letters(log_id, offset, page_size)
+            if not page["messages"]:
+                return letters
+            letters.extend(page["messages"])
+            offset = page["next_offset"]
+
+    async def replay_dead_letters(self, log_id: str, start: int, end: int) -> int:
+        """Re-enqueues DLQ entries [start, end) to their source log in one request."""
+        response = await self.transport.request(
+            Command.REPLAY_DLQ, {"log_id": log_id, "start": start, "end": end}
+        )
+        return response["replayed"]
+
+    async def stats(
+        self, log_id: str, group_ids: Optional[List[str]] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """Returns {group_id: counters} for the given groups of log_id, or for
+        every group that has consumed from it.
+
+        Counters are head, base_offset, lag, pending, in_flight, failed, dead,
+        processed, backing_off and scheduled.
+        """
+        body: Dict[str, Any] = {"log_id": log_id}
+        if group_ids:
+            body["group_ids"] = group_ids
+        response = await self.transport.request(Command.STATS, body)
+        return response["groups"]
+
+    async def latency(self, log_id: str) -> Dict[str, Dict[str, float]]:
+        """Returns the server's request latency for log_id, split into
+        "queued" (waiting for the fair scheduler) and "service" (running).
+
+        Each has count, mean_ms, p50_ms, p99_ms and max_ms.
+        """
+        response = await self.transport.request(
+            Command.STATS, {"log_id": log_id, "group_ids": []}
+        )
+        return response["latency"]
+
+    async def promote(self):
+        """Promotes a follower server to leader."""
+        await self.transport.request(Command.PROMOTE, {})
+
+    async def export_snapshot(
+        self, log_id: str, path: str, group_ids: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """Streams log_id and its consumer groups' states to a snapshot file.
+
+        The file is a sequence of msgpack records: a header, chunks of
+        [payload, metadata, key] entries in id order, chunks of the
+        scheduled messages not yet due, then pages of each group's state
+        (every group that has consumed from the log, unless group_ids is
+        given). Messages appended once the entries are written are left
+        out, and so are leases.
+
+        Claim-checked payloads are written as references only: the blob
+        files stay in the server's blob directory, which has to be copied
+        along for the snapshot to be read elsewhere.
+        Returns {"messages": int, "scheduled": int, "groups": int,
+        "blobs": references}.
+        """
+        if group_ids is None:
+            group_ids = list(await self.stats(log_id))
+        packer = msgpack.Packer()
+        length = 0
+        blobs = 0
+        with _open_snapshot(path, "wb") as f:
+            f.write(
+                packer.pack(
+                    {
+                        "format": SNAPSHOT_FORMAT,
+                        "version": SNAPSHOT_VERSION,
+                        "log_id": log_id,
+                    }
+                )
+            )
+            while True:
+                page = await self.transport.request(
+                    Command.EXPORT_LOG,
+                    {
+                        "log_id": log_id,
+                        "offset": length,
+                        "limit": SNAPSHOT_PAGE_SIZE,
+                        "max_bytes": SNAPSHOT_PAGE_BYTES,
+                    },
+                )
+                if not page["entries"]:
+                    break
+                f.write(packer.pack({"entries": page["entries"]}))
+                blobs += sum(
+                    1 for payload, _, _ in page["entries"] if parse_ref(payload)
+                )
+                length = page["next_offset"]
+
+            offset = 0
+            scheduled = 0
+            while True:
+                page = await self.transport.request(
+                    Command.EXPORT_LOG,
+                    {
+                        "log_id": log_id,
+                        "scheduled": True,
+                        "offset": offset,
+                        "limit": SNAPSHOT_PAGE_SIZE,
+                        "max_bytes": SNAPSHOT_PAGE_BYTES,
+                    },
+                )
+                if not page["entries"]:
+                    break
+                f.write(packer.pack({"scheduled": page["entries"]}))
+                blobs += sum(
+                    1 for payload, _, _ in page["entries"] if parse_ref(payload)
+                )
+                scheduled += len(page["entries"])
+                offset = page["next_offset"]
+
+            for group_id in group_ids:
+                offset = None
+                while True:
+                    limit = SNAPSHOT_PAGE_SIZE
+                    if offset is not None:
+                        limit = min(limit, length - offset)
+                    page = await self.transport.request(
+                        Command.EXPORT_GROUP,
+                        {
+                            "log_id": log_id,
+                            "group_id": group_id,
+                            "offset": offset,
+                            "limit": limit,
+                        },
+                    )
+                    f.write(
+                        packer.pack(
+                            {
+                                "group": group_id,
+                                "base_offset": min(page["base_offset"], length),
+                                "states": {
+                                    state: [mid for mid in ids if mid < length]
+                                    for state, ids in page["states"].items()
+                                },
+                                "retries": [
+                                    retry
+                                    for retry in page["retries"]
+                                    if retry[0] < length
+                                ],
+                            }
+                        )
+                    )
+                    offset = page["next_offset"]
+                    if offset >= length:
+                        break
+        return {
+            "messages": length,
+            "scheduled": scheduled,
+            "groups": len(group_ids),
+            "blobs": blobs,
+        }
+
+    async def import_snapshot(
+        self, path: str, log_id: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Loads a snapshot file written by export_snapshot() in bulk.
+
+        The messages are appended to log_id (default: the exported log),
+        which must be empty, keeping their ids; scheduled messages go back
+        into its schedule, and group states are then written straight into
+        the state store.
+        Returns {"messages": int, "scheduled": int, "groups": int}.
+        """
+        length = 0
+        scheduled = 0
+        groups = set()
+        with _open_snapshot(path, "rb") as f:
+            records = msgpack.Unpacker(f)
+            header = next(records, None)
+            if not isinstance(header, dict) or (
+                header.get("format") != SNAPSHOT_FORMAT
+            ):
+                raise ValueError(f"{path} is not a mamamia snapshot")
+            if header["version"] not in (1, SNAPSHOT_VERSION):
+                raise ValueError(
+                    f"Unsupported snapshot version {header['version']} in {path}"
+                )
+            log_id = log_id or header["log_id"]
+
+            for record in records:
+                if "entries" in record:
+                    response = await self.transport.request(
+                        Command.IMPORT_LOG,
+                        {
+                            "log_id": log_id,
+                            "offset": length,
+                            "entries": record["entries"],
+                        },
+                    )
+                    length = response["next_offset"]
+                elif "scheduled" in record:
+                    response = await self.transport.request(
+                        Command.IMPORT_LOG,
+                        {
+                            "log_id": log_id,
+                            "scheduled": True,
+                            "offset": scheduled,
+                            "entries": record["scheduled"],
+                        },
+                    )
+                    scheduled = response["next_offset"]
+                else:
+                    await self.transport.request(
+                        Command.IMPORT_GROUP,
+                        {
+                            "log_id": log_id,
+                            "group_id": record["group"],
+                            "base_offset": record["base_offset"],
+                            "states": record["states"],
+                            "retries": record["retries"],
+                        },
+                    )
+                    groups.add(record["group"])
+        return {"messages": length, "scheduled": scheduled, "groups": len(groups)}
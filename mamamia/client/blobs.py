@@ -0,0 +1,41 @@
+from typing import Any, AsyncIterator, Dict
+from mamamia.core.blobs import decode_blob, parse_ref
+from mamamia.core.protocol import Command
+from mamamia.client.transport import ITransport
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+async def iter_blob(
+    transport: ITransport, payload: Any, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Streams the bytes behind a blob reference payload, one chunk per request."""
+    ref = parse_ref(payload)
+    if ref is None:
+        raise ValueError("Payload is not a blob reference")
+    offset = 0
+    while offset < ref.size:
+        response = await transport.request(
+            Command.READ_BLOB,
+            {"digest": ref.digest, "offset": offset, "length": chunk_size},
+        )
+        data = response["data"]
+        if not data:
+            raise EOFError(f"Blob {ref.digest} ended at {offset} of {ref.size} bytes")
+        offset += len(data)
+        yield data
+
+
+async def load_payload(
+    transport: ITransport,
+    message: Dict[str, Any],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Any:
+    """Returns a message's payload, fetching it from the blob store if the
+    log only holds a reference to it."""
+    payload = message["payload"]
+    ref = parse_ref(payload)
+    if ref is None:
+        return payload
+    chunks = [chunk async for chunk in iter_blob(transport, payload, chunk_size)]
+    return decode_blob(b"".join(chunks), ref.encoding)
@@ -1,6 +1,6 @@
-import uuid
-from typing import Any, Optional, Dict, Union
-from mamamia.core.protocol import Command
+from typing import Any, AsyncIterator, List, Optional, Dict, Union
+from mamamia.core.protocol import Command, new_id
+from mamamia.client.blobs import DEFAULT_CHUNK_SIZE, iter_blob, load_payload
 from mamamia.client.transport import ITransport, TcpTransport
 
 
@@ -25,31 +25,145 @@ class ConsumerClient:
 
         self.log_id = log_id
         self.group_id = group_id
-        self.client_id = client_id or str(uuid.uuid4())
+        self.client_id = client_id or new_id()
+        # Identifies this instance's settle_and_produce requests, which are
+        # numbered so a resent one is not applied twice. Never the client id:
+        # a restarted worker reusing it would start again at sequence 0.
+        self._producer_id = new_id()
+        self._sequence = 0
+
+    async def read_payload(self, message: Dict[str, Any]) -> Any:
+        """Returns the message's payload, fetching it in chunks from the
+        server's blob store if the log holds a claim-check reference."""
+        return await load_payload(self.transport, message)
+
+    def stream_payload(
+        self, message: Dict[str, Any], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Streams the raw bytes of a claim-checked payload chunk by chunk."""
+        return iter_blob(self.transport, message["payload"], chunk_size)
 
     async def close(self):
         await self.transport.close()
 
-    async def acquire_next(self, duration: float = 30.0) -> Optional[Dict[str, Any]]:
-        response = await self.transport.request(
-            Command.ACQUIRE_NEXT,
+    async def acquire_next(
+        self, duration: float = 30.0, filter: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Leases the next available message.
+
+        `filter` restricts delivery to messages whose metadata matches, e.g.
+        {"type": "order"} or {"region": {"prefix": "eu-"}}.
+        """
+        body = {
+            "log_id": self.log_id,
+            "group_id": self.group_id,
+            "client_id": self.client_id,
+            "duration": duration,
+        }
+        if filter is not None:
+            body["filter"] = filter
+        response = await self.transport.request(Command.ACQUIRE_NEXT, body)
+        return response["message"]
+
+    async def acquire_batch(
+        self,
+        max_messages: int = 100,
+        duration: float = 30.0,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Leases up to max_messages available messages in one request."""
+        body = {
+            "log_id": self.log_id,
+            "group_id": self.group_id,
+            "client_id": self.client_id,
+            "duration": duration,
+            "max_messages": max_messages,
+        }
+        if filter is not None:
+            body["filter"] = filter
+        response = await self.transport.request(Command.ACQUIRE_BATCH, body)
+        return response["messages"]
+
+    async def settle_batch(self, settlements: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Settles many messages in one request.
+
+        Each settlement is a dict with "message_id", "success" and an optional
+        "error". Returns {"settled": count, "errors": [{"message_id", "error"}]}
+        listing the messages that could not be settled.
+        """
+        return await self.transport.request(
+            Command.SETTLE_BATCH,
             {
                 "log_id": self.log_id,
                 "group_id": self.group_id,
                 "client_id": self.client_id,
-                "duration": duration,
+                "settlements": settlements,
             },
         )
-        return response["message"]
 
-    async def settle(self, message_id: int, success: bool):
-        await self.transport.request(
-            Command.SETTLE,
+    async def settle_and_produce(
+        self,
+        settlements: List[Dict[str, Any]],
+        outputs: Dict[str, List[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Appends output messages to other logs and settles the inputs they
+        came from, in one request.
+
+        `settlements` is as for settle_batch(); `outputs` maps each target
+        log to its {"payload", "metadata", "key"} messages. Every input must
+        still be leased by this client, or nothing is appended or settled.
+        On a SQLite server the appends and settles commit together; other
+        backends check everything first but cannot undo a crash part-way.
+        Returns {"message_ids": {target log: appended ids}, "settled": count,
+        "errors": []} ("errors" is kept for older servers).
+        """
+        targets = list(outputs)
+        body = {
+            "log_id": self.log_id,
+            "group_id": self.group_id,
+            "client_id": self.client_id,
+            "settlements": settlements,
+            "outputs": [
+                {"log_id": target, "messages": outputs[target]} for target in targets
+            ],
+            "producer_id": self._producer_id,
+            "sequence": self._sequence,
+        }
+        self._sequence += 1
+        response = await self.transport.request(Command.SETTLE_AND_PRODUCE, body)
+        return {
+            "message_ids": dict(zip(targets, response["message_ids"])),
+            "settled": response["settled"],
+            "errors": response["errors"],
+        }
+
+    async def settle(
+        self, message_id: int, success: bool, error: Optional[str] = None
+    ):
+        body = {
+            "log_id": self.log_id,
+            "group_id": self.group_id,
+            "message_id": message_id,
+            "client_id": self.client_id,
+            "success": success,
+        }
+        if error is not None:
+            # Recorded in the dead-letter entry if this failure is the last one
+            body["error"] = error
+        await self.transport.request(Command.SETTLE, body)
+
+    async def settle_up_to(self, offset: int) -> Dict[str, int]:
+        """Marks every message up to and including offset that this client
+        holds as processed, in one request.
+
+        Returns {"settled": count, "base_offset": new base offset}.
+        """
+        return await self.transport.request(
+            Command.SETTLE_UP_TO,
             {
                 "log_id": self.log_id,
                 "group_id": self.group_id,
-                "message_id": message_id,
                 "client_id": self.client_id,
-                "success": success,
+                "offset": offset,
             },
         )
@@ -0,0 +1,42 @@
+import msgpack
+from typing import Any, Dict, Optional, Union
+from mamamia.core.protocol import Command, RawBody, ResyncRequiredError, ThrottledError
+from mamamia.client.transport import ITransport
+from mamamia.server.flow import QuotaBuckets
+from mamamia.server.registry import LogRegistry
+from mamamia.server.tcp import TcpFrontend
+
+
+class InProcessTransport(ITransport):
+    """Calls a frontend's command handler directly, with no socket or framing.
+
+    For clients embedded in the server process, such as tests and
+    benchmarks that want to measure the orchestrator without the network.
+    Payloads are passed by reference, so a sent payload must not be mutated
+    afterwards.
+    """
+
+    def __init__(self, frontend_or_registry: Union[TcpFrontend, LogRegistry]):
+        if isinstance(frontend_or_registry, LogRegistry):
+            self.frontend = TcpFrontend(frontend_or_registry)
+        else:
+            self.frontend = frontend_or_registry
+        # Behaves as one connection for per-connection produce quotas.
+        self._quota: Optional[QuotaBuckets] = None
+        if self.frontend.connection_quota is not None:
+            self._quota = QuotaBuckets(self.frontend.connection_quota)
+
+    async def request(self, command: Command, payload: Dict[str, Any]) -> Any:
+        body = await self.frontend.process_command(command, payload, self._quota)
+        if isinstance(body, RawBody):
+            body = msgpack.unpackb(body)
+        if isinstance(body, dict) and "error" in body:
+            if "retry_after" in body:
+                raise ThrottledError(body["error"], body["retry_after"])
+            if body.get("resync"):
+                raise ResyncRequiredError(body["error"])
+            raise Exception(body["error"])
+        return body
+
+    async def close(self):
+        pass
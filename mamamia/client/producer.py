@@ -1,10 +1,20 @@
-from typing import Any, Optional, Union
-from mamamia.core.protocol import Command
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Union
+from mamamia.core.protocol import Command, ThrottledError, new_id
 from mamamia.client.transport import ITransport, TcpTransport
 
 
 class ProducerClient:
-    def __init__(self, transport_or_addr: Union[str, ITransport], log_id: str):
+    def __init__(
+        self,
+        transport_or_addr: Union[str, ITransport],
+        log_id: str,
+        acks: str = "leader",
+        producer_id: Optional[str] = None,
+        idempotent: bool = True,
+        throttle_timeout: Optional[float] = 60.0,
+    ):
         if isinstance(transport_or_addr, str):
             if ":" in transport_or_addr:
                 host, port_str = transport_or_addr.split(":", 1)
@@ -16,13 +26,85 @@ class ProducerClient:
         else:
             self.transport = transport_or_addr
         self.log_id = log_id
+        # "leader" or "all" (also wait for a follower to apply the write)
+        self.acks = acks
+        # Each send carries (producer_id, sequence) so a resend after a
+        # connection error is recognized by the server instead of appended.
+        self.idempotent = idempotent
+        self.producer_id = producer_id or new_id()
+        self._sequence = 0
+        # How long send() keeps retrying a throttled message before raising
+        # ThrottledError; None retries indefinitely.
+        self.throttle_timeout = throttle_timeout
 
     async def close(self):
         await self.transport.close()
 
-    async def send(self, payload: Any, metadata: Optional[dict] = None) -> int:
-        response = await self.transport.request(
-            Command.PRODUCE,
-            {"log_id": self.log_id, "payload": payload, "metadata": metadata},
-        )
+    async def send(
+        self,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        delay: Optional[float] = None,
+        deliver_at: Optional[float] = None,
+        key: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> Optional[int]:
+        """Sends a message and returns its id.
+
+        With `delay` (seconds) or `deliver_at` (Unix timestamp) the message is
+        held by the server until due, and None is returned since its id is
+        only assigned on delivery. Messages sharing an ordering `key` are
+        delivered one at a time, in order, within each consumer group. A
+        message not processed within `ttl` seconds of becoming due expires.
+        """
+        body = {"log_id": self.log_id, "payload": payload, "metadata": metadata}
+        if delay is not None:
+            body["delay"] = delay
+        if deliver_at is not None:
+            body["deliver_at"] = deliver_at
+        if key is not None:
+            body["key"] = key
+        if ttl is not None:
+            body["ttl"] = ttl
+        if self.idempotent:
+            body["producer_id"] = self.producer_id
+            body["sequence"] = self._sequence
+            self._sequence += 1
+        if self.acks != "leader":
+            body["acks"] = self.acks
+        response = await self._request_with_backoff(Command.PRODUCE, body)
         return response["message_id"]
+
+    async def send_batch(
+        self, messages: List[Dict[str, Any]], ttl: Optional[float] = None
+    ) -> List[int]:
+        """Sends many messages in one request and returns their ids.
+
+        Each message is a dict with "payload" and optional "metadata" and
+        "key". The batch is appended in order and retried as a unit. `ttl`
+        applies to every message.
+        """
+        body: Dict[str, Any] = {"log_id": self.log_id, "messages": messages}
+        if ttl is not None:
+            body["ttl"] = ttl
+        if self.idempotent:
+            body["producer_id"] = self.producer_id
+            body["sequence"] = self._sequence
+            self._sequence += 1
+        if self.acks != "leader":
+            body["acks"] = self.acks
+        response = await self._request_with_backoff(Command.PRODUCE_BATCH, body)
+        return response["message_ids"]
+
+    async def _request_with_backoff(self, command: Command, body: dict) -> dict:
+        """Sends a produce, sleeping out throttle responses as the server asks."""
+        deadline = None
+        if self.throttle_timeout is not None:
+            deadline = time.monotonic() + self.throttle_timeout
+        while True:
+            try:
+                return await self.transport.request(command, body)
+            except ThrottledError as e:
+                if deadline is not None and time.monotonic() + e.retry_after > deadline:
+                    raise
+                await asyncio.sleep(e.retry_after)
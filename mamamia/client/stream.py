@@ -0,0 +1,123 @@
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+from mamamia.core.protocol import Command
+from mamamia.client.blobs import DEFAULT_CHUNK_SIZE, iter_blob, load_payload
+from mamamia.client.transport import ITransport, TcpTransport
+
+
+class StreamConsumerClient:
+    """Reads a log in order from a committed cursor, without leases.
+
+    Suited to analytics or replication consumers that process everything in
+    order: there is no per-message acquire or settle, only a periodic
+    COMMIT_OFFSET. Delivery is at-least-once from the last committed offset.
+    """
+
+    def __init__(
+        self,
+        transport_or_addr: Union[str, ITransport],
+        log_id: str,
+        group_id: str,
+        batch_size: int = 1000,
+        max_bytes: int = 1024 * 1024,
+        wait: float = 5.0,
+        commit_interval: float = 1.0,
+    ):
+        if isinstance(transport_or_addr, str):
+            if ":" in transport_or_addr:
+                host, port_str = transport_or_addr.split(":", 1)
+                port = int(port_str)
+            else:
+                host = transport_or_addr
+                port = 9000
+            self.transport = TcpTransport(host, port)
+        else:
+            self.transport = transport_or_addr
+
+        self.log_id = log_id
+        self.group_id = group_id
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.wait = wait
+        self.commit_interval = commit_interval
+        # Next offset to read; None until the committed cursor is fetched.
+        self.offset: Optional[int] = None
+        # Offset after the last message handed to the caller, which is what
+        # close() and commit() save. Behind `offset` while messages() is
+        # part way through a batch.
+        self.position: Optional[int] = None
+        self._committed: Optional[int] = None
+        self._last_commit = time.monotonic()
+
+    async def read_payload(self, message: Dict[str, Any]) -> Any:
+        """Returns the message's payload, fetching it in chunks from the
+        server's blob store if the log holds a claim-check reference."""
+        return await load_payload(self.transport, message)
+
+    def stream_payload(
+        self, message: Dict[str, Any], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Streams the raw bytes of a claim-checked payload chunk by chunk."""
+        return iter_blob(self.transport, message["payload"], chunk_size)
+
+    async def close(self):
+        if self.position is not None and self.position != self._committed:
+            await self.commit()
+        await self.transport.close()
+
+    async def fetch(self) -> List[Dict[str, Any]]:
+        """Returns the next batch, waiting up to `wait` seconds if at the head."""
+        batch = await self._fetch()
+        self.position = self.offset
+        return batch
+
+    async def _fetch(self) -> List[Dict[str, Any]]:
+        response = await self.transport.request(
+            Command.READ_RANGE,
+            {
+                "log_id": self.log_id,
+                "group_id": self.group_id,
+                "offset": self.offset,
+                "limit": self.batch_size,
+                "max_bytes": self.max_bytes,
+                "wait": self.wait,
+            },
+        )
+        if self._committed is None and self.offset is None:
+            self._committed = response["next_offset"] - len(response["messages"])
+        self.offset = response["next_offset"]
+        return response["messages"]
+
+    async def commit(self, offset: Optional[int] = None):
+        """Commits `offset` (default: everything handed out so far)."""
+        if offset is None:
+            offset = self.position
+        if offset is None:
+            return
+        await self.transport.request(
+            Command.COMMIT_OFFSET,
+            {"log_id": self.log_id, "group_id": self.group_id, "offset": offset},
+        )
+        self._committed = offset
+        self._last_commit = time.monotonic()
+
+    def seek(self, offset: int):
+        self.offset = offset
+        self.position = offset
+
+    async def messages(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yields messages forever, committing at most every commit_interval.
+
+        A message's offset is committed periodically only after the consumer
+        asks for the next one, i.e. once it has been handled. close() commits
+        up to the last message yielded.
+        """
+        while True:
+            batch = await self._fetch()
+            for message in batch:
+                self.position = message["id"] + 1
+                yield message
+                if time.monotonic() - self._last_commit >= self.commit_interval:
+                    await self.commit(message["id"] + 1)
+            # Also covers ids a filtered read skipped past
+            self.position = self.offset
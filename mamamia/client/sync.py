@@ -0,0 +1,382 @@
+import select
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+from mamamia.core.blobs import decode_blob, parse_ref
+from mamamia.core.protocol import (
+    Command,
+    ThrottledError,
+    new_id,
+    pack_message,
+    unpack_frame,
+    unpack_length,
+)
+from mamamia.core.compression import (
+    Codec,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    available_codecs,
+    get_codec,
+)
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.codec: Optional[Codec] = None
+        self.last_used = time.monotonic()
+
+    def recv_exactly(self, n: int) -> bytes:
+        chunks = []
+        while n:
+            chunk = self.sock.recv(n)
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b"".join(chunks)
+
+    def roundtrip(
+        self, command: Command, payload: Dict[str, Any], threshold: int
+    ) -> Any:
+        self.sock.sendall(pack_message(command, payload, self.codec, threshold))
+        length = unpack_length(self.recv_exactly(4))
+        _, cmd, body = unpack_frame(self.recv_exactly(length), self.codec)
+        if cmd != command:
+            raise ValueError(f"Expected command {command}, got {cmd}")
+        self.last_used = time.monotonic()
+        return body
+
+    def is_alive(self) -> bool:
+        """An idle connection should have nothing to read; if it is readable
+        the server closed it (or sent something unexpected)."""
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """A thread-safe pool of blocking connections to one server.
+
+    Each request borrows a connection for one round trip, so any number of
+    threads can share a pool; at most `max_size` requests run at once and
+    the rest wait up to `timeout` for a free connection. Idle connections
+    are reused most-recently-used first, dropped after `max_idle` seconds,
+    and checked for a server-side close before reuse once they have been
+    idle for `health_check_interval` seconds. Sockets use TCP keepalive.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_size: int = 8,
+        timeout: float = 60.0,
+        compression: bool = True,
+        compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+        max_idle: float = 300.0,
+        health_check_interval: float = 5.0,
+    ):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.timeout = timeout
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._idle: Deque[_Connection] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closed = False
+
+    def _connect(self) -> _Connection:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        conn = _Connection(sock)
+        if self.compression:
+            try:
+                body = conn.roundtrip(
+                    Command.HANDSHAKE,
+                    {"codecs": available_codecs()},
+                    self.compression_threshold,
+                )
+            except BaseException:
+                conn.close()
+                raise
+            if isinstance(body, dict) and "error" in body:
+                conn.close()
+                raise Exception(body["error"])
+            conn.codec = get_codec(body.get("codec"))
+        return conn
+
+    def _checkout(self) -> _Connection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Timed out waiting for a pooled connection")
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                idle = time.monotonic() - conn.last_used
+                if idle > self.max_idle or (
+                    idle > self.health_check_interval and not conn.is_alive()
+                ):
+                    conn.close()
+                    continue
+                return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn: Optional[_Connection]):
+        if conn is not None:
+            with self._lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.append(conn)
+        self._slots.release()
+
+    def request(self, command: Command, payload: Dict[str, Any]) -> Any:
+        conn: Optional[_Connection] = self._checkout()
+        try:
+            try:
+                body = conn.roundtrip(command, payload, self.compression_threshold)  # type: ignore[union-attr]
+            except socket.timeout:
+                # The request may still be running on the server
+                raise
+            except (ConnectionError, OSError):
+                # The server may have dropped an idle connection; retry once
+                conn.close()  # type: ignore[union-attr]
+                conn = None
+                conn = self._connect()
+                body = conn.roundtrip(command, payload, self.compression_threshold)
+        except BaseException:
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            self._checkin(conn)
+
+        if isinstance(body, dict) and "error" in body:
+            if "retry_after" in body:
+                raise ThrottledError(body["error"], body["retry_after"])
+            raise Exception(body["error"])
+        return body
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+        for conn in idle:
+            conn.close()
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SyncProducerClient:
+    """Blocking counterpart of ProducerClient; safe to share across threads."""
+
+    def __init__(
+        self,
+        pool_or_addr: Union[str, ConnectionPool],
+        log_id: str,
+        acks: str = "leader",
+        producer_id: Optional[str] = None,
+        idempotent: bool = True,
+        throttle_timeout: Optional[float] = 60.0,
+    ):
+        if isinstance(pool_or_addr, str):
+            if ":" in pool_or_addr:
+                host, port_str = pool_or_addr.split(":", 1)
+                port = int(port_str)
+            else:
+                host = pool_or_addr
+                port = 9000
+            self.pool = ConnectionPool(host, port)
+        else:
+            self.pool = pool_or_addr
+        self.log_id = log_id
+        self.acks = acks
+        self.idempotent = idempotent
+        self.producer_id = producer_id or new_id()
+        self.throttle_timeout = throttle_timeout
+        self._sequence = 0
+        self._sequence_lock = threading.Lock()
+
+    def close(self):
+        self.pool.close()
+
+    def _next_sequence(self) -> int:
+        with self._sequence_lock:
+            sequence = self._sequence
+            self._sequence += 1
+            return sequence
+
+    def send(
+        self,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        delay: Optional[float] = None,
+        deliver_at: Optional[float] = None,
+        key: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> Optional[int]:
+        """Sends a message and returns its id (None for a delayed message)."""
+        body: Dict[str, Any] = {
+            "log_id": self.log_id,
+            "payload": payload,
+            "metadata": metadata,
+        }
+        if delay is not None:
+            body["delay"] = delay
+        if deliver_at is not None:
+            body["deliver_at"] = deliver_at
+        if key is not None:
+            body["key"] = key
+        if ttl is not None:
+            body["ttl"] = ttl
+        return self._produce(Command.PRODUCE, body)["message_id"]
+
+    def send_batch(
+        self, messages: List[Dict[str, Any]], ttl: Optional[float] = None
+    ) -> List[int]:
+        """Sends many {"payload", "metadata", "key"} messages in one request."""
+        body: Dict[str, Any] = {"log_id": self.log_id, "messages": messages}
+        if ttl is not None:
+            body["ttl"] = ttl
+        return self._produce(Command.PRODUCE_BATCH, body)["message_ids"]
+
+    def _produce(self, command: Command, body: Dict[str, Any]) -> dict:
+        if self.idempotent:
+            body["producer_id"] = self.producer_id
+            body["sequence"] = self._next_sequence()
+        if self.acks != "leader":
+            body["acks"] = self.acks
+        deadline = None
+        if self.throttle_timeout is not None:
+            deadline = time.monotonic() + self.throttle_timeout
+        while True:
+            try:
+                return self.pool.request(command, body)
+            except ThrottledError as e:
+                if deadline is not None and time.monotonic() + e.retry_after > deadline:
+                    raise
+                time.sleep(e.retry_after)
+
+
+class SyncConsumerClient:
+    """Blocking counterpart of ConsumerClient; safe to share across threads."""
+
+    def __init__(
+        self,
+        pool_or_addr: Union[str, ConnectionPool],
+        log_id: str,
+        group_id: str,
+        client_id: Optional[str] = None,
+    ):
+        if isinstance(pool_or_addr, str):
+            if ":" in pool_or_addr:
+                host, port_str = pool_or_addr.split(":", 1)
+                port = int(port_str)
+            else:
+                host = pool_or_addr
+                port = 9000
+            self.pool = ConnectionPool(host, port)
+        else:
+            self.pool = pool_or_addr
+        self.log_id = log_id
+        self.group_id = group_id
+        self.client_id = client_id or new_id()
+
+    def close(self):
+        self.pool.close()
+
+    def _body(self, **fields: Any) -> Dict[str, Any]:
+        body = {
+            "log_id": self.log_id,
+            "group_id": self.group_id,
+            "client_id": self.client_id,
+        }
+        body.update(fields)
+        return body
+
+    def acquire_next(
+        self, duration: float = 30.0, filter: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        body = self._body(duration=duration)
+        if filter is not None:
+            body["filter"] = filter
+        return self.pool.request(Command.ACQUIRE_NEXT, body)["message"]
+
+    def acquire_batch(
+        self,
+        max_messages: int = 100,
+        duration: float = 30.0,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        body = self._body(duration=duration, max_messages=max_messages)
+        if filter is not None:
+            body["filter"] = filter
+        return self.pool.request(Command.ACQUIRE_BATCH, body)["messages"]
+
+    def settle(self, message_id: int, success: bool, error: Optional[str] = None):
+        body = self._body(message_id=message_id, success=success)
+        if error is not None:
+            body["error"] = error
+        self.pool.request(Command.SETTLE, body)
+
+    def settle_batch(self, settlements: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Settles many {"message_id", "success", "error"} outcomes at once."""
+        return self.pool.request(
+            Command.SETTLE_BATCH, self._body(settlements=settlements)
+        )
+
+    def settle_up_to(self, offset: int) -> Dict[str, int]:
+        return self.pool.request(Command.SETTLE_UP_TO, self._body(offset=offset))
+
+    def read_payload(self, message: Dict[str, Any]) -> Any:
+        """Returns the payload, fetching a claim-checked one from the server."""
+        ref = parse_ref(message["payload"])
+        if ref is None:
+            return message["payload"]
+        return decode_blob(b"".join(self.stream_payload(message)), ref.encoding)
+
+    def stream_payload(
+        self, message: Dict[str, Any], chunk_size: int = 1024 * 1024
+    ) -> Iterator[bytes]:
+        """Yields the raw bytes of a claim-checked payload chunk by chunk."""
+        ref = parse_ref(message["payload"])
+        if ref is None:
+            raise ValueError("Payload is not a blob reference")
+        offset = 0
+        while offset < ref.size:
+            data = self.pool.request(
+                Command.READ_BLOB,
+                {"digest": ref.digest, "offset": offset, "length": chunk_size},
+            )["data"]
+            if not data:
+                raise EOFError(
+                    f"Blob {ref.digest} ended at {offset} of {ref.size} bytes"
+                )
+            offset += len(data)
+            yield data
@@ -2,8 +2,20 @@ import asyncio
 import struct
 import msgpack
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
-from mamamia.core.protocol import Command, pack_message, read_message
+from typing import Any, Dict, Optional, Tuple
+from mamamia.core.protocol import (
+    Command,
+    ResyncRequiredError,
+    ThrottledError,
+    pack_message,
+    read_message,
+)
+from mamamia.core.compression import (
+    Codec,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    available_codecs,
+    get_codec,
+)
 
 
 class ITransport(ABC):
@@ -17,19 +29,54 @@ class ITransport(ABC):
 
 
 class TcpTransport(ITransport):
-    def __init__(self, host: str, port: int, timeout: float = 60.0):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        timeout: float = 60.0,
+        compression: bool = True,
+        compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+    ):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.compression = compression
+        self.compression_threshold = compression_threshold
         self._reader: Optional[asyncio.StreamReader] = None
         self._writer: Optional[asyncio.StreamWriter] = None
+        self._codec: Optional[Codec] = None
         self._lock = asyncio.Lock()
 
+    async def _open_connection(
+        self,
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_connection(self.host, self.port)
+
     async def _ensure_connected(self):
         if self._writer is None or self._reader is None:
             self._reader, self._writer = await asyncio.wait_for(
-                asyncio.open_connection(self.host, self.port), timeout=self.timeout
+                self._open_connection(), timeout=self.timeout
             )
+            self._codec = None
+            if self.compression:
+                await self._handshake()
+
+    async def _handshake(self):
+        writer: asyncio.StreamWriter = self._writer  # type: ignore
+        reader: asyncio.StreamReader = self._reader  # type: ignore
+
+        writer.write(
+            pack_message(Command.HANDSHAKE, {"codecs": available_codecs()})
+        )
+        await writer.drain()
+        version, cmd, body = await asyncio.wait_for(
+            read_message(reader), timeout=self.timeout
+        )
+        if cmd != Command.HANDSHAKE:
+            raise ValueError(f"Expected command {Command.HANDSHAKE}, got {cmd}")
+        if isinstance(body, dict) and "error" in body:
+            raise Exception(body["error"])
+        self._codec = get_codec(body.get("codec"))
 
     async def _send_and_receive(self, command: Command, payload: Dict[str, Any]) -> Any:
         await self._ensure_connected()
@@ -38,18 +85,24 @@ class TcpTransport(ITransport):
         writer: asyncio.StreamWriter = self._writer  # type: ignore
         reader: asyncio.StreamReader = self._reader  # type: ignore
 
-        data = pack_message(command, payload)
+        data = pack_message(
+            command, payload, self._codec, self.compression_threshold
+        )
         writer.write(data)
         await writer.drain()
 
         version, cmd, body = await asyncio.wait_for(
-            read_message(reader), timeout=self.timeout
+            read_message(reader, self._codec), timeout=self.timeout
         )
 
         if cmd != command:
             raise ValueError(f"Expected command {command}, got {cmd}")
 
         if isinstance(body, dict) and "error" in body:
+            if "retry_after" in body:
+                raise ThrottledError(body["error"], body["retry_after"])
+            if body.get("resync"):
+                raise ResyncRequiredError(body["error"])
             raise Exception(body["error"])
         return body
 
@@ -79,3 +132,28 @@ class TcpTransport(ITransport):
                     pass
                 self._writer = None
                 self._reader = None
+
+
+class UnixTransport(TcpTransport):
+    """The binary protocol over a Unix domain socket, for clients on the
+    same host as the server (see `--unix-socket`).
+
+    Compression is off by default: a local socket is not bandwidth-bound.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        timeout: float = 60.0,
+        compression: bool = False,
+        compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+    ):
+        super().__init__(
+            "localhost", 0, timeout, compression, compression_threshold
+        )
+        self.path = path
+
+    async def _open_connection(
+        self,
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_unix_connection(self.path)
@@ -0,0 +1,35 @@
+import msgpack
+from typing import Any, NamedTuple, Optional
+
+# msgpack extension type code marking a claim-check reference in place of a
+# payload. The payload itself lives in the server's blob store.
+BLOB_EXT_CODE = 1
+
+# How a blob's bytes map back to the payload: "raw" blobs are the payload
+# bytes themselves, "msgpack" blobs are the msgpack encoding of any payload.
+RAW = "raw"
+MSGPACK = "msgpack"
+
+
+class BlobRef(NamedTuple):
+    digest: str  # sha256 hex of the blob's bytes
+    size: int
+    encoding: str
+
+
+def make_ref(digest: str, size: int, encoding: str) -> msgpack.ExtType:
+    return msgpack.ExtType(BLOB_EXT_CODE, msgpack.packb([digest, size, encoding]))
+
+
+def parse_ref(payload: Any) -> Optional[BlobRef]:
+    """Returns the BlobRef if payload is a claim-check reference, else None."""
+    if isinstance(payload, msgpack.ExtType) and payload.code == BLOB_EXT_CODE:
+        return BlobRef(*msgpack.unpackb(payload.data))
+    return None
+
+
+def decode_blob(data: bytes, encoding: str) -> Any:
+    """Turns a blob's bytes back into the original payload."""
+    if encoding == RAW:
+        return data
+    return msgpack.unpackb(data)
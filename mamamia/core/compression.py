@@ -0,0 +1,105 @@
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Frames smaller than this are sent as-is; compressing them costs more CPU
+# than it saves on the wire.
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+
+class Codec:
+    """A compression codec.
+
+    `decompress(data, limit)` must return at most limit + 1 bytes however
+    far the data would expand, so an oversized frame is rejected without
+    inflating all of it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        compress: Callable[[bytes], bytes],
+        decompress: Callable[[bytes, int], bytes],
+    ):
+        self.name = name
+        self.compress = compress
+        self._decompress = decompress
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        """Decompresses data, raising ValueError if it expands past limit bytes."""
+        output = self._decompress(data, limit)
+        if len(output) > limit:
+            raise ValueError(f"Decompressed size exceeds limit {limit}")
+        return output
+
+
+# name -> Codec, in order of preference (best first).
+CODECS: Dict[str, Codec] = {}
+
+try:
+    import zstandard
+
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+    def _zstd_decompress(data: bytes, limit: int) -> bytes:
+        # A size declared in the frame header is allocated up front
+        if zstandard.frame_content_size(data) > limit:
+            raise ValueError(f"Decompressed size exceeds limit {limit}")
+        try:
+            return _zstd_decompressor.decompress(data, max_output_size=limit + 1)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd frame: {e}") from None
+
+    CODECS["zstd"] = Codec("zstd", _zstd_compressor.compress, _zstd_decompress)
+except ImportError:
+    pass
+
+try:
+    import lz4.frame
+
+    def _lz4_decompress(data: bytes, limit: int) -> bytes:
+        return lz4.frame.LZ4FrameDecompressor().decompress(data, max_length=limit + 1)
+
+    CODECS["lz4"] = Codec("lz4", lz4.frame.compress, _lz4_decompress)
+except ImportError:
+    pass
+
+
+def _zlib_decompress(data: bytes, limit: int) -> bytes:
+    d = zlib.decompressobj()
+    try:
+        output = d.decompress(data, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f"Invalid zlib frame: {e}") from None
+    if len(output) > limit:
+        return output
+    # Within the limit, the stream must end exactly where the data does
+    if not d.eof:
+        raise ValueError("Truncated zlib frame")
+    if d.unused_data or d.unconsumed_tail:
+        raise ValueError("Trailing data after zlib frame")
+    return output
+
+
+CODECS["zlib"] = Codec("zlib", lambda data: zlib.compress(data, 6), _zlib_decompress)
+
+
+def available_codecs() -> List[str]:
+    """Returns the names of the codecs usable in this process, best first."""
+    return list(CODECS)
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    if name is None:
+        return None
+    if name not in CODECS:
+        raise ValueError(f"Unsupported compression codec: {name}")
+    return CODECS[name]
+
+
+def negotiate(offered: Iterable[str]) -> Optional[str]:
+    """Picks the first offered codec that is also available locally."""
+    for name in offered:
+        if name in CODECS:
+            return name
+    return None
@@ -0,0 +1,40 @@
+from typing import Any, Dict, Optional
+
+# A metadata filter maps field names to conditions, all of which must hold:
+#   {"type": "order"}                  equality
+#   {"region": {"prefix": "eu-"}}      string prefix
+MetadataFilter = Dict[str, Any]
+
+INDEXABLE_TYPES = (str, int, float, bool)
+
+
+def is_prefix(condition: Any) -> bool:
+    return isinstance(condition, dict) and "prefix" in condition
+
+
+def validate(filters: MetadataFilter):
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError("Filter must be a non-empty mapping of field to condition")
+    for field, condition in filters.items():
+        if not isinstance(field, str):
+            raise ValueError(f"Filter field must be a string, got {field!r}")
+        if is_prefix(condition):
+            if not isinstance(condition["prefix"], str):
+                raise ValueError(f"Prefix for {field!r} must be a string")
+        elif not isinstance(condition, INDEXABLE_TYPES):
+            raise ValueError(f"Unsupported condition for {field!r}: {condition!r}")
+
+
+def matches(metadata: Optional[dict], filters: MetadataFilter) -> bool:
+    if not metadata:
+        return False
+    for field, condition in filters.items():
+        if field not in metadata:
+            return False
+        value = metadata[field]
+        if is_prefix(condition):
+            if not isinstance(value, str) or not value.startswith(condition["prefix"]):
+                return False
+        elif value != condition or type(value) is not type(condition):
+            return False
+    return True
@@ -1,16 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Any, Dict
+from typing import List, Optional, Any, Dict, Tuple
+from .filters import MetadataFilter
 from .models import Message, MessageState, Lease
 
+# (payload, metadata, ordering key) for bulk appends.
+Entry = Tuple[Any, Optional[dict], Optional[str]]
+
 
 class IMessageStorage(ABC):
     @abstractmethod
     async def append(
-        self, log_id: str, payload: Any, metadata: Optional[dict] = None
+        self,
+        log_id: str,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        key: Optional[str] = None,
     ) -> int:
         """Appends a message and returns its unique index."""
         pass
 
+    @abstractmethod
+    async def append_batch(self, log_id: str, entries: List[Entry]) -> List[int]:
+        """Appends (payload, metadata, key) entries in order and returns their indices."""
+        pass
+
     @abstractmethod
     async def get_batch(
         self, log_id: str, start_index: int, limit: int
@@ -18,6 +31,19 @@ class IMessageStorage(ABC):
         """Retrieves a batch of messages starting from start_index."""
         pass
 
+    @abstractmethod
+    async def get_batch_filtered(
+        self, log_id: str, start_index: int, limit: int, filters: MetadataFilter
+    ) -> List[Message]:
+        """Retrieves up to limit messages at or after start_index whose
+        metadata matches filters, without scanning non-matching ones."""
+        pass
+
+    @abstractmethod
+    async def get_length(self, log_id: str) -> int:
+        """Returns the number of messages in the log, i.e. the next index."""
+        pass
+
 
 class IStateStore(ABC):
     @abstractmethod
@@ -46,16 +72,50 @@ class IStateStore(ABC):
     ):
         pass
 
+    @abstractmethod
+    async def set_message_states(
+        self,
+        log_id: str,
+        group_id: str,
+        message_ids: List[int],
+        state: MessageState,
+    ) -> List[int]:
+        """Sets the same state on many messages at once. Returns the ids the
+        store could not take (only a store with a bounded window of ids
+        refuses any); their states are left unchanged."""
+        pass
+
+    @abstractmethod
+    async def count_states(self, log_id: str, group_id: str) -> Dict[MessageState, int]:
+        """Counts the group's messages by stored state. Messages with no
+        stored state (PENDING by default) are not included."""
+        pass
+
     @abstractmethod
     async def get_retry_count(self, log_id: str, group_id: str, message_id: int) -> int:
         pass
 
+    @abstractmethod
+    async def get_retry_counts(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, int]:
+        """Returns the retry counts of many messages at once, leaving out
+        those never retried."""
+        pass
+
     @abstractmethod
     async def increment_retry_count(
         self, log_id: str, group_id: str, message_id: int
     ) -> int:
         pass
 
+    @abstractmethod
+    async def set_retry_counts(
+        self, log_id: str, group_id: str, counts: Dict[int, int]
+    ):
+        """Overwrites the retry counts of many messages at once."""
+        pass
+
 
 class ILeaseManager(ABC):
     @abstractmethod
@@ -74,6 +134,11 @@ class ILeaseManager(ABC):
     async def release(self, log_id: str, group_id: str, message_id: int):
         pass
 
+    @abstractmethod
+    async def release_batch(self, log_id: str, group_id: str, message_ids: List[int]):
+        """Releases many leases at once."""
+        pass
+
     @abstractmethod
     async def get_lease(
         self, log_id: str, group_id: str, message_id: int
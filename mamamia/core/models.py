@@ -1,3 +1,4 @@
+import random
 from enum import Enum
 from pydantic import BaseModel
 from typing import Optional, Any
@@ -9,6 +10,7 @@ class MessageState(str, Enum):
     PROCESSED = "processed"
     FAILED = "failed"
     DEAD = "dead"
+    EXPIRED = "expired"  # Outlived its TTL before being processed
 
 
 class Message(BaseModel):
@@ -16,8 +18,46 @@ class Message(BaseModel):
     log_id: str
     payload: Any
     metadata: Optional[dict] = None
+    key: Optional[str] = None  # Ordering key
 
 
 class Lease(BaseModel):
     owner_id: str
     expiry: float  # Unix timestamp
+
+
+class RetryPolicy(BaseModel):
+    max_retries: int = 3
+    base_delay: float = 1.0  # Seconds before the first retry
+    multiplier: float = 2.0
+    max_delay: float = 300.0
+    jitter: float = 0.1  # Fraction of the delay randomized in either direction
+
+    def backoff(self, retries: int) -> float:
+        """Returns how long a message stays invisible after its Nth failure."""
+        if self.base_delay <= 0:
+            return 0.0
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (retries - 1))
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+
+class ProduceQuota(BaseModel):
+    """Token-bucket limits on produce throughput. None leaves a dimension
+    unlimited."""
+
+    messages_per_second: Optional[float] = None
+    bytes_per_second: Optional[float] = None
+    burst: float = 1.0  # Seconds of quota that can be saved up
+
+
+class LogLimits(BaseModel):
+    """Flow-control limits for producers writing to one log."""
+
+    quota: ProduceQuota = ProduceQuota()
+    # Messages not yet settled by the slowest consumer group (or, with no
+    # groups, every message in the log), including scheduled ones.
+    max_buffered_messages: Optional[int] = None
+    max_buffered_bytes: Optional[int] = None  # Estimated from average size
+    max_inflight: Optional[int] = None  # Concurrent produce requests
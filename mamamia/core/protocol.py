@@ -1,26 +1,93 @@
 import msgpack
+import os
 import struct
-import asyncio
 from enum import IntEnum
-from typing import Any, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+from mamamia.core.compression import Codec, DEFAULT_COMPRESSION_THRESHOLD
+
+if TYPE_CHECKING:
+    # Only for annotations: the blocking client never loads asyncio
+    import asyncio
 
 
 class Command(IntEnum):
     PRODUCE = 1
     ACQUIRE_NEXT = 2
     SETTLE = 3
+    HANDSHAKE = 4
+    READ_DLQ = 5
+    REPLAY_DLQ = 6
+    REPLICATE = 7
+    PROMOTE = 8
+    READ_RANGE = 9
+    COMMIT_OFFSET = 10
+    SETTLE_UP_TO = 11
+    STATS = 12
+    PRODUCE_BATCH = 13
+    ACQUIRE_BATCH = 14
+    SETTLE_BATCH = 15
+    READ_BLOB = 16
+    SETTLE_AND_PRODUCE = 17
+    EXPORT_LOG = 18
+    EXPORT_GROUP = 19
+    IMPORT_LOG = 20
+    IMPORT_GROUP = 21
 
 
 MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # 10MB limit
 
+PROTOCOL_VERSION = 1
+# High bit of the version byte marks a body compressed with the
+# connection's negotiated codec.
+FLAG_COMPRESSED = 0x80
+VERSION_MASK = 0x7F
+
+
+class RawBody(bytes):
+    """A body that is already msgpack-encoded and is sent verbatim."""
+
+
+class ResyncRequiredError(Exception):
+    """A replication follower's position is not in the leader's feed.
+
+    Sent as an error response with `resync` set. The follower has to be
+    rebuilt from scratch rather than retry.
+    """
+
+
+class ThrottledError(Exception):
+    """The server refused a request under flow control.
+
+    Sent as an error response with a `retry_after` hint in seconds.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
 
-def pack_message(command: int, body: Any) -> bytes:
-    """Pack a message into [length(4)][version(1)][command(1)][msgpack_body]."""
-    packed_body = msgpack.packb(body)
+
+def pack_message(
+    command: int,
+    body: Any,
+    codec: Optional[Codec] = None,
+    threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+) -> bytes:
+    """Pack a message into [length(4)][version(1)][command(1)][msgpack_body].
+
+    If a codec is given and the packed body is at least `threshold` bytes,
+    the body is compressed and the compressed flag is set on the version byte.
+    """
+    packed_body = body if isinstance(body, RawBody) else msgpack.packb(body)
     if not isinstance(packed_body, bytes):
         raise TypeError("msgpack.packb did not return bytes")
 
-    version = 1
+    version = PROTOCOL_VERSION
+    if codec is not None and len(packed_body) >= threshold:
+        compressed = codec.compress(packed_body)
+        if len(compressed) < len(packed_body):
+            packed_body = compressed
+            version |= FLAG_COMPRESSED
+
     # header: version(1) + command(1)
     header = struct.pack("!BB", version, command)
     full_body = header + packed_body
@@ -28,15 +95,42 @@ def pack_message(command: int, body: Any) -> bytes:
     return struct.pack("!I", length) + full_body
 
 
-async def read_message(reader: asyncio.StreamReader) -> Tuple[int, int, Any]:
+async def read_message(
+    reader: "asyncio.StreamReader", codec: Optional[Codec] = None
+) -> Tuple[int, int, Any]:
     """Read a message from an asyncio reader."""
-    length_bytes = await reader.readexactly(4)
-    length = struct.unpack("!I", length_bytes)[0]
+    length = unpack_length(await reader.readexactly(4))
+    return unpack_frame(await reader.readexactly(length), codec)
+
 
+def unpack_length(length_bytes: bytes) -> int:
+    """Decodes and checks a frame's 4-byte length prefix."""
+    length = struct.unpack("!I", length_bytes)[0]
     if length > MAX_MESSAGE_SIZE:
         raise ValueError(f"Message size {length} exceeds limit {MAX_MESSAGE_SIZE}")
+    return length
+
 
-    data = await reader.readexactly(length)
+def unpack_frame(data: bytes, codec: Optional[Codec] = None) -> Tuple[int, int, Any]:
+    """Decodes the part of a frame after its length prefix."""
     version, command = struct.unpack("!BB", data[:2])
-    body = msgpack.unpackb(data[2:])
-    return version, command, body
+    packed_body = data[2:]
+    if version & FLAG_COMPRESSED:
+        if codec is None:
+            raise ValueError("Received compressed frame without a negotiated codec")
+        packed_body = codec.decompress(packed_body, MAX_MESSAGE_SIZE)
+    body = msgpack.unpackb(packed_body)
+    return version & VERSION_MASK, command, body
+
+
+def new_id() -> str:
+    """Returns a random UUID4 string for client and producer ids.
+
+    Built from os.urandom because importing uuid loads platform, a
+    noticeable share of a short-lived client's start-up time.
+    """
+    b = bytearray(os.urandom(16))
+    b[6] = b[6] & 0x0F | 0x40  # version 4
+    b[8] = b[8] & 0x3F | 0x80  # RFC 4122 variant
+    h = b.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import msgpack
+from typing import Any
+from mamamia.core.blobs import MSGPACK, RAW, make_ref
+
+DEFAULT_BLOB_THRESHOLD = 256 * 1024
+
+
+class BlobStore:
+    """Content-addressed payload files for claim-check storage.
+
+    Payloads of at least `threshold` bytes are written to
+    <root>/<first two hex digits>/<sha256> and replaced in the log by a small
+    reference, so the log stays small and large payloads are only read when
+    a consumer asks for them, in chunks. Identical payloads share one file.
+    Blobs are never deleted, matching the append-only log.
+    """
+
+    def __init__(self, root: str, threshold: int = DEFAULT_BLOB_THRESHOLD):
+        self.root = root
+        self.threshold = threshold
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob digest {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    async def spill(self, payload: Any) -> Any:
+        """Returns payload unchanged if it is small, else a blob reference."""
+        if isinstance(payload, (bytes, bytearray)):
+            if len(payload) < self.threshold:
+                return payload
+            data, encoding = bytes(payload), RAW
+        elif isinstance(payload, (str, dict, list)):
+            # A str encodes to at most 4 bytes per character
+            if isinstance(payload, str) and len(payload) * 4 < self.threshold:
+                return payload
+            data, encoding = msgpack.packb(payload), MSGPACK
+            if len(data) < self.threshold:
+                return payload
+        else:
+            return payload
+
+        digest = await asyncio.get_running_loop().run_in_executor(
+            None, self._write, data
+        )
+        return make_ref(digest, len(data), encoding)
+
+    def _write(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    async def read(self, digest: str, offset: int, length: int) -> bytes:
+        """Reads up to length bytes of a blob starting at offset."""
+        path = self._path(digest)
+
+        def read_chunk() -> bytes:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, read_chunk
+            )
+        except FileNotFoundError:
+            raise KeyError(f"Unknown blob {digest}") from None
+
+    def size(self, digest: str) -> int:
+        try:
+            return os.path.getsize(self._path(digest))
+        except FileNotFoundError:
+            raise KeyError(f"Unknown blob {digest}") from None
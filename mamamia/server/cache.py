@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+# Default budget for encoded messages kept by FrameCache.
+DEFAULT_FRAME_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class FrameCache:
+    """LRU of msgpack-encoded messages keyed by (log_id, message_id).
+
+    Log entries never change once appended, so an encoding can be reused
+    for as long as it is cached: when many consumer groups read the same
+    messages, each one is serialized once instead of once per group.
+    Bounded by the total size of the cached encodings; a single encoding
+    larger than a quarter of the budget is never cached.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_FRAME_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, log_id: str, message_id: int, encode: Callable[[], bytes]) -> bytes:
+        """Returns the cached encoding, or calls encode() and caches it."""
+        key = (log_id, message_id)
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+        self.misses += 1
+        frame = encode()
+        if len(frame) * 4 > self.max_bytes:
+            return frame
+        self._frames[key] = frame
+        self.size += len(frame)
+        while self.size > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+        return frame
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._frames),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
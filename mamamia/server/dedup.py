@@ -0,0 +1,79 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple, Union
+
+# A window entry is the appended message id (None for scheduled messages),
+# or a future while the first attempt is still being appended.
+_Entry = Union[Optional[int], asyncio.Future]
+_ABORTED = object()
+
+
+class ProducerDedupCache:
+    """Remembers recent (producer_id, sequence) -> message_id per log.
+
+    Producers are kept in an LRU bounded by `max_producers`, and each keeps
+    only its last `window` sequence numbers, so memory is bounded no matter
+    how many short-lived producers come and go. Every operation is O(1).
+    """
+
+    def __init__(self, max_producers: int = 100_000, window: int = 64):
+        self.max_producers = max_producers
+        self.window = window
+        # (log_id, producer_id) -> OrderedDict[sequence, _Entry]
+        self._producers: "OrderedDict[Tuple[str, str], OrderedDict[int, _Entry]]" = (
+            OrderedDict()
+        )
+
+    def _window_for(self, log_id: str, producer_id: str) -> "OrderedDict[int, _Entry]":
+        key = (log_id, producer_id)
+        window = self._producers.get(key)
+        if window is None:
+            window = OrderedDict()
+            self._producers[key] = window
+            if len(self._producers) > self.max_producers:
+                self._producers.popitem(last=False)
+        else:
+            self._producers.move_to_end(key)
+        return window
+
+    async def run(
+        self,
+        log_id: str,
+        producer_id: str,
+        sequence: int,
+        produce: Callable[[], Awaitable[Optional[int]]],
+    ) -> Optional[int]:
+        """Calls produce() once per (producer_id, sequence) inside the window.
+
+        Duplicates return the original message id. A duplicate arriving while
+        the original is still being appended waits for it.
+        """
+        while True:
+            window = self._window_for(log_id, producer_id)
+            entry = window.get(sequence)
+            if isinstance(entry, asyncio.Future):
+                result = await asyncio.shield(entry)
+                if result is _ABORTED:
+                    continue
+                return result
+            if sequence in window:
+                return entry
+            break
+
+        pending = asyncio.get_running_loop().create_future()
+        window[sequence] = pending
+        if len(window) > self.window:
+            window.popitem(last=False)
+
+        try:
+            message_id = await produce()
+        except BaseException:
+            if window.get(sequence) is pending:
+                del window[sequence]
+            pending.set_result(_ABORTED)
+            raise
+
+        if window.get(sequence) is pending:
+            window[sequence] = message_id
+        pending.set_result(message_id)
+        return message_id
@@ -0,0 +1,206 @@
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from mamamia.core.models import LogLimits, ProduceQuota
+from mamamia.core.protocol import ThrottledError
+
+# How long a log's backlog reading is reused before it is recomputed.
+BACKLOG_REFRESH_INTERVAL = 0.1
+# Retry hint when a log's buffer is full; it drains at consumer speed, which
+# the server can't predict.
+BUFFER_FULL_RETRY_AFTER = 0.5
+# Retry hint when a log has too many produce requests in flight.
+INFLIGHT_RETRY_AFTER = 0.05
+# Weight of the newest message in a log's running average message size.
+SIZE_SMOOTHING = 0.05
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `capacity`.
+
+    A request larger than the capacity is admitted once the bucket is full
+    and leaves it in debt, so oversized messages are slowed, not refused.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken; 0 if it can be taken now."""
+        self._refill()
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+
+class QuotaBuckets:
+    """The message and byte buckets for one ProduceQuota."""
+
+    def __init__(self, quota: ProduceQuota):
+        self.messages: Optional[TokenBucket] = None
+        self.bytes: Optional[TokenBucket] = None
+        if quota.messages_per_second:
+            self.messages = TokenBucket(
+                quota.messages_per_second, quota.messages_per_second * quota.burst
+            )
+        if quota.bytes_per_second:
+            self.bytes = TokenBucket(
+                quota.bytes_per_second, quota.bytes_per_second * quota.burst
+            )
+
+    @property
+    def counts_bytes(self) -> bool:
+        return self.bytes is not None
+
+    def wait_time(self, count: int, size: int) -> float:
+        wait = 0.0
+        if self.messages is not None:
+            wait = self.messages.wait_time(count)
+        if self.bytes is not None:
+            wait = max(wait, self.bytes.wait_time(size))
+        return wait
+
+    def take(self, count: int, size: int):
+        if self.messages is not None:
+            self.messages.take(count)
+        if self.bytes is not None:
+            self.bytes.take(size)
+
+
+class _LogFlow:
+    def __init__(self, limits: LogLimits):
+        self.limits = limits
+        self.buckets = QuotaBuckets(limits.quota)
+        self.inflight = 0
+        self.avg_size = 0.0
+        # Last backlog reading, plus messages admitted since it was taken.
+        self.backlog = 0
+        self.admitted = 0
+        self.backlog_at = float("-inf")
+
+    @property
+    def counts_bytes(self) -> bool:
+        return (
+            self.buckets.counts_bytes or self.limits.max_buffered_bytes is not None
+        )
+
+
+class FlowController:
+    """Admits or throttles produce requests against per-log limits.
+
+    Per-connection quotas are owned by the connection and passed in, so the
+    same check covers both.
+    """
+
+    def __init__(self, default_limits: Optional[LogLimits] = None):
+        self.default_limits = default_limits or LogLimits()
+        self._limits: Dict[str, LogLimits] = {}
+        self._logs: Dict[str, _LogFlow] = {}
+
+    def get_limits(self, log_id: str) -> LogLimits:
+        return self._limits.get(log_id, self.default_limits)
+
+    def set_limits(self, log_id: str, limits: LogLimits):
+        self._limits[log_id] = limits
+        self._logs.pop(log_id, None)
+
+    def _get_flow(self, log_id: str) -> _LogFlow:
+        flow = self._logs.get(log_id)
+        if flow is None:
+            flow = self._logs[log_id] = _LogFlow(self.get_limits(log_id))
+        return flow
+
+    def counts_bytes(self, log_id: str, connection: Optional[QuotaBuckets]) -> bool:
+        """Whether admit() needs the request size in bytes."""
+        if connection is not None and connection.counts_bytes:
+            return True
+        return self._get_flow(log_id).counts_bytes
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        log_id: str,
+        orchestrator,
+        count: int = 1,
+        size: int = 0,
+        connection: Optional[QuotaBuckets] = None,
+    ) -> AsyncIterator[None]:
+        """Holds an in-flight produce slot, or raises ThrottledError."""
+        flow = self._get_flow(log_id)
+        limits = flow.limits
+
+        if limits.max_inflight is not None and flow.inflight >= limits.max_inflight:
+            raise ThrottledError(
+                f"Too many produce requests in flight for {log_id}",
+                INFLIGHT_RETRY_AFTER,
+            )
+
+        if (
+            limits.max_buffered_messages is not None
+            or limits.max_buffered_bytes is not None
+        ):
+            await self._check_buffer(log_id, flow, orchestrator, count, size)
+
+        buckets: List[QuotaBuckets] = [flow.buckets]
+        if connection is not None:
+            buckets.append(connection)
+        wait = max(b.wait_time(count, size) for b in buckets)
+        if wait > 0:
+            raise ThrottledError(f"Produce quota exceeded for {log_id}", wait)
+        for b in buckets:
+            b.take(count, size)
+
+        flow.admitted += count
+        flow.inflight += 1
+        try:
+            yield
+        finally:
+            flow.inflight -= 1
+
+    async def _check_buffer(
+        self, log_id: str, flow: _LogFlow, orchestrator, count: int, size: int
+    ):
+        now = time.monotonic()
+        if now - flow.backlog_at >= BACKLOG_REFRESH_INTERVAL:
+            flow.backlog = await orchestrator.backlog(log_id)
+            flow.admitted = 0
+            flow.backlog_at = now
+        buffered = flow.backlog + flow.admitted
+
+        limits = flow.limits
+        if (
+            limits.max_buffered_messages is not None
+            and buffered + count > limits.max_buffered_messages
+        ):
+            raise ThrottledError(
+                f"Log {log_id} has {buffered} unconsumed messages "
+                f"(limit {limits.max_buffered_messages})",
+                BUFFER_FULL_RETRY_AFTER,
+            )
+
+        if limits.max_buffered_bytes is not None and count:
+            per_message = size / count
+            if flow.avg_size:
+                flow.avg_size += SIZE_SMOOTHING * (per_message - flow.avg_size)
+            else:
+                flow.avg_size = per_message
+            if (buffered + count) * flow.avg_size > limits.max_buffered_bytes:
+                raise ThrottledError(
+                    f"Log {log_id} has about {int(buffered * flow.avg_size)} "
+                    f"unconsumed bytes (limit {limits.max_buffered_bytes})",
+                    BUFFER_FULL_RETRY_AFTER,
+                )
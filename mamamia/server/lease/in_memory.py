@@ -47,6 +47,13 @@ class InMemoryLeaseManager(ILeaseManager):
         async with lock:
             self._leases.pop((log_id, group_id, message_id), None)
 
+    async def release_batch(self, log_id: str, group_id: str, message_ids: List[int]):
+        async with self._global_lock:
+            lock = self._get_lock(log_id, group_id)
+        async with lock:
+            for mid in message_ids:
+                self._leases.pop((log_id, group_id, mid), None)
+
     async def get_lease(
         self, log_id: str, group_id: str, message_id: int
     ) -> Optional[Lease]:
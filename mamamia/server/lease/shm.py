@@ -0,0 +1,96 @@
+import time
+from typing import Dict, List, Optional
+from mamamia.core.interfaces import ILeaseManager
+from mamamia.core.models import Lease
+from mamamia.server.shm import FINISHED_CODES, Region, SharedMemoryArena
+
+
+class SharedMemoryLeaseManager(ILeaseManager):
+    """Leases in a SharedMemoryArena, as an expiry and an owner slot per
+    message.
+
+    acquire() is a compare-and-swap under the message's stripe lock, so
+    processes sharing the arena never hand out the same message twice. It
+    also refuses a message whose state is finished, which settling writes
+    before releasing the lease, so a process that read the state before
+    another one settled the message cannot lease it again. Messages past
+    the window of their group's base offset cannot be leased.
+    """
+
+    def __init__(self, arena: SharedMemoryArena):
+        self.arena = arena
+
+    async def acquire(
+        self,
+        log_id: str,
+        group_id: str,
+        message_id: int,
+        owner_id: str,
+        duration: float,
+    ) -> bool:
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        if not region.in_window(message_id):
+            return False
+        expiry = time.time() + duration
+        owner = arena.owner_slot(owner_id, expiry)
+
+        with arena.locked(arena.stripe(region, message_id)):
+            if message_id < region.base:
+                return False
+            slot = message_id % region.window
+            now = time.time()
+            if region.owner[slot] and region.expiry[slot] > now:
+                return False
+            if region.states[slot] in FINISHED_CODES:
+                return False
+            region.expiry[slot] = now + duration
+            region.owner[slot] = owner
+            return True
+
+    async def release(self, log_id: str, group_id: str, message_id: int):
+        await self.release_batch(log_id, group_id, [message_id])
+
+    async def release_batch(self, log_id: str, group_id: str, message_ids: List[int]):
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        window = region.window
+        for stripe, ids in arena.by_stripe(region, message_ids).items():
+            with arena.locked(stripe):
+                for mid in ids:
+                    if region.in_window(mid):
+                        region.owner[mid % window] = 0
+                        region.expiry[mid % window] = 0.0
+
+    async def get_lease(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> Optional[Lease]:
+        leases = await self.get_leases(log_id, group_id, [message_id])
+        return leases[message_id]
+
+    async def get_leases(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, Optional[Lease]]:
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        results: Dict[int, Optional[Lease]] = {}
+        now = time.time()
+        for stripe, ids in arena.by_stripe(region, message_ids).items():
+            with arena.locked(stripe):
+                for mid in ids:
+                    results[mid] = self._lease(region, mid, now)
+        return results
+
+    def _lease(self, region: Region, message_id: int, now: float) -> Optional[Lease]:
+        if not region.in_window(message_id):
+            return None
+        slot = message_id % region.window
+        owner = region.owner[slot]
+        expiry = region.expiry[slot]
+        if not owner or expiry < now:
+            return None
+        return Lease(owner_id=self.arena.owner_id(owner), expiry=expiry)
+
+    async def reap_expired(self):
+        """Nothing to do: an expired lease takes no extra space and reads as
+        no lease; its slot is overwritten by the next acquire."""
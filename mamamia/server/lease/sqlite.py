@@ -0,0 +1,94 @@
+import sqlite3
+import time
+from typing import Dict, List, Optional
+from mamamia.core.interfaces import ILeaseManager
+from mamamia.core.models import Lease
+from mamamia.server.sqlite import SqliteDatabase, chunked
+
+
+class SqliteLeaseManager(ILeaseManager):
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+
+    async def acquire(
+        self,
+        log_id: str,
+        group_id: str,
+        message_id: int,
+        owner_id: str,
+        duration: float,
+    ) -> bool:
+        def op(conn: sqlite3.Connection) -> bool:
+            # Evaluated on the writer thread so the check-and-set is atomic.
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO leases (log_id, group_id, message_id, owner_id, expiry) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (log_id, group_id, message_id) DO UPDATE SET "
+                "owner_id = excluded.owner_id, expiry = excluded.expiry "
+                "WHERE leases.expiry <= ?",
+                (log_id, group_id, message_id, owner_id, now + duration, now),
+            )
+            return cursor.rowcount == 1
+
+        return await self.db.write(op)
+
+    async def release(self, log_id: str, group_id: str, message_id: int):
+        def op(conn: sqlite3.Connection):
+            conn.execute(
+                "DELETE FROM leases WHERE log_id = ? AND group_id = ? AND message_id = ?",
+                (log_id, group_id, message_id),
+            )
+
+        await self.db.write(op)
+
+    async def release_batch(self, log_id: str, group_id: str, message_ids: List[int]):
+        def op(conn: sqlite3.Connection):
+            for chunk in chunked(message_ids):
+                placeholders = ",".join("?" * len(chunk))
+                conn.execute(
+                    "DELETE FROM leases WHERE log_id = ? AND group_id = ? "
+                    f"AND message_id IN ({placeholders})",
+                    (log_id, group_id, *chunk),
+                )
+
+        await self.db.write(op)
+
+    async def get_lease(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> Optional[Lease]:
+        def op(conn: sqlite3.Connection) -> Optional[Lease]:
+            row = conn.execute(
+                "SELECT owner_id, expiry FROM leases "
+                "WHERE log_id = ? AND group_id = ? AND message_id = ? AND expiry >= ?",
+                (log_id, group_id, message_id, time.time()),
+            ).fetchone()
+            return Lease(owner_id=row[0], expiry=row[1]) if row else None
+
+        return await self.db.read(op)
+
+    async def get_leases(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, Optional[Lease]]:
+        def op(conn: sqlite3.Connection) -> Dict[int, Optional[Lease]]:
+            now = time.time()
+            results: Dict[int, Optional[Lease]] = {mid: None for mid in message_ids}
+            for chunk in chunked(message_ids):
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    "SELECT message_id, owner_id, expiry FROM leases "
+                    f"WHERE log_id = ? AND group_id = ? AND message_id IN ({placeholders}) "
+                    "AND expiry >= ?",
+                    (log_id, group_id, *chunk, now),
+                )
+                for mid, owner_id, expiry in rows:
+                    results[mid] = Lease(owner_id=owner_id, expiry=expiry)
+            return results
+
+        return await self.db.read(op)
+
+    async def reap_expired(self):
+        def op(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM leases WHERE expiry < ?", (time.time(),))
+
+        await self.db.write(op)
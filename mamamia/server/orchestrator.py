@@ -1,7 +1,87 @@
 import asyncio
-from typing import List, Optional
-from mamamia.core.interfaces import IMessageStorage, IStateStore, ILeaseManager
-from mamamia.core.models import Message, MessageState
+import heapq
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from mamamia.core.interfaces import (
+    Entry,
+    IMessageStorage,
+    IStateStore,
+    ILeaseManager,
+)
+from mamamia.core.filters import MetadataFilter, validate as validate_filter
+from mamamia.core.models import Message, MessageState, RetryPolicy
+from mamamia.core.protocol import new_id
+from mamamia.server.blobs import BlobStore
+from mamamia.server.dedup import ProducerDedupCache
+
+
+# Messages looked up per round trip to the state and lease stores during a
+# cumulative acknowledgement.
+SETTLE_BATCH_SIZE = 1000
+# acquire_next reads the log in batches that start small and double each
+# time a whole batch is skipped, so long blocked runs are crossed quickly.
+MIN_SCAN_BATCH = 20
+MAX_SCAN_BATCH = 1000
+# States counted per group; everything else in the log is pending.
+COUNTED_STATES = (
+    MessageState.IN_PROGRESS,
+    MessageState.FAILED,
+    MessageState.DEAD,
+    MessageState.PROCESSED,
+    MessageState.EXPIRED,
+)
+# States a group is finished with; offset sliding moves past them.
+FINISHED_STATES = (MessageState.PROCESSED, MessageState.DEAD, MessageState.EXPIRED)
+# Metadata keys the server stamps for its own use. They are namespaced so
+# they cannot collide with producers' fields: produce requests may not set
+# them, and they are stripped from messages sent to clients.
+EXPIRES_AT = "_mamamia.expires_at"  # Unix timestamp the message expires at
+DELIVER_AT = "_mamamia.deliver_at"  # Unix timestamp a scheduled message is due
+RESERVED_KEYS = frozenset({EXPIRES_AT, DELIVER_AT})
+# Scheduled messages of log X wait in the log X + SCHEDULE_SUFFIX until they
+# are due, so they are stored, replicated and exported like any message. The
+# reserved group marks the ones already promoted into X as processed.
+SCHEDULE_SUFFIX = "._mamamia.scheduled"
+SCHEDULER_GROUP = "_mamamia.scheduler"
+# Seconds a process holds a due scheduled message it is promoting, when the
+# schedule is shared with other processes.
+PROMOTE_LEASE = 30.0
+
+
+def check_metadata(metadata: Optional[dict]):
+    """Raises ValueError if a producer's metadata sets a reserved key."""
+    if isinstance(metadata, dict) and not RESERVED_KEYS.isdisjoint(metadata):
+        keys = sorted(RESERVED_KEYS.intersection(metadata))
+        raise ValueError(f"Metadata keys {keys} are reserved for the server")
+
+
+def strip_reserved(metadata: Optional[dict]) -> Optional[dict]:
+    """Returns metadata without the server's reserved keys."""
+    if not metadata or RESERVED_KEYS.isdisjoint(metadata):
+        return metadata
+    return {k: v for k, v in metadata.items() if k not in RESERVED_KEYS} or None
+
+
+@asynccontextmanager
+async def _no_transaction() -> AsyncIterator[None]:
+    yield
+
+
+def schedule_log(log_id: str) -> str:
+    """Returns the log holding log_id's scheduled messages."""
+    return log_id + SCHEDULE_SUFFIX
 
 
 class Orchestrator:
@@ -10,38 +90,630 @@ class Orchestrator:
         storage: IMessageStorage,
         state_store: IStateStore,
         lease_manager: ILeaseManager,
+        retry_policy: Optional[RetryPolicy] = None,
+        dead_letter_log: Optional[str] = None,
+        dedup: Optional[ProducerDedupCache] = None,
+        blobs: Optional[BlobStore] = None,
+        ttl: Optional[float] = None,
+        transaction: Optional[Callable[[], AsyncContextManager[None]]] = None,
+        shared_state: bool = False,
     ):
         self.storage = storage
         self.state_store = state_store
         self.lease_manager = lease_manager
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dead_letter_log = dead_letter_log
+        self.dedup = dedup
+        # Large payloads are spilled here and replaced by a reference
+        self.blobs = blobs
+        # Seconds a message stays deliverable unless produced with its own ttl
+        self.ttl = ttl
+        # Groups writes that must commit together, where the backend can
+        self.transaction = transaction or _no_transaction
+        # Other processes change the same stores (a shared-memory arena), so
+        # counts are read from the state store and scheduled messages are
+        # leased before being promoted.
+        self.shared_state = shared_state
+        # Lease owner for the scheduled messages this process promotes
+        self._promoter = f"_mamamia.promoter-{new_id()}"
         self._slide_lock = asyncio.Lock()
+        # (log_id, group_id) -> heap of (visible_at, message_id) for FAILED
+        # messages waiting out their backoff, plus the set of those ids so
+        # acquire_next can skip them without looking at timestamps.
+        self._backoff: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+        self._backing_off: Dict[Tuple[str, str], Set[int]] = {}
+        # (log_id, group_id) -> {ordering key: id of the message holding it}.
+        # A key is held from the moment one of its messages is leased until
+        # that message is processed or dead, so later messages with the same
+        # key are skipped with a dict lookup.
+        self._key_holders: Dict[Tuple[str, str], Dict[str, int]] = {}
+        # (log_id, group_id) -> {message_id: ordering key}, to release by id.
+        self._held_keys: Dict[Tuple[str, str], Dict[int, str]] = {}
+        # log_id -> heap of (deliver_at, id in the schedule log) for the
+        # scheduled messages not promoted yet, plus the schedule log length
+        # the heap covers. Entries past it (scheduled by another process, or
+        # appended out of order) are read in by _sync_schedule. They are only
+        # appended to the log once due, so acquire_next never has to look at
+        # them.
+        self._delayed: Dict[str, List[Tuple[float, int]]] = {}
+        self._schedule_end: Dict[str, int] = {}
+        self._promote_lock = asyncio.Lock()
+        # A follower leaves promotion to its leader and applies the appends
+        # the leader makes instead.
+        self.read_only = False
+        # Resolved whenever this orchestrator appends, to wake long-polling
+        # streaming readers.
+        self._append_waiter: Optional[asyncio.Future] = None
+        # Groups that have consumed from this log, for stats().
+        self._groups: Set[str] = set()
+        # (log_id, group_id) -> {state: message count} for COUNTED_STATES.
+        # Seeded from the state store the first time a group's stats are
+        # read, then adjusted on every transition made here.
+        self._counters: Dict[Tuple[str, str], Dict[MessageState, int]] = {}
+        # log_id -> heap of (expires_at, message_id) for messages with a TTL,
+        # i.e. ordered by append time for a log-wide TTL. The sweep pops the
+        # due ones and expires them in bulk for every group.
+        self._expiry: Dict[str, List[Tuple[float, int]]] = {}
+
+    async def produce(
+        self,
+        log_id: str,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        deliver_at: Optional[float] = None,
+        producer_id: Optional[str] = None,
+        sequence: Optional[int] = None,
+        key: Optional[str] = None,
+        ttl: Optional[float] = None,
+    ) -> Optional[int]:
+        """Appends a message, or schedules it if deliver_at is in the future.
+
+        Returns the message id, or None for a scheduled message (its id is
+        assigned when it is promoted into the log). A repeated
+        (producer_id, sequence) returns the original id instead of appending.
+        Messages sharing an ordering `key` are delivered one at a time, in
+        order, within each consumer group. A message is expired instead of
+        delivered once `ttl` (default: the log's) seconds have passed since
+        it became due. Metadata may not set the server's RESERVED_KEYS.
+        """
+        check_metadata(metadata)
+        metadata = self._stamp_expiry(metadata, ttl, deliver_at)
+        if self.dedup is not None and producer_id is not None and sequence is not None:
+            return await self.dedup.run(
+                log_id,
+                producer_id,
+                sequence,
+                lambda: self._produce(log_id, payload, metadata, deliver_at, key),
+            )
+        return await self._produce(log_id, payload, metadata, deliver_at, key)
+
+    async def _produce(
+        self,
+        log_id: str,
+        payload: Any,
+        metadata: Optional[dict],
+        deliver_at: Optional[float],
+        key: Optional[str] = None,
+    ) -> Optional[int]:
+        if self.blobs is not None:
+            payload = await self.blobs.spill(payload)
+        if deliver_at is not None and deliver_at > time.time():
+            heap = await self._sync_schedule(log_id)
+            metadata = {**(metadata or {}), DELIVER_AT: deliver_at}
+            entry_id = await self.storage.append(
+                schedule_log(log_id), payload, metadata, key
+            )
+            if self._schedule_end.get(log_id) == entry_id:
+                heapq.heappush(heap, (deliver_at, entry_id))
+                self._schedule_end[log_id] = entry_id + 1
+            return None
+        msg_id = await self.storage.append(log_id, payload, metadata, key)
+        self._track_expiry(log_id, msg_id, metadata)
+        self._notify_appended()
+        return msg_id
+
+    async def produce_batch(
+        self,
+        log_id: str,
+        entries: List[Entry],
+        producer_id: Optional[str] = None,
+        sequence: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ) -> List[int]:
+        """Appends (payload, metadata, key) entries in order with one storage
+        call and returns their ids.
+
+        The batch is deduplicated as a unit by its first sequence number.
+        `ttl` applies to every entry, as for produce().
+        """
+        for _, metadata, _ in entries:
+            check_metadata(metadata)
+        if ttl is not None:
+            entries = [
+                (payload, self._stamp_expiry(metadata, ttl), key)
+                for payload, metadata, key in entries
+            ]
+        if self.dedup is not None and producer_id is not None and sequence is not None:
+            return await self.dedup.run(
+                log_id,
+                producer_id,
+                sequence,
+                lambda: self._produce_batch(log_id, entries),
+            )
+        return await self._produce_batch(log_id, entries)
+
+    async def _produce_batch(self, log_id: str, entries: List[Entry]) -> List[int]:
+        entries = await self._prepare_batch(entries)
+        ids = await self.storage.append_batch(log_id, entries)
+        self._appended(log_id, ids, entries)
+        return ids
+
+    async def _prepare_batch(self, entries: List[Entry]) -> List[Entry]:
+        """Stamps the log's TTL on entries and spills large payloads."""
+        if self.ttl is not None:
+            entries = [
+                (payload, self._stamp_expiry(metadata, None), key)
+                for payload, metadata, key in entries
+            ]
+        if self.blobs is not None:
+            entries = [
+                (await self.blobs.spill(payload), metadata, key)
+                for payload, metadata, key in entries
+            ]
+        return entries
+
+    def _appended(self, log_id: str, ids: List[int], entries: List[Entry]):
+        for msg_id, (_, metadata, _) in zip(ids, entries):
+            self._track_expiry(log_id, msg_id, metadata)
+        if ids:
+            self._notify_appended()
+
+    def _stamp_expiry(
+        self,
+        metadata: Optional[dict],
+        ttl: Optional[float],
+        deliver_at: Optional[float] = None,
+    ) -> Optional[dict]:
+        """Adds EXPIRES_AT to metadata unless the server already stamped it."""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None or (metadata and EXPIRES_AT in metadata):
+            return metadata
+        start = max(time.time(), deliver_at or 0.0)
+        return {**(metadata or {}), EXPIRES_AT: start + ttl}
+
+    def _track_expiry(self, log_id: str, message_id: int, metadata: Optional[dict]):
+        if metadata and EXPIRES_AT in metadata:
+            heapq.heappush(
+                self._expiry.setdefault(log_id, []),
+                (metadata[EXPIRES_AT], message_id),
+            )
+
+    async def expire_due(self, log_id: str) -> int:
+        """Marks every message whose TTL has passed EXPIRED, in bulk, for all
+        groups that have consumed from the log, and slides their offsets
+        past them. Leased messages are left to finish; acquire skips them
+        if they come back. Returns how many messages became due; any the
+        state store refuses for now (a shared-memory store, past its window)
+        are kept for the next sweep instead.
+        """
+        heap = self._expiry.get(log_id)
+        now = time.time()
+        if not heap or heap[0][0] > now:
+            return 0
+        popped: List[Tuple[float, int]] = []
+        while heap and heap[0][0] <= now:
+            popped.append(heapq.heappop(heap))
+        due = sorted(mid for _, mid in popped)
+        retry: Set[int] = set()
+
+        for group_id in list(self._groups):
+            base = await self.state_store.get_base_offset(log_id, group_id)
+            ids = [mid for mid in due if mid >= base]
+            if not ids:
+                continue
+            states = await self.state_store.get_message_states(log_id, group_id, ids)
+            leases = await self.lease_manager.get_leases(log_id, group_id, ids)
+            expired = [
+                mid
+                for mid in ids
+                if leases.get(mid) is None
+                and states.get(mid, MessageState.PENDING) not in FINISHED_STATES
+            ]
+            retry.update(await self._expire(log_id, group_id, expired, states))
+            await self._slide_offset(log_id, group_id)
+        # Swept again next time; groups that did expire them skip them then.
+        for item in popped:
+            if item[1] in retry:
+                heapq.heappush(heap, item)
+        return len(due) - len(retry)
+
+    async def _expire(
+        self,
+        log_id: str,
+        group_id: str,
+        message_ids: List[int],
+        states: Dict[int, MessageState],
+    ) -> List[int]:
+        """Marks message_ids EXPIRED and returns those the state store
+        refused."""
+        if not message_ids:
+            return []
+        refused = await self.state_store.set_message_states(
+            log_id, group_id, message_ids, MessageState.EXPIRED
+        )
+        if refused:
+            skip = set(refused)
+            message_ids = [mid for mid in message_ids if mid not in skip]
+        for mid in message_ids:
+            self._count(
+                log_id,
+                group_id,
+                states.get(mid, MessageState.PENDING),
+                MessageState.EXPIRED,
+            )
+        # Drops lapsed leases the lease store has not reaped yet
+        await self.lease_manager.release_batch(log_id, group_id, message_ids)
+        hidden = self._backing_off.get((log_id, group_id))
+        if hidden:
+            hidden.difference_update(message_ids)
+        self._release_keys(log_id, group_id, message_ids)
+        return refused
+
+    def _notify_appended(self):
+        waiter = self._append_waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+        self._append_waiter = None
+
+    async def wait_for_append(self, timeout: float):
+        """Waits up to timeout seconds for the next append to this log."""
+        if self._append_waiter is None:
+            self._append_waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._append_waiter), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def scheduled_count(self, log_id: str) -> int:
+        sched = schedule_log(log_id)
+        counters = await self._get_counters(sched, SCHEDULER_GROUP)
+        promoted = counters[MessageState.PROCESSED]
+        return await self.storage.get_length(sched) - promoted
+
+    async def _sync_schedule(self, log_id: str) -> List[Tuple[float, int]]:
+        """Returns log_id's schedule heap, first reading in the schedule log
+        entries it does not cover yet (from the first one not promoted, the
+        first time)."""
+        sched = schedule_log(log_id)
+        heap = self._delayed.get(log_id)
+        length = await self.storage.get_length(sched)
+        if heap is not None and self._schedule_end[log_id] >= length:
+            return heap
+        async with self._promote_lock:
+            heap = self._delayed.setdefault(log_id, [])
+            offset = self._schedule_end.get(log_id)
+            if offset is None:
+                offset = await self.state_store.get_base_offset(
+                    sched, SCHEDULER_GROUP
+                )
+            while True:
+                entries = await self.storage.get_batch(sched, offset, MAX_SCAN_BATCH)
+                if not entries:
+                    break
+                ids = [entry.id for entry in entries]
+                states = await self.state_store.get_message_states(
+                    sched, SCHEDULER_GROUP, ids
+                )
+                for entry in entries:
+                    if states.get(entry.id) != MessageState.PROCESSED:
+                        heapq.heappush(heap, (entry.metadata[DELIVER_AT], entry.id))
+                offset = ids[-1] + 1
+            self._schedule_end[log_id] = offset
+            return heap
+
+    async def promote_due(self, log_id: str) -> int:
+        """Appends every scheduled message whose delivery time has passed.
+
+        With SQLite, the append and marking the schedule entry promoted
+        commit together. Elsewhere the append comes first, so a crash in
+        between delivers the message twice rather than never. With a shared
+        state store, each message is leased first so that only one process
+        promotes it.
+        """
+        if self.read_only:
+            return 0
+        heap = await self._sync_schedule(log_id)
+        if not heap or heap[0][0] > time.time():
+            return 0
+
+        sched = schedule_log(log_id)
+        promoted = 0
+        async with self._promote_lock:
+            now = time.time()
+            while heap and heap[0][0] <= now:
+                due = []
+                while heap and heap[0][0] <= now and len(due) < MAX_SCAN_BATCH:
+                    due.append(heapq.heappop(heap)[1])
+                states = await self.state_store.get_message_states(
+                    sched, SCHEDULER_GROUP, due
+                )
+                due = [
+                    entry_id
+                    for entry_id in dict.fromkeys(due)
+                    if states.get(entry_id) != MessageState.PROCESSED
+                ]
+                if self.shared_state:
+                    due = await self._claim_scheduled(sched, due, heap, now)
+                entries = []
+                for entry_id in due:
+                    (entry,) = await self.storage.get_batch(sched, entry_id, 1)
+                    metadata = {
+                        k: v for k, v in entry.metadata.items() if k != DELIVER_AT
+                    }
+                    entries.append((entry.payload, metadata or None, entry.key))
+                if not entries:
+                    continue
+                async with self.transaction():
+                    ids = await self.storage.append_batch(log_id, entries)
+                    await self.state_store.set_message_states(
+                        sched, SCHEDULER_GROUP, due, MessageState.PROCESSED
+                    )
+                    if self.shared_state:
+                        await self.lease_manager.release_batch(
+                            sched, SCHEDULER_GROUP, due
+                        )
+                for msg_id, (_, metadata, _) in zip(ids, entries):
+                    self._track_expiry(log_id, msg_id, metadata)
+                self._count(
+                    sched,
+                    SCHEDULER_GROUP,
+                    MessageState.PENDING,
+                    MessageState.PROCESSED,
+                    len(due),
+                )
+                promoted += len(due)
+        if promoted:
+            await self._slide_offset(sched, SCHEDULER_GROUP)
+            self._notify_appended()
+        return promoted
+
+    async def _claim_scheduled(
+        self, sched: str, due: List[int], heap: List[Tuple[float, int]], now: float
+    ) -> List[int]:
+        """Leases due schedule entries for this process and returns those it
+        got. The others, being promoted elsewhere or (shared memory) past the
+        window, are looked at again once such a lease would have run out."""
+        claimed = []
+        for entry_id in due:
+            if await self.lease_manager.acquire(
+                sched, SCHEDULER_GROUP, entry_id, self._promoter, PROMOTE_LEASE
+            ):
+                claimed.append(entry_id)
+            else:
+                heapq.heappush(heap, (now + PROMOTE_LEASE, entry_id))
+        return claimed
+
+    def _schedule_retry(
+        self, log_id: str, group_id: str, message_id: int, delay: float
+    ):
+        key = (log_id, group_id)
+        heapq.heappush(
+            self._backoff.setdefault(key, []), (time.time() + delay, message_id)
+        )
+        self._backing_off.setdefault(key, set()).add(message_id)
+
+    def _release_due_retries(self, log_id: str, group_id: str) -> Set[int]:
+        """Pops expired backoffs and returns the ids still backing off."""
+        key = (log_id, group_id)
+        hidden = self._backing_off.get(key)
+        if not hidden:
+            return set()
+
+        heap = self._backoff[key]
+        now = time.time()
+        while heap and heap[0][0] <= now:
+            _, message_id = heapq.heappop(heap)
+            hidden.discard(message_id)
+        return hidden
+
+    def _count(
+        self,
+        log_id: str,
+        group_id: str,
+        old: MessageState,
+        new: MessageState,
+        n: int = 1,
+    ):
+        counters = self._counters.get((log_id, group_id))
+        if counters is None or old == new:
+            return
+        if old in counters:
+            counters[old] -= n
+        if new in counters:
+            counters[new] += n
+
+    def counting(self, log_id: str, group_id: str) -> bool:
+        """Whether the group's counters have been seeded."""
+        return (log_id, group_id) in self._counters
+
+    def count_transitions(
+        self,
+        log_id: str,
+        group_id: str,
+        old_states: Iterable[MessageState],
+        new: MessageState,
+    ):
+        """Adjusts the counters for messages moved to `new` by someone
+        else, e.g. a follower applying the leader's changes."""
+        for old in old_states:
+            self._count(log_id, group_id, old, new)
+
+    async def _get_counters(self, log_id: str, group_id: str) -> Dict[MessageState, int]:
+        key = (log_id, group_id)
+        counters = self._counters.get(key)
+        if counters is None:
+            counts = await self.state_store.count_states(log_id, group_id)
+            counters = {state: counts.get(state, 0) for state in COUNTED_STATES}
+            if not self.shared_state:
+                self._counters[key] = counters
+        return counters
+
+    async def stats(self, log_id: str, group_id: str) -> Dict[str, int]:
+        """Returns a group's message counts and its lag behind the log head.
+
+        After the first call for a group this is constant-time.
+        """
+        counters = await self._get_counters(log_id, group_id)
+        head = await self.storage.get_length(log_id)
+        base_offset = await self.state_store.get_base_offset(log_id, group_id)
+        return {
+            "head": head,
+            "base_offset": base_offset,
+            "lag": max(head - base_offset, 0),
+            "pending": max(head - sum(counters.values()), 0),
+            "in_flight": counters[MessageState.IN_PROGRESS],
+            "failed": counters[MessageState.FAILED],
+            "dead": counters[MessageState.DEAD],
+            "processed": counters[MessageState.PROCESSED],
+            "expired": counters[MessageState.EXPIRED],
+            "backing_off": len(self._backing_off.get((log_id, group_id), ())),
+            "scheduled": await self.scheduled_count(log_id),
+        }
+
+    def groups(self) -> List[str]:
+        return sorted(self._groups)
+
+    async def backlog(self, log_id: str) -> int:
+        """Messages not yet consumed by the slowest group, plus scheduled ones.
+
+        With no consumer groups yet, the whole log counts.
+        """
+        head = await self.storage.get_length(log_id)
+        slowest = head if self._groups else 0
+        for group_id in self._groups:
+            offset = await self.state_store.get_base_offset(log_id, group_id)
+            slowest = min(slowest, offset)
+        return head - slowest + await self.scheduled_count(log_id)
+
+    def _hold_key(self, log_id: str, group_id: str, key: str, message_id: int):
+        self._key_holders.setdefault((log_id, group_id), {})[key] = message_id
+        self._held_keys.setdefault((log_id, group_id), {})[message_id] = key
+
+    def _release_keys(self, log_id: str, group_id: str, message_ids: List[int]):
+        held = self._held_keys.get((log_id, group_id))
+        if not held:
+            return
+        holders = self._key_holders[(log_id, group_id)]
+        for message_id in message_ids:
+            key = held.pop(message_id, None)
+            if key is not None and holders.get(key) == message_id:
+                del holders[key]
 
     async def acquire_next(
-        self, log_id: str, group_id: str, client_id: str, duration: float = 30.0
+        self,
+        log_id: str,
+        group_id: str,
+        client_id: str,
+        duration: float = 30.0,
+        filters: Optional[MetadataFilter] = None,
     ) -> Optional[Message]:
-        """Atomically finds and leases the next available message."""
+        """Atomically finds and leases the next available message.
+
+        With `filters`, only messages whose metadata matches are considered,
+        and non-matching ones are skipped via the storage's secondary indexes.
+        """
+        messages = await self.acquire_batch(
+            log_id, group_id, client_id, duration, 1, filters
+        )
+        return messages[0] if messages else None
+
+    async def acquire_batch(
+        self,
+        log_id: str,
+        group_id: str,
+        client_id: str,
+        duration: float = 30.0,
+        max_messages: int = 100,
+        filters: Optional[MetadataFilter] = None,
+    ) -> List[Message]:
+        """Leases up to max_messages available messages in one scan of the log.
+
+        At most one message per ordering key is handed out.
+        """
+        if filters is not None:
+            validate_filter(filters)
+        self._groups.add(group_id)
+        # 0. Make due scheduled messages and retries visible
+        await self.promote_due(log_id)
+        backing_off = self._release_due_retries(log_id, group_id)
+
         # 1. Slide offset
         await self._slide_offset(log_id, group_id)
 
         current_offset = await self.state_store.get_base_offset(log_id, group_id)
-        batch_size = 20
+        batch_size = min(max(MIN_SCAN_BATCH, max_messages), MAX_SCAN_BATCH)
+        acquired: List[Message] = []
+        holders = self._key_holders.setdefault((log_id, group_id), {})
+        # Ordering keys with an earlier message this scan could not hand out
+        # or has already handed out.
+        blocked_keys: Set[str] = set()
+        expired_any = False
 
         while True:
-            messages = await self.storage.get_batch(log_id, current_offset, batch_size)
+            if filters is None:
+                messages = await self.storage.get_batch(
+                    log_id, current_offset, batch_size
+                )
+            else:
+                messages = await self.storage.get_batch_filtered(
+                    log_id, current_offset, batch_size, filters
+                )
             if not messages:
-                return None
+                if expired_any:
+                    await self._slide_offset(log_id, group_id)
+                return acquired
+            current_offset = messages[-1].id + 1
 
-            msg_ids = [msg.id for msg in messages]
+            # Drop backing-off and key-blocked messages before any store lookup
+            candidates = []
+            for msg in messages:
+                if msg.id in backing_off:
+                    if msg.key is not None:
+                        blocked_keys.add(msg.key)
+                    continue
+                if msg.key is not None and (
+                    msg.key in blocked_keys or holders.get(msg.key, msg.id) != msg.id
+                ):
+                    continue
+                candidates.append(msg)
+
+            if not candidates:
+                batch_size = min(batch_size * 2, MAX_SCAN_BATCH)
+                continue
+
+            msg_ids = [msg.id for msg in candidates]
             states = await self.state_store.get_message_states(
                 log_id, group_id, msg_ids
             )
             leases = await self.lease_manager.get_leases(log_id, group_id, msg_ids)
 
-            for msg in messages:
+            now = time.time()
+            expired: List[int] = []
+            for msg in candidates:
+                if msg.key is not None and msg.key in blocked_keys:
+                    continue
+
                 state = states.get(msg.id, MessageState.PENDING)
                 lease = leases.get(msg.id)
 
-                if state in (MessageState.PROCESSED, MessageState.DEAD):
+                if state in FINISHED_STATES:
+                    continue
+
+                # Expire a message the sweep has not reached yet
+                expires_at = msg.metadata.get(EXPIRES_AT) if msg.metadata else None
+                if lease is None and expires_at is not None and expires_at <= now:
+                    expired.append(msg.id)
                     continue
 
                 # Lazy reap
@@ -49,6 +721,7 @@ class Orchestrator:
                     await self.state_store.set_message_state(
                         log_id, group_id, msg.id, MessageState.PENDING
                     )
+                    self._count(log_id, group_id, state, MessageState.PENDING)
                     state = MessageState.PENDING
 
                 if state in (MessageState.PENDING, MessageState.FAILED) and not lease:
@@ -56,9 +729,23 @@ class Orchestrator:
                     if await self.acquire_lease(
                         log_id, group_id, msg.id, client_id, duration
                     ):
-                        return msg
+                        if msg.key is not None:
+                            self._hold_key(log_id, group_id, msg.key, msg.id)
+                        acquired.append(msg)
+                        if len(acquired) >= max_messages:
+                            break
 
-            current_offset += len(messages)
+                if msg.key is not None:
+                    blocked_keys.add(msg.key)
+
+            if expired:
+                await self._expire(log_id, group_id, expired, states)
+                expired_any = True
+            if len(acquired) >= max_messages:
+                if expired_any:
+                    await self._slide_offset(log_id, group_id)
+                return acquired
+            batch_size = min(batch_size * 2, MAX_SCAN_BATCH)
 
     async def acquire_lease(
         self,
@@ -70,7 +757,7 @@ class Orchestrator:
     ) -> bool:
         state = await self.state_store.get_message_state(log_id, group_id, message_id)
 
-        if state in (MessageState.PROCESSED, MessageState.DEAD):
+        if state in FINISHED_STATES:
             return False
 
         success = await self.lease_manager.acquire(
@@ -80,6 +767,7 @@ class Orchestrator:
             await self.state_store.set_message_state(
                 log_id, group_id, message_id, MessageState.IN_PROGRESS
             )
+            self._count(log_id, group_id, state, MessageState.IN_PROGRESS)
         return success
 
     async def settle(
@@ -89,13 +777,23 @@ class Orchestrator:
         message_id: int,
         client_id: str,
         success: bool,
-        max_retries: int = 3,
+        max_retries: Optional[int] = None,
+        error: Optional[str] = None,
     ):
         lease = await self.lease_manager.get_lease(log_id, group_id, message_id)
         # Allow settlement if lease expired but no one else took it
         if lease and lease.owner_id != client_id:
             raise PermissionError("Client does not own the lease for this message")
 
+        if max_retries is None:
+            max_retries = self.retry_policy.max_retries
+
+        old_state = None
+        if (log_id, group_id) in self._counters:
+            old_state = await self.state_store.get_message_state(
+                log_id, group_id, message_id
+            )
+
         if success:
             new_state = MessageState.PROCESSED
         else:
@@ -106,14 +804,517 @@ class Orchestrator:
                 new_state = MessageState.DEAD
             else:
                 new_state = MessageState.FAILED
+                delay = self.retry_policy.backoff(retries)
+                if delay > 0:
+                    self._schedule_retry(log_id, group_id, message_id, delay)
 
         await self.state_store.set_message_state(
             log_id, group_id, message_id, new_state
         )
+        if old_state is not None:
+            self._count(log_id, group_id, old_state, new_state)
         await self.lease_manager.release(log_id, group_id, message_id)
 
+        if new_state == MessageState.DEAD:
+            await self._dead_letter(log_id, group_id, message_id, retries, error)
+
         if success or new_state == MessageState.DEAD:
+            self._release_keys(log_id, group_id, [message_id])
+            await self._slide_offset(log_id, group_id)
+
+    async def settle_batch(
+        self,
+        log_id: str,
+        group_id: str,
+        client_id: str,
+        settlements: List[Tuple[int, bool, Optional[str]]],
+    ) -> Dict[int, str]:
+        """Settles many (message_id, success, error) outcomes at once.
+
+        Successes are written with one bulk state update and lease release;
+        failures go through settle() for retry and dead-letter handling.
+        Returns {message_id: error} for messages that could not be settled.
+        """
+        ids = [message_id for message_id, _, _ in settlements]
+        leases = await self.lease_manager.get_leases(log_id, group_id, ids)
+        errors: Dict[int, str] = {}
+        succeeded: List[int] = []
+        for message_id, success, _ in settlements:
+            lease = leases.get(message_id)
+            if lease and lease.owner_id != client_id:
+                errors[message_id] = "Client does not own the lease for this message"
+            elif success:
+                succeeded.append(message_id)
+
+        if succeeded:
+            old_states: Dict[int, MessageState] = {}
+            if (log_id, group_id) in self._counters:
+                old_states = await self.state_store.get_message_states(
+                    log_id, group_id, succeeded
+                )
+            await self.state_store.set_message_states(
+                log_id, group_id, succeeded, MessageState.PROCESSED
+            )
+            for old_state in old_states.values():
+                self._count(log_id, group_id, old_state, MessageState.PROCESSED)
+            await self.lease_manager.release_batch(log_id, group_id, succeeded)
+            self._release_keys(log_id, group_id, succeeded)
+
+        for message_id, success, error in settlements:
+            if success or message_id in errors:
+                continue
+            try:
+                await self.settle(
+                    log_id, group_id, message_id, client_id, False, error=error
+                )
+            except PermissionError as e:
+                errors[message_id] = str(e)
+
+        if succeeded:
+            await self._slide_offset(log_id, group_id)
+        return errors
+
+    async def settle_and_produce(
+        self,
+        log_id: str,
+        group_id: str,
+        client_id: str,
+        settlements: List[Tuple[int, bool, Optional[str]]],
+        outputs: List[Tuple["Orchestrator", str, List[Entry]]],
+        producer_id: Optional[str] = None,
+        sequence: Optional[int] = None,
+    ) -> Tuple[List[List[int]], Dict[int, str]]:
+        """Appends (orchestrator, log_id, entries) outputs and settles the
+        inputs that produced them, all or nothing.
+
+        Every precondition is checked first: each input must still be
+        leased by client_id (PermissionError otherwise) and the outputs'
+        metadata must be valid. Only then are the appends, state changes,
+        retry counts, lease releases and dead letters written, inside one
+        transaction. With the SQLite backend that is one database
+        operation, so a failure or crash leaves no output appended and no
+        input settled. The memory and shared-memory backends cannot fail
+        once the checks pass, but a crash part-way through is not undone.
+        Returns (appended ids per output, {message_id: error}); the errors
+        are always empty and kept for the protocol. A repeated
+        (producer_id, sequence) returns the original result without
+        appending or settling.
+        """
+        for _, _, entries in outputs:
+            for _, metadata, _ in entries:
+                check_metadata(metadata)
+        if self.dedup is not None and producer_id is not None and sequence is not None:
+            return await self.dedup.run(
+                log_id,
+                producer_id,
+                sequence,
+                lambda: self._settle_and_produce(
+                    log_id, group_id, client_id, settlements, outputs
+                ),
+            )
+        return await self._settle_and_produce(
+            log_id, group_id, client_id, settlements, outputs
+        )
+
+    async def _settle_and_produce(
+        self,
+        log_id: str,
+        group_id: str,
+        client_id: str,
+        settlements: List[Tuple[int, bool, Optional[str]]],
+        outputs: List[Tuple["Orchestrator", str, List[Entry]]],
+    ) -> Tuple[List[List[int]], Dict[int, str]]:
+        ids = [message_id for message_id, _, _ in settlements]
+        leases = await self.lease_manager.get_leases(log_id, group_id, ids)
+        now = time.time()
+        for message_id in ids:
+            lease = leases.get(message_id)
+            # Unlike settle(), an expired lease is refused: another consumer
+            # may already be producing the same outputs.
+            if lease is None or lease.owner_id != client_id or lease.expiry <= now:
+                raise PermissionError(
+                    f"Client does not hold the lease for message {message_id}"
+                )
+
+        # Everything that reads or may wait happens before the transaction,
+        # which only writes.
+        prepared = [
+            await target._prepare_batch(entries) for target, _, entries in outputs
+        ]
+        for target, target_log, _ in outputs:
+            await target.storage.get_length(target_log)
+        old_states = await self.state_store.get_message_states(log_id, group_id, ids)
+        failed = [message_id for message_id, success, _ in settlements if not success]
+        retries = await self.state_store.get_retry_counts(log_id, group_id, failed)
+        new_states: Dict[int, MessageState] = {}
+        new_retries: Dict[int, int] = {}
+        dead_letters: List[Entry] = []
+        for message_id, success, error in settlements:
+            if success:
+                new_states[message_id] = MessageState.PROCESSED
+                continue
+            count = retries.get(message_id, 0) + 1
+            new_retries[message_id] = count
+            if count < self.retry_policy.max_retries:
+                new_states[message_id] = MessageState.FAILED
+                continue
+            new_states[message_id] = MessageState.DEAD
+            entry = await self._dead_letter_entry(
+                log_id, group_id, message_id, count, error
+            )
+            if entry is not None:
+                dead_letters.append(entry)
+        if dead_letters:
+            await self.storage.get_length(self.dead_letter_log)
+        by_state: Dict[MessageState, List[int]] = {}
+        for message_id, state in new_states.items():
+            by_state.setdefault(state, []).append(message_id)
+
+        async with self.transaction():
+            ids_per_output = [
+                await target.storage.append_batch(target_log, entries)
+                for (target, target_log, _), entries in zip(outputs, prepared)
+            ]
+            for state, message_ids in by_state.items():
+                await self.state_store.set_message_states(
+                    log_id, group_id, message_ids, state
+                )
+            if new_retries:
+                await self.state_store.set_retry_counts(log_id, group_id, new_retries)
+            await self.lease_manager.release_batch(log_id, group_id, ids)
+            if dead_letters:
+                await self.storage.append_batch(self.dead_letter_log, dead_letters)
+
+        for (target, target_log, _), entries, out_ids in zip(
+            outputs, prepared, ids_per_output
+        ):
+            target._appended(target_log, out_ids, entries)
+        for message_id, state in new_states.items():
+            self._count(
+                log_id,
+                group_id,
+                old_states.get(message_id, MessageState.PENDING),
+                state,
+            )
+            if state == MessageState.FAILED:
+                delay = self.retry_policy.backoff(new_retries[message_id])
+                if delay > 0:
+                    self._schedule_retry(log_id, group_id, message_id, delay)
+        finished = [
+            message_id
+            for message_id, state in new_states.items()
+            if state != MessageState.FAILED
+        ]
+        if finished:
+            self._release_keys(log_id, group_id, finished)
             await self._slide_offset(log_id, group_id)
+        return ids_per_output, {}
+
+    async def _dead_letter(
+        self,
+        log_id: str,
+        group_id: str,
+        message_id: int,
+        retries: int,
+        error: Optional[str],
+    ):
+        """Copies a message that just went DEAD into the dead-letter log."""
+        entry = await self._dead_letter_entry(
+            log_id, group_id, message_id, retries, error
+        )
+        if entry is not None:
+            await self.storage.append(self.dead_letter_log, *entry)
+
+    async def _dead_letter_entry(
+        self,
+        log_id: str,
+        group_id: str,
+        message_id: int,
+        retries: int,
+        error: Optional[str],
+    ) -> Optional[Entry]:
+        """Returns the dead-letter log entry for a message, or None if
+        dead-lettering is off."""
+        if not self.dead_letter_log:
+            return None
+        batch = await self.storage.get_batch(log_id, message_id, 1)
+        if not batch:
+            return None
+        msg = batch[0]
+        return (
+            msg.payload,
+            {
+                "dead_letter": {
+                    "source_log": log_id,
+                    "group_id": group_id,
+                    "message_id": message_id,
+                    "retries": retries,
+                    "error": error,
+                    "dead_at": time.time(),
+                    "metadata": strip_reserved(msg.metadata),
+                }
+            },
+            msg.key,
+        )
+
+    async def read_dead_letters(
+        self, log_id: str, offset: int = 0, limit: int = 100
+    ) -> List[Message]:
+        """Returns a page of this log's dead-letter log."""
+        if not self.dead_letter_log:
+            raise ValueError(f"No dead-letter log configured for {log_id}")
+        return await self.storage.get_batch(self.dead_letter_log, offset, limit)
+
+    async def replay_dead_letters(
+        self,
+        log_id: str,
+        start: int,
+        end: int,
+        batch_size: int = 1000,
+        get_orchestrator: Optional[Callable[[str], "Orchestrator"]] = None,
+    ) -> int:
+        """Re-appends dead letters [start, end) to their source logs.
+
+        Each message gets its original payload and metadata back, without
+        its old expiry, which dead letters do not keep. It is produced afresh
+        through the source log's orchestrator (`get_orchestrator`, default
+        this one), which stamps the source log's TTL and wakes its readers. Replayed messages are
+        new log entries, so every consumer group sees them.
+        """
+        if not self.dead_letter_log:
+            raise ValueError(f"No dead-letter log configured for {log_id}")
+
+        replayed = 0
+        offset = start
+        while offset < end:
+            letters = await self.storage.get_batch(
+                self.dead_letter_log, offset, min(batch_size, end - offset)
+            )
+            if not letters:
+                break
+
+            by_source: Dict[str, List[Entry]] = {}
+            for letter in letters:
+                info = (letter.metadata or {}).get("dead_letter", {})
+                source = info.get("source_log", log_id)
+                by_source.setdefault(source, []).append(
+                    (letter.payload, info.get("metadata"), letter.key)
+                )
+            for source, entries in by_source.items():
+                target = get_orchestrator(source) if get_orchestrator else self
+                await target._produce_batch(source, entries)
+
+            replayed += len(letters)
+            offset += len(letters)
+        return replayed
+
+    async def read_range(
+        self,
+        log_id: str,
+        group_id: str,
+        offset: Optional[int],
+        limit: int,
+        wait: float = 0.0,
+    ) -> Tuple[int, List[Message]]:
+        """Reads up to limit messages for a non-leasing (streaming) group.
+
+        Starts at `offset`, or at the group's committed offset if None. No
+        per-message state or lease is touched. If nothing is available, waits
+        up to `wait` seconds for an append. Returns (start_offset, messages).
+        """
+        self._groups.add(group_id)
+        await self.promote_due(log_id)
+        if offset is None:
+            offset = await self.state_store.get_base_offset(log_id, group_id)
+
+        messages = await self.storage.get_batch(log_id, offset, limit)
+        if not messages and wait > 0:
+            await self.wait_for_append(wait)
+            messages = await self.storage.get_batch(log_id, offset, limit)
+        return offset, messages
+
+    async def commit_offset(self, log_id: str, group_id: str, offset: int):
+        """Records a streaming group's position: everything before is consumed."""
+        self._groups.add(group_id)
+        await self.state_store.set_base_offset(log_id, group_id, offset)
+
+    async def export_group(
+        self, log_id: str, group_id: str, offset: Optional[int], limit: int
+    ) -> Tuple[int, int, Dict[MessageState, List[int]], Dict[int, int]]:
+        """Reads a group's state for message ids [offset, offset + limit),
+        for a snapshot. Starts at the base offset if offset is None.
+
+        Pending messages are left out, and so are in-progress ones: leases
+        are not exported, so those are redelivered after an import. Retry
+        counts are kept for failed and in-progress messages.
+        Returns (base offset, next offset, {state: ids}, {id: retries}).
+        """
+        base = await self.state_store.get_base_offset(log_id, group_id)
+        start = base if offset is None else max(offset, base)
+        head = await self.storage.get_length(log_id)
+        ids = list(range(start, min(start + limit, head)))
+        states = await self.state_store.get_message_states(log_id, group_id, ids)
+
+        by_state: Dict[MessageState, List[int]] = {}
+        retried: List[int] = []
+        for mid in ids:
+            state = states.get(mid, MessageState.PENDING)
+            if state in (MessageState.FAILED, MessageState.IN_PROGRESS):
+                retried.append(mid)
+            if state not in (MessageState.PENDING, MessageState.IN_PROGRESS):
+                by_state.setdefault(state, []).append(mid)
+        retries = await self.state_store.get_retry_counts(log_id, group_id, retried)
+        return base, start + len(ids), by_state, retries
+
+    async def import_entries(
+        self, log_id: str, offset: int, entries: List[Entry]
+    ) -> int:
+        """Appends snapshot entries as they are, with no TTL stamping, blob
+        spilling or deduplication. offset must be the log's current length,
+        so a chunk is never applied twice or out of order. Returns the new
+        length.
+        """
+        ids = await self._append_at(log_id, offset, entries)
+        self._appended(log_id, ids, entries)
+        return offset + len(ids)
+
+    async def export_scheduled(
+        self, log_id: str, offset: int, limit: int
+    ) -> List[Message]:
+        """Reads up to limit scheduled messages not promoted yet, from id
+        offset of the schedule log on, for a snapshot. Their metadata keeps
+        DELIVER_AT. Returns [] once the schedule log is exhausted.
+        """
+        sched = schedule_log(log_id)
+        offset = max(
+            offset, await self.state_store.get_base_offset(sched, SCHEDULER_GROUP)
+        )
+        while True:
+            entries = await self.storage.get_batch(sched, offset, limit)
+            if not entries:
+                return []
+            states = await self.state_store.get_message_states(
+                sched, SCHEDULER_GROUP, [entry.id for entry in entries]
+            )
+            waiting = [
+                entry
+                for entry in entries
+                if states.get(entry.id) != MessageState.PROCESSED
+            ]
+            if waiting:
+                return waiting
+            offset = entries[-1].id + 1
+
+    async def import_scheduled(
+        self, log_id: str, offset: int, entries: List[Entry]
+    ) -> int:
+        """Appends exported scheduled messages to log_id's schedule log, like
+        import_entries(). Each must carry its DELIVER_AT. Returns the
+        schedule log's new length.
+        """
+        for _, metadata, _ in entries:
+            if not isinstance(metadata, dict) or DELIVER_AT not in metadata:
+                raise ValueError(f"Scheduled entry without {DELIVER_AT}")
+        ids = await self._append_at(schedule_log(log_id), offset, entries)
+        # The next promote_due reads them into the schedule heap
+        return offset + len(ids)
+
+    async def _append_at(
+        self, log_id: str, offset: int, entries: List[Entry]
+    ) -> List[int]:
+        length = await self.storage.get_length(log_id)
+        if offset != length:
+            raise ValueError(
+                f"Import into {log_id} expected offset {length}, got {offset}"
+            )
+        ids = await self.storage.append_batch(log_id, entries)
+        if ids and ids[0] != offset:
+            raise RuntimeError(
+                f"Import into {log_id} raced with a producer: expected id "
+                f"{offset}, got {ids[0]}"
+            )
+        return ids
+
+    async def import_group(
+        self,
+        log_id: str,
+        group_id: str,
+        base_offset: int,
+        states: Dict[MessageState, List[int]],
+        retries: Dict[int, int],
+    ):
+        """Writes one page of a group's snapshot state in bulk.
+
+        Imported failed messages are visible at once rather than after the
+        rest of their backoff.
+        """
+        self._groups.add(group_id)
+        for state, ids in states.items():
+            await self.state_store.set_message_states(log_id, group_id, ids, state)
+        if retries:
+            await self.state_store.set_retry_counts(log_id, group_id, retries)
+        await self.state_store.set_base_offset(log_id, group_id, base_offset)
+        # Re-seeded from the state store on the next stats() call
+        self._counters.pop((log_id, group_id), None)
+
+    async def settle_up_to(
+        self, log_id: str, group_id: str, client_id: str, offset: int
+    ) -> Tuple[int, int]:
+        """Cumulatively acknowledges every message up to and including offset.
+
+        Messages in [base_offset, offset] leased by client_id (or in progress
+        with an expired lease nobody else took) are marked PROCESSED and their
+        leases released in bulk. If that leaves nothing unsettled in the
+        range, the base offset jumps straight past it. An offset past the end
+        of the log means its last message.
+        Returns (messages settled, new base offset).
+        """
+        # Nothing past the end can be in progress, and the base offset must
+        # not skip ids that have not been appended yet.
+        offset = min(offset, await self.storage.get_length(log_id) - 1)
+        base = await self.state_store.get_base_offset(log_id, group_id)
+        settled: List[int] = []
+        complete = True
+
+        for start in range(base, offset + 1, SETTLE_BATCH_SIZE):
+            ids = list(range(start, min(start + SETTLE_BATCH_SIZE, offset + 1)))
+            states = await self.state_store.get_message_states(log_id, group_id, ids)
+            leases = await self.lease_manager.get_leases(log_id, group_id, ids)
+            for mid in ids:
+                state = states.get(mid, MessageState.PENDING)
+                if state in FINISHED_STATES:
+                    continue
+                lease = leases.get(mid)
+                if state == MessageState.IN_PROGRESS and (
+                    lease is None or lease.owner_id == client_id
+                ):
+                    settled.append(mid)
+                else:
+                    complete = False
+
+        if settled:
+            await self.state_store.set_message_states(
+                log_id, group_id, settled, MessageState.PROCESSED
+            )
+            self._count(
+                log_id,
+                group_id,
+                MessageState.IN_PROGRESS,
+                MessageState.PROCESSED,
+                len(settled),
+            )
+            await self.lease_manager.release_batch(log_id, group_id, settled)
+            self._release_keys(log_id, group_id, settled)
+
+        if complete:
+            async with self._slide_lock:
+                current = await self.state_store.get_base_offset(log_id, group_id)
+                if current <= offset:
+                    await self.state_store.set_base_offset(
+                        log_id, group_id, offset + 1
+                    )
+        await self._slide_offset(log_id, group_id)
+        return len(settled), await self.state_store.get_base_offset(log_id, group_id)
 
     async def _slide_offset(self, log_id: str, group_id: str):
         async with self._slide_lock:
@@ -123,7 +1324,7 @@ class Orchestrator:
                 state = await self.state_store.get_message_state(
                     log_id, group_id, current_offset
                 )
-                if state in (MessageState.PROCESSED, MessageState.DEAD):
+                if state in FINISHED_STATES:
                     current_offset += 1
                 else:
                     break
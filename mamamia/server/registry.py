@@ -1,19 +1,109 @@
 import asyncio
-from typing import Dict
-from .orchestrator import Orchestrator
+import logging
+import os
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncIterator, Dict, Optional
+from mamamia.core.models import LogLimits, RetryPolicy
+from .orchestrator import SCHEDULE_SUFFIX, Orchestrator
+from .blobs import DEFAULT_BLOB_THRESHOLD, BlobStore
+from .dedup import ProducerDedupCache
+from .flow import FlowController
 from .storage.in_memory import InMemoryStorage
+from .storage.sqlite import SharedSqliteStorage, SqliteStorage
 from .state.in_memory import InMemoryStateStore
 from .lease.in_memory import InMemoryLeaseManager
+from .sqlite import SqliteDatabase
+from .replication import (
+    Follower,
+    ReplicatingStateStore,
+    ReplicatingStorage,
+    ReplicationFeed,
+)
+from .state.sqlite import SqliteStateStore
+from .lease.sqlite import SqliteLeaseManager
+from .shm import SharedMemoryArena
+from .state.shm import SharedMemoryStateStore
+from .lease.shm import SharedMemoryLeaseManager
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "sqlite", "shm")
 
 
 class LogRegistry:
-    def __init__(self):
+    def __init__(
+        self,
+        default_retry_policy: Optional[RetryPolicy] = None,
+        dead_letter_suffix: Optional[str] = ".dlq",
+        backend: str = "memory",
+        sqlite_path: str = "mamamia.db",
+        replicate: bool = False,
+        replication_backlog: int = 1_000_000,
+        dedup_max_producers: int = 100_000,
+        dedup_window: int = 64,
+        log_limits: Optional[LogLimits] = None,
+        blob_dir: Optional[str] = None,
+        blob_threshold: int = DEFAULT_BLOB_THRESHOLD,
+        default_ttl: Optional[float] = None,
+        shm_name: Optional[str] = None,
+        shm_window: int = 1 << 20,
+    ):
         self._orchestrators: Dict[str, Orchestrator] = {}
+        self.default_retry_policy = default_retry_policy or RetryPolicy()
+        self._retry_policies: Dict[str, RetryPolicy] = {}
+        # Message time-to-live in seconds (None: never expire), per-log overrides.
+        self.default_ttl = default_ttl
+        self._ttls: Dict[str, Optional[float]] = {}
+        # Dead letters of log X go to X + suffix unless overridden per log;
+        # a suffix of None disables dead-lettering by default.
+        self.dead_letter_suffix = dead_letter_suffix
+        self._dead_letter_logs: Dict[str, Optional[str]] = {}
         self._shared_storage = InMemoryStorage()
-        self._shared_state = InMemoryStateStore()
-        self._shared_lease = InMemoryLeaseManager()
+        self._dedup = ProducerDedupCache(dedup_max_producers, dedup_window)
+        # Produce flow control; limits apply per log, with per-log overrides.
+        self.flow = FlowController(log_limits)
+        # Claim-check storage for large payloads; disabled without a directory.
+        self.blobs: Optional[BlobStore] = None
+        if blob_dir:
+            self.blobs = BlobStore(blob_dir, blob_threshold)
+        self._db: Optional[SqliteDatabase] = None
+        self._arena: Optional[SharedMemoryArena] = None
+        # Unlinked on close unless it is a named arena other processes share
+        self._owns_arena = False
+        if backend == "memory":
+            self._shared_state = InMemoryStateStore()
+            self._shared_lease = InMemoryLeaseManager()
+        elif backend == "sqlite":
+            self._db = SqliteDatabase(sqlite_path)
+            # The log has to outlive a restart too, or the persisted offsets
+            # would point past a fresh, empty log.
+            self._shared_storage = SqliteStorage(self._db)
+            self._shared_state = SqliteStateStore(self._db)
+            self._shared_lease = SqliteLeaseManager(self._db)
+        elif backend == "shm":
+            self._owns_arena = shm_name is None
+            self._arena = SharedMemoryArena(
+                shm_name or f"mamamia-{os.getpid()}-{id(self):x}", window=shm_window
+            )
+            if not self._owns_arena:
+                # Every process sharing the arena appends to the same logs
+                self._db = SqliteDatabase(sqlite_path)
+                self._shared_storage = SharedSqliteStorage(self._db)
+            self._shared_state = SharedMemoryStateStore(self._arena)
+            self._shared_lease = SharedMemoryLeaseManager(self._arena)
+        else:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
         self._reaper_task = None
 
+        # Replication: a leader records changes into `feed`; a follower applies
+        # the leader's feed and refuses client writes until promoted.
+        self.feed: Optional[ReplicationFeed] = None
+        self.follower: Optional[Follower] = None
+        self.read_only = False
+        self.replication_backlog = replication_backlog
+        if replicate:
+            self.enable_replication()
+
     def start_reaper(self, interval: float = 60.0):
         if self._reaper_task is None:
             self._reaper_task = asyncio.create_task(self._reap_loop(interval))
@@ -21,16 +111,148 @@ class LogRegistry:
     async def _reap_loop(self, interval: float):
         while True:
             await asyncio.sleep(interval)
-            await self._shared_lease.reap_expired()
+            # One failing sweep must not stop the reaper for good
+            try:
+                await self._shared_lease.reap_expired()
+            except Exception:
+                logger.exception("Lease reaping failed")
+            for log_id, orch in list(self._orchestrators.items()):
+                if self.read_only:
+                    continue
+                try:
+                    await orch.promote_due(log_id)
+                    await orch.expire_due(log_id)
+                except Exception:
+                    logger.exception(f"Sweeping log {log_id} failed")
 
     def get_orchestrator(self, log_id: str) -> Orchestrator:
         if log_id not in self._orchestrators:
+            if log_id.endswith(SCHEDULE_SUFFIX):
+                raise ValueError(f"Log {log_id} is reserved for the server")
             # In a more complex system, we could initialize different
             # storage backends based on log_id config.
             self._orchestrators[log_id] = Orchestrator(
-                self._shared_storage, self._shared_state, self._shared_lease
+                self._shared_storage,
+                self._shared_state,
+                self._shared_lease,
+                retry_policy=self.get_retry_policy(log_id),
+                dead_letter_log=self.get_dead_letter_log(log_id),
+                dedup=self._dedup,
+                blobs=self.blobs,
+                ttl=self.get_ttl(log_id),
+                transaction=self.transaction,
+                shared_state=self._arena is not None and not self._owns_arena,
             )
+            self._orchestrators[log_id].read_only = self.read_only
         return self._orchestrators[log_id]
 
+    def find_orchestrator(self, log_id: str) -> Optional[Orchestrator]:
+        """Returns log_id's orchestrator if one has been created. A schedule
+        log belongs to the orchestrator of the log it feeds."""
+        if log_id.endswith(SCHEDULE_SUFFIX):
+            log_id = log_id[: -len(SCHEDULE_SUFFIX)]
+        return self._orchestrators.get(log_id)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Makes the writes the current task issues inside the block atomic
+        where the backend can. With SQLite they commit or roll back as one
+        operation, and followers only receive them once committed. The
+        memory and shared-memory backends apply them as they go.
+        """
+        if self._db is None or self._arena is not None:
+            yield
+            return
+        with self.feed.hold() if self.feed is not None else nullcontext():
+            async with self._db.transaction():
+                yield
+
+    def get_ttl(self, log_id: str) -> Optional[float]:
+        return self._ttls.get(log_id, self.default_ttl)
+
+    def set_ttl(self, log_id: str, ttl: Optional[float]):
+        """Sets how long log_id's messages stay deliverable; None disables."""
+        self._ttls[log_id] = ttl
+        if log_id in self._orchestrators:
+            self._orchestrators[log_id].ttl = ttl
+
+    def get_retry_policy(self, log_id: str) -> RetryPolicy:
+        return self._retry_policies.get(log_id, self.default_retry_policy)
+
+    def set_retry_policy(self, log_id: str, policy: RetryPolicy):
+        self._retry_policies[log_id] = policy
+        if log_id in self._orchestrators:
+            self._orchestrators[log_id].retry_policy = policy
+
+    def get_dead_letter_log(self, log_id: str) -> Optional[str]:
+        if log_id in self._dead_letter_logs:
+            return self._dead_letter_logs[log_id]
+        if self.dead_letter_suffix:
+            return log_id + self.dead_letter_suffix
+        return None
+
+    def set_dead_letter_log(self, log_id: str, dead_letter_log: Optional[str]):
+        self._dead_letter_logs[log_id] = dead_letter_log
+        if log_id in self._orchestrators:
+            self._orchestrators[log_id].dead_letter_log = dead_letter_log
+
+    def get_log_limits(self, log_id: str) -> LogLimits:
+        return self.flow.get_limits(log_id)
+
+    def set_log_limits(self, log_id: str, limits: LogLimits):
+        self.flow.set_limits(log_id, limits)
+
     def get_storage(self):
         return self._shared_storage
+
+    def get_state_store(self):
+        return self._shared_state
+
+    def enable_replication(self):
+        """Starts recording storage and state changes for followers."""
+        if self.feed is not None:
+            return
+        self.feed = ReplicationFeed(self.replication_backlog)
+        self._shared_storage = ReplicatingStorage(self._shared_storage, self.feed)
+        self._shared_state = ReplicatingStateStore(self._shared_state, self.feed)
+        for orch in self._orchestrators.values():
+            orch.storage = self._shared_storage
+            orch.state_store = self._shared_state
+
+    def follow(self, transport, **kwargs):
+        """Turns this registry into a read-only follower of a leader."""
+        self.read_only = True
+        for orch in self._orchestrators.values():
+            orch.read_only = True
+        self.follower = Follower(self, transport, **kwargs)
+        self.follower.start()
+
+    async def promote(self):
+        """Stops following and starts accepting writes as a leader."""
+        if self.follower is not None:
+            await self.follower.stop()
+            self.follower = None
+        self.read_only = False
+        for orch in self._orchestrators.values():
+            orch.read_only = False
+        self.enable_replication()
+
+    async def close(self):
+        if self.follower is not None:
+            await self.follower.stop()
+            self.follower = None
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+        if self._arena is not None:
+            if self._owns_arena:
+                self._arena.unlink()
+            self._arena.close()
+            self._arena = None
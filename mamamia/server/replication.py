@@ -0,0 +1,435 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+from mamamia.core.filters import MetadataFilter
+from mamamia.core.interfaces import Entry, IMessageStorage, IStateStore
+from mamamia.core.models import Message, MessageState
+from mamamia.core.protocol import Command, ResyncRequiredError, new_id
+
+if TYPE_CHECKING:
+    from mamamia.server.orchestrator import Orchestrator
+
+logger = logging.getLogger(__name__)
+
+# Change record ops. Records are plain lists so they pack straight into
+# msgpack frames:
+#   [APPEND, log_id, message_id, payload, metadata, key]
+#   [STATE, log_id, group_id, message_id, state]
+#   [STATES, log_id, group_id, [message_id, ...], state]
+#   [OFFSET, log_id, group_id, offset]
+#   [RETRY, log_id, group_id, message_id]
+#   [RETRIES, log_id, group_id, [[message_id, count], ...]]
+APPEND = "append"
+STATE = "state"
+STATES = "states"
+OFFSET = "offset"
+RETRY = "retry"
+RETRIES = "retries"
+
+
+class FollowerBehindError(ResyncRequiredError):
+    """The records a follower asked for were trimmed."""
+
+
+class FollowerDivergedError(ResyncRequiredError):
+    """A follower's position comes from another feed, e.g. the one the
+    leader served before it restarted."""
+
+
+class ReplicationFeed:
+    """An ordered, bounded change log that followers tail.
+
+    Every record gets a sequence number. A follower asking for records from
+    sequence N implicitly acknowledges everything before N. Records that all
+    known followers have acknowledged are trimmed. The feed also never holds
+    more than `max_backlog` records, so a follower that falls further behind
+    must be re-bootstrapped.
+
+    Sequence numbers only mean something within one feed, so each feed has
+    a random `feed_id` that followers send back with every request.
+    """
+
+    def __init__(self, max_backlog: int = 1_000_000):
+        self.feed_id = new_id()
+        self.max_backlog = max_backlog
+        self._records: Deque[list] = deque()
+        self._first_seq = 0
+        self._acks: Dict[str, int] = {}
+        self._data_waiter: Optional[asyncio.Future] = None
+        self._ack_waiter: Optional[asyncio.Future] = None
+        # Records the current task is holding back, inside hold()
+        self._held: contextvars.ContextVar[Optional[List[list]]] = (
+            contextvars.ContextVar(f"mamamia-feed-{id(self):x}", default=None)
+        )
+
+    @property
+    def next_seq(self) -> int:
+        return self._first_seq + len(self._records)
+
+    def record(self, entry: list):
+        held = self._held.get()
+        if held is not None:
+            held.append(entry)
+            return
+        self._records.append(entry)
+        if len(self._records) > self.max_backlog:
+            self._records.popleft()
+            self._first_seq += 1
+        _wake(self._data_waiter)
+        self._data_waiter = None
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        """Holds back the records the current task makes inside the block
+        until it exits, and drops them if it raises, so followers never see
+        the writes of a transaction that rolled back."""
+        if self._held.get() is not None:
+            yield
+            return
+        held: List[list] = []
+        token = self._held.set(held)
+        try:
+            yield
+        finally:
+            self._held.reset(token)
+        for entry in held:
+            self.record(entry)
+
+    def check(self, feed_id: Optional[str], from_seq: int):
+        """Raises ResyncRequiredError unless from_seq is a position in this
+        feed that is still retained. feed_id is None on first contact."""
+        if feed_id is not None and feed_id != self.feed_id:
+            raise FollowerDivergedError(
+                f"Follower tailed feed {feed_id}, this leader serves {self.feed_id}"
+            )
+        if from_seq > self.next_seq:
+            raise FollowerDivergedError(
+                f"Sequence {from_seq} is ahead of the feed (next: {self.next_seq})"
+            )
+        if from_seq < self._first_seq:
+            raise FollowerBehindError(
+                f"Sequence {from_seq} was trimmed (oldest retained: {self._first_seq})"
+            )
+
+    def read(self, from_seq: int, limit: int) -> List[list]:
+        if from_seq < self._first_seq:
+            raise FollowerBehindError(
+                f"Sequence {from_seq} was trimmed (oldest retained: {self._first_seq})"
+            )
+        start = from_seq - self._first_seq
+        if start >= len(self._records):
+            return []
+        return list(itertools.islice(self._records, start, start + limit))
+
+    async def wait_for_records(self, from_seq: int, timeout: float):
+        """Long-polls until records at or after from_seq exist."""
+        if self.next_seq > from_seq or timeout <= 0:
+            return
+        if self._data_waiter is None:
+            self._data_waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._data_waiter), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def ack(self, follower_id: str, seq: int):
+        self._acks[follower_id] = seq
+        _wake(self._ack_waiter)
+        self._ack_waiter = None
+        trim_to = min(min(self._acks.values()), self.next_seq)
+        while self._first_seq < trim_to:
+            self._records.popleft()
+            self._first_seq += 1
+
+    def acked_seq(self) -> int:
+        """Highest sequence acknowledged by any follower."""
+        return max(self._acks.values(), default=0)
+
+    async def wait_acked(self, seq: int, timeout: float):
+        """Waits until some follower has applied every record before seq."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.acked_seq() < seq:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError("Timed out waiting for follower acknowledgement")
+            if self._ack_waiter is None:
+                self._ack_waiter = loop.create_future()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._ack_waiter), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _wake(waiter: Optional[asyncio.Future]):
+    if waiter is not None and not waiter.done():
+        waiter.set_result(None)
+
+
+class ReplicatingStorage(IMessageStorage):
+    """Records every append into a ReplicationFeed."""
+
+    def __init__(self, inner: IMessageStorage, feed: ReplicationFeed):
+        self.inner = inner
+        self.feed = feed
+
+    async def append(
+        self,
+        log_id: str,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        key: Optional[str] = None,
+    ) -> int:
+        msg_id = await self.inner.append(log_id, payload, metadata, key)
+        self.feed.record([APPEND, log_id, msg_id, payload, metadata, key])
+        return msg_id
+
+    async def append_batch(self, log_id: str, entries: List[Entry]) -> List[int]:
+        ids = await self.inner.append_batch(log_id, entries)
+        for msg_id, (payload, metadata, key) in zip(ids, entries):
+            self.feed.record([APPEND, log_id, msg_id, payload, metadata, key])
+        return ids
+
+    async def get_batch(
+        self, log_id: str, start_index: int, limit: int
+    ) -> List[Message]:
+        return await self.inner.get_batch(log_id, start_index, limit)
+
+    async def get_batch_filtered(
+        self, log_id: str, start_index: int, limit: int, filters: MetadataFilter
+    ) -> List[Message]:
+        return await self.inner.get_batch_filtered(
+            log_id, start_index, limit, filters
+        )
+
+    async def get_length(self, log_id: str) -> int:
+        return await self.inner.get_length(log_id)
+
+
+class ReplicatingStateStore(IStateStore):
+    """Records every offset, state and retry mutation into a ReplicationFeed."""
+
+    def __init__(self, inner: IStateStore, feed: ReplicationFeed):
+        self.inner = inner
+        self.feed = feed
+
+    async def get_base_offset(self, log_id: str, group_id: str) -> int:
+        return await self.inner.get_base_offset(log_id, group_id)
+
+    async def set_base_offset(self, log_id: str, group_id: str, offset: int):
+        await self.inner.set_base_offset(log_id, group_id, offset)
+        self.feed.record([OFFSET, log_id, group_id, offset])
+
+    async def get_message_state(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> MessageState:
+        return await self.inner.get_message_state(log_id, group_id, message_id)
+
+    async def get_message_states(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, MessageState]:
+        return await self.inner.get_message_states(log_id, group_id, message_ids)
+
+    async def set_message_state(
+        self, log_id: str, group_id: str, message_id: int, state: MessageState
+    ):
+        await self.inner.set_message_state(log_id, group_id, message_id, state)
+        self.feed.record([STATE, log_id, group_id, message_id, state.value])
+
+    async def set_message_states(
+        self,
+        log_id: str,
+        group_id: str,
+        message_ids: List[int],
+        state: MessageState,
+    ) -> List[int]:
+        refused = await self.inner.set_message_states(
+            log_id, group_id, message_ids, state
+        )
+        if refused:
+            skip = set(refused)
+            message_ids = [mid for mid in message_ids if mid not in skip]
+        if message_ids:
+            self.feed.record(
+                [STATES, log_id, group_id, list(message_ids), state.value]
+            )
+        return refused
+
+    async def count_states(self, log_id: str, group_id: str) -> Dict[MessageState, int]:
+        return await self.inner.count_states(log_id, group_id)
+
+    async def get_retry_count(self, log_id: str, group_id: str, message_id: int) -> int:
+        return await self.inner.get_retry_count(log_id, group_id, message_id)
+
+    async def get_retry_counts(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, int]:
+        return await self.inner.get_retry_counts(log_id, group_id, message_ids)
+
+    async def increment_retry_count(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> int:
+        count = await self.inner.increment_retry_count(log_id, group_id, message_id)
+        self.feed.record([RETRY, log_id, group_id, message_id])
+        return count
+
+    async def set_retry_counts(
+        self, log_id: str, group_id: str, counts: Dict[int, int]
+    ):
+        await self.inner.set_retry_counts(log_id, group_id, counts)
+        self.feed.record(
+            [RETRIES, log_id, group_id, [[mid, n] for mid, n in counts.items()]]
+        )
+
+
+async def apply_records(
+    storage: IMessageStorage,
+    state_store: IStateStore,
+    records: List[list],
+    find_orchestrator: Optional[Callable[[str], Optional["Orchestrator"]]] = None,
+):
+    """Applies a batch of change records in order.
+
+    Consecutive appends to the same log are applied with one append_batch.
+    State changes are also counted by the log's orchestrator, if
+    `find_orchestrator` returns one whose counters are seeded, so that
+    stats stay constant-time on a follower.
+    """
+    pending_log: Optional[str] = None
+    pending: List[Entry] = []
+    first_id = 0
+
+    async def flush():
+        if pending:
+            ids = await storage.append_batch(pending_log, list(pending))  # type: ignore[arg-type]
+            if ids and ids[0] != first_id:
+                raise RuntimeError(
+                    f"Replica of {pending_log} diverged: expected id {first_id}, got {ids[0]}"
+                )
+            pending.clear()
+
+    for record in records:
+        op = record[0]
+        if op == APPEND:
+            _, log_id, msg_id, payload, metadata, key = record
+            if log_id != pending_log:
+                await flush()
+                pending_log, first_id = log_id, msg_id
+            pending.append((payload, metadata, key))
+            continue
+
+        await flush()
+        if op in (STATE, STATES):
+            _, log_id, group_id, msg_ids, state = record
+            if op == STATE:
+                msg_ids = [msg_ids]
+            state = MessageState(state)
+            orch = find_orchestrator(log_id) if find_orchestrator else None
+            old_states = None
+            if orch is not None and orch.counting(log_id, group_id):
+                old_states = await state_store.get_message_states(
+                    log_id, group_id, msg_ids
+                )
+            await state_store.set_message_states(log_id, group_id, msg_ids, state)
+            if old_states is not None:
+                orch.count_transitions(log_id, group_id, old_states.values(), state)
+        elif op == OFFSET:
+            _, log_id, group_id, offset = record
+            await state_store.set_base_offset(log_id, group_id, offset)
+        elif op == RETRY:
+            _, log_id, group_id, msg_id = record
+            await state_store.increment_retry_count(log_id, group_id, msg_id)
+        elif op == RETRIES:
+            _, log_id, group_id, counts = record
+            await state_store.set_retry_counts(log_id, group_id, dict(counts))
+        else:
+            raise ValueError(f"Unknown replication record {op!r}")
+    await flush()
+
+
+class Follower:
+    """Tails a leader's ReplicationFeed over the binary protocol."""
+
+    def __init__(
+        self,
+        registry,
+        transport,
+        follower_id: Optional[str] = None,
+        batch_size: int = 5000,
+        poll_wait: float = 1.0,
+        retry_interval: float = 1.0,
+    ):
+        self.registry = registry
+        self.transport = transport
+        self.follower_id = follower_id or str(uuid.uuid4())
+        self.batch_size = batch_size
+        self.poll_wait = poll_wait
+        self.retry_interval = retry_interval
+        self.next_seq = 0
+        # The leader's feed this follower's position belongs to
+        self.feed_id: Optional[str] = None
+        # Set when the leader can no longer serve this follower; it stops
+        # replicating and has to be rebuilt.
+        self.error: Optional[ResyncRequiredError] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.transport.close()
+
+    async def run(self):
+        while True:
+            try:
+                response = await self.transport.request(
+                    Command.REPLICATE,
+                    {
+                        "follower_id": self.follower_id,
+                        "feed_id": self.feed_id,
+                        "from_seq": self.next_seq,
+                        "limit": self.batch_size,
+                        "wait": self.poll_wait,
+                    },
+                )
+                await apply_records(
+                    self.registry.get_storage(),
+                    self.registry.get_state_store(),
+                    response["records"],
+                    self.registry.find_orchestrator,
+                )
+                self.feed_id = response["feed_id"]
+                self.next_seq = response["next_seq"]
+            except asyncio.CancelledError:
+                raise
+            except ResyncRequiredError as e:
+                logger.critical(
+                    f"Replication stopped, this follower must be rebuilt: {e}"
+                )
+                self.error = e
+                return
+            except Exception as e:
+                logger.error(f"Replication from leader failed: {e}")
+                await asyncio.sleep(self.retry_interval)
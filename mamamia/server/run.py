@@ -1,39 +1,304 @@
 import asyncio
 import logging
 import argparse
-from mamamia.server.registry import LogRegistry
+from mamamia.core.models import LogLimits, ProduceQuota, RetryPolicy
+from mamamia.server.cache import FrameCache
+from mamamia.server.registry import BACKENDS, LogRegistry
+from mamamia.server.scheduling import DEFAULT_DISPATCH_BATCH, FairScheduler
 from mamamia.server.tcp import TcpFrontend
+from mamamia.client.transport import TcpTransport
 
 
 async def main():
     parser = argparse.ArgumentParser(description="Mamamia Message Delivery Server")
     parser.add_argument("--host", default="0.0.0.0", help="Host to bind to")
     parser.add_argument("--port", type=int, default=9000, help="Port to bind to")
+    parser.add_argument(
+        "--unix-socket",
+        metavar="PATH",
+        help="Also listen on a Unix domain socket (for co-located clients)",
+    )
     parser.add_argument(
         "--reaper-interval",
         type=float,
         default=30.0,
-        help="Lease reaper interval in seconds",
+        help="Lease reaper and TTL sweep interval in seconds",
+    )
+    parser.add_argument(
+        "--no-compression",
+        action="store_true",
+        help="Refuse to negotiate frame compression with clients",
+    )
+    parser.add_argument(
+        "--compression-threshold",
+        type=int,
+        default=1024,
+        help="Minimum frame body size in bytes before compressing",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=3,
+        help="Failures before a message is marked dead",
+    )
+    parser.add_argument(
+        "--retry-base-delay",
+        type=float,
+        default=1.0,
+        help="Backoff in seconds after the first failure (0 disables backoff)",
+    )
+    parser.add_argument(
+        "--retry-multiplier",
+        type=float,
+        default=2.0,
+        help="Backoff growth factor per failure",
+    )
+    parser.add_argument(
+        "--retry-max-delay",
+        type=float,
+        default=300.0,
+        help="Upper bound on retry backoff in seconds",
+    )
+    parser.add_argument(
+        "--retry-jitter",
+        type=float,
+        default=0.1,
+        help="Fraction of the backoff randomized in either direction",
+    )
+    parser.add_argument(
+        "--dead-letter-suffix",
+        default=".dlq",
+        help="Dead letters of log X go to log X+suffix (empty to disable)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="memory",
+        help="State and lease backend (sqlite stores the messages too)",
+    )
+    parser.add_argument(
+        "--sqlite-path",
+        default="mamamia.db",
+        help="Database file for the sqlite backend, and for the messages of a "
+        "named shm arena",
+    )
+    parser.add_argument(
+        "--shm-name",
+        help="Shared memory arena for the shm backend; servers on this host "
+        "with the same name share state and leases",
+    )
+    parser.add_argument(
+        "--shm-window",
+        type=int,
+        default=1 << 20,
+        help="Messages per consumer group tracked past its base offset (shm)",
+    )
+    parser.add_argument(
+        "--replicate",
+        action="store_true",
+        help="Serve a replication feed to followers",
+    )
+    parser.add_argument(
+        "--replication-backlog",
+        type=int,
+        default=1_000_000,
+        help="Max change records retained for lagging followers",
+    )
+    parser.add_argument(
+        "--follow",
+        metavar="HOST:PORT",
+        help="Run as a read-only follower of the given leader",
+    )
+    parser.add_argument(
+        "--dedup-max-producers",
+        type=int,
+        default=100_000,
+        help="Producers remembered for duplicate detection (LRU)",
+    )
+    parser.add_argument(
+        "--dedup-window",
+        type=int,
+        default=64,
+        help="Recent sequence numbers remembered per producer",
+    )
+    parser.add_argument(
+        "--log-produce-rate",
+        type=float,
+        help="Max messages per second produced to each log",
+    )
+    parser.add_argument(
+        "--log-produce-bytes",
+        type=float,
+        help="Max bytes per second produced to each log",
+    )
+    parser.add_argument(
+        "--max-buffered-messages",
+        type=int,
+        help="Throttle producers once a log has this many unconsumed messages",
+    )
+    parser.add_argument(
+        "--max-buffered-bytes",
+        type=int,
+        help="Throttle producers once a log holds about this many unconsumed bytes",
+    )
+    parser.add_argument(
+        "--max-inflight-produces",
+        type=int,
+        help="Max concurrent produce requests per log",
+    )
+    parser.add_argument(
+        "--connection-produce-rate",
+        type=float,
+        help="Max messages per second produced over each connection",
+    )
+    parser.add_argument(
+        "--connection-produce-bytes",
+        type=float,
+        help="Max bytes per second produced over each connection",
+    )
+    parser.add_argument(
+        "--quota-burst",
+        type=float,
+        default=1.0,
+        help="Seconds of unused produce quota that can be saved up",
+    )
+    parser.add_argument(
+        "--blob-dir",
+        help="Spill large payloads to content-addressed files in this directory",
+    )
+    parser.add_argument(
+        "--blob-threshold",
+        type=int,
+        default=256 * 1024,
+        help="Payload size in bytes from which payloads are spilled to --blob-dir",
+    )
+    parser.add_argument(
+        "--message-ttl",
+        type=float,
+        help="Expire messages not processed within this many seconds",
+    )
+    parser.add_argument(
+        "--fair-scheduling",
+        action="store_true",
+        help="Queue requests per log and serve logs by weighted fair scheduling",
+    )
+    parser.add_argument(
+        "--max-concurrent-requests",
+        type=int,
+        default=64,
+        help="Requests served at once under --fair-scheduling",
+    )
+    parser.add_argument(
+        "--dispatch-batch",
+        type=int,
+        default=DEFAULT_DISPATCH_BATCH,
+        help="Requests started per event loop turn under --fair-scheduling; "
+        "lower isolates quiet logs better at some cost in throughput",
+    )
+    parser.add_argument(
+        "--log-weight",
+        action="append",
+        default=[],
+        metavar="TENANT=WEIGHT",
+        help="Scheduling weight of a log or tenant (repeatable, default 1)",
+    )
+    parser.add_argument(
+        "--tenant-separator",
+        help="Schedule logs by the prefix before this separator instead of per log",
+    )
+    parser.add_argument(
+        "--frame-cache-bytes",
+        type=int,
+        default=0,
+        help="Cache this many bytes of encoded messages for fan-out (0 disables)",
     )
     parser.add_argument("--log-level", default="INFO", help="Logging level")
 
     args = parser.parse_args()
 
+    weights = {}
+    for entry in args.log_weight:
+        tenant, _, weight = entry.rpartition("=")
+        try:
+            weights[tenant] = float(weight)
+        except ValueError:
+            tenant = ""
+        if not tenant or weights[tenant] <= 0:
+            parser.error(f"--log-weight expects TENANT=WEIGHT > 0, got {entry!r}")
+
     logging.basicConfig(
         level=getattr(logging, args.log_level.upper()),
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
     )
 
-    registry = LogRegistry()
+    registry = LogRegistry(
+        default_retry_policy=RetryPolicy(
+            max_retries=args.max_retries,
+            base_delay=args.retry_base_delay,
+            multiplier=args.retry_multiplier,
+            max_delay=args.retry_max_delay,
+            jitter=args.retry_jitter,
+        ),
+        dead_letter_suffix=args.dead_letter_suffix or None,
+        backend=args.backend,
+        sqlite_path=args.sqlite_path,
+        replicate=args.replicate,
+        replication_backlog=args.replication_backlog,
+        dedup_max_producers=args.dedup_max_producers,
+        dedup_window=args.dedup_window,
+        log_limits=LogLimits(
+            quota=ProduceQuota(
+                messages_per_second=args.log_produce_rate,
+                bytes_per_second=args.log_produce_bytes,
+                burst=args.quota_burst,
+            ),
+            max_buffered_messages=args.max_buffered_messages,
+            max_buffered_bytes=args.max_buffered_bytes,
+            max_inflight=args.max_inflight_produces,
+        ),
+        blob_dir=args.blob_dir,
+        blob_threshold=args.blob_threshold,
+        default_ttl=args.message_ttl,
+        shm_name=args.shm_name,
+        shm_window=args.shm_window,
+    )
     registry.start_reaper(interval=args.reaper_interval)
+    if args.follow:
+        leader_host, leader_port = args.follow.rsplit(":", 1)
+        registry.follow(TcpTransport(leader_host, int(leader_port)))
 
-    server = TcpFrontend(registry, host=args.host, port=args.port)
+    server = TcpFrontend(
+        registry,
+        host=args.host,
+        port=args.port,
+        compression=not args.no_compression,
+        compression_threshold=args.compression_threshold,
+        connection_quota=ProduceQuota(
+            messages_per_second=args.connection_produce_rate,
+            bytes_per_second=args.connection_produce_bytes,
+            burst=args.quota_burst,
+        ),
+        unix_path=args.unix_socket,
+        scheduler=FairScheduler(
+            max_concurrency=args.max_concurrent_requests,
+            weights=weights,
+            tenant_separator=args.tenant_separator,
+            dispatch_batch=args.dispatch_batch,
+        )
+        if args.fair_scheduling
+        else None,
+        frame_cache=FrameCache(args.frame_cache_bytes)
+        if args.frame_cache_bytes > 0
+        else None,
+    )
 
     print(f"Starting Mamamia Server on {args.host}:{args.port}...")
     try:
         await server.start()
     except asyncio.CancelledError:
         await server.stop()
+    finally:
+        await registry.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import math
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+# Latency histogram buckets are a quarter octave wide, starting at 1us.
+_BUCKETS_PER_OCTAVE = 4
+_MAX_BUCKET = 40 * _BUCKETS_PER_OCTAVE
+# Requests the dispatcher starts per turn of the event loop. Fewer keep a
+# quiet tenant's wait shorter on a busy server; yielding after every single
+# request costs it about 40% of its throughput.
+DEFAULT_DISPATCH_BATCH = 4
+# Idle tenants whose virtual finish time is kept before they are dropped.
+_MAX_IDLE_TENANTS = 1024
+
+T = TypeVar("T")
+
+
+class LatencyHistogram:
+    """Constant-time latency recorder with log-scale buckets.
+
+    Percentiles are reported as the upper bound of the bucket they fall in,
+    so they are accurate to within about 19%.
+    """
+
+    def __init__(self):
+        self._buckets: List[int] = [0] * (_MAX_BUCKET + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        micros = seconds * 1e6
+        index = 0
+        if micros > 1:
+            index = min(int(math.log2(micros) * _BUCKETS_PER_OCTAVE) + 1, _MAX_BUCKET)
+        self._buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Returns the approximate latency in seconds below which `fraction`
+        of the recorded samples fall."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, n in enumerate(self._buckets):
+            seen += n
+            if seen >= target:
+                upper = 2 ** (index / _BUCKETS_PER_OCTAVE) / 1e6
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Count, plus mean, p50, p99 and max in milliseconds."""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class LogLatency:
+    """Per-log request latency, split into time queued and time served."""
+
+    def __init__(self):
+        self.queued = LatencyHistogram()
+        self.service = LatencyHistogram()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {"queued": self.queued.summary(), "service": self.service.summary()}
+
+
+class _Job:
+    """A queued request, and the future its connection waits on."""
+
+    __slots__ = ("run", "result")
+
+    def __init__(self, run: Callable[[], Awaitable[Any]], result: asyncio.Future):
+        self.run = run
+        self.result = result
+
+
+class FairScheduler:
+    """Weighted fair queuing of requests across tenants.
+
+    Connection readers hand each request to submit(), which puts it on its
+    tenant's FIFO queue. A single dispatcher task takes requests off the
+    queues in order of the tenant's virtual start time (start-time fair
+    queuing): every request a tenant runs advances its virtual time by
+    1 / weight. The dispatcher starts up to `dispatch_batch` requests per
+    turn, then yields to the event loop so that requests arriving meanwhile
+    are queued before the next pick. A busy tenant therefore cannot delay a
+    quiet one by more than about one batch, and backlogged tenants are
+    served in proportion to their weights. At most `max_concurrency`
+    requests run at once.
+
+    A tenant is a log by default; `tenant_separator` groups logs by the
+    prefix before it (e.g. "team-a.orders" -> "team-a").
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+        tenant_separator: Optional[str] = None,
+        dispatch_batch: int = DEFAULT_DISPATCH_BATCH,
+    ):
+        self.max_concurrency = max_concurrency
+        self.dispatch_batch = dispatch_batch
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.tenant_separator = tenant_separator
+        self._active = 0
+        self._queues: Dict[str, Deque[_Job]] = {}
+        # Virtual finish time of each tenant's last dispatched request.
+        self._finish: Dict[str, float] = {}
+        # Backlogged tenants by the virtual start time of their next request.
+        self._ready: List[Tuple[float, str]] = []
+        self._clock = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Resolved to wake the dispatcher when work arrives or a slot frees.
+        self._wakeup: Optional[asyncio.Future] = None
+
+    def tenant_of(self, log_id: str) -> str:
+        if self.tenant_separator:
+            return log_id.split(self.tenant_separator, 1)[0]
+        return log_id
+
+    def weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, self.default_weight)
+
+    def queued(self, tenant: str) -> int:
+        return len(self._queues.get(tenant, ()))
+
+    async def submit(self, log_id: str, run: Callable[[], Awaitable[T]]) -> T:
+        """Queues run() under log_id's tenant and returns its result once
+        the dispatcher has run it."""
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        tenant = self.tenant_of(log_id)
+        job = _Job(run, asyncio.get_running_loop().create_future())
+        queue = self._queues.setdefault(tenant, deque())
+        queue.append(job)
+        if len(queue) == 1:
+            start = max(self._finish.get(tenant, 0.0), self._clock)
+            heapq.heappush(self._ready, (start, tenant))
+        self._wake()
+        return await job.result
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = 0
+            while (
+                started < self.dispatch_batch and self._active < self.max_concurrency
+            ):
+                job = self._next()
+                if job is None:
+                    break
+                self._active += 1
+                asyncio.create_task(self._run(job))
+                started += 1
+            if not started:
+                self._wakeup = loop.create_future()
+                await self._wakeup
+                continue
+            # Lets the requests start and connection readers queue what has
+            # arrived before the next pick.
+            await asyncio.sleep(0)
+
+    def _next(self) -> Optional[_Job]:
+        """Pops the next request in virtual-time order."""
+        while self._ready:
+            start, tenant = heapq.heappop(self._ready)
+            queue = self._queues[tenant]
+            # Its connection went away while it was queued
+            while queue and queue[0].result.cancelled():
+                queue.popleft()
+            if not queue:
+                del self._queues[tenant]
+                continue
+            job = queue.popleft()
+            self._clock = start
+            self._finish[tenant] = start + 1.0 / self.weight(tenant)
+            if queue:
+                heapq.heappush(self._ready, (self._finish[tenant], tenant))
+            else:
+                del self._queues[tenant]
+                if len(self._finish) > len(self._queues) + _MAX_IDLE_TENANTS:
+                    self._forget_idle()
+            return job
+        return None
+
+    def _forget_idle(self):
+        """Drops the finish times of tenants with nothing queued.
+
+        An idle tenant's finish time is at most one request (1 / weight)
+        past the virtual clock, so one that comes back after this is at
+        most one request ahead of where it would have been.
+        """
+        self._finish = {
+            tenant: finish
+            for tenant, finish in self._finish.items()
+            if tenant in self._queues
+        }
+
+    async def _run(self, job: _Job):
+        try:
+            result = await job.run()
+        except Exception as e:
+            if not job.result.done():
+                job.result.set_exception(e)
+        else:
+            if not job.result.done():
+                job.result.set_result(result)
+        finally:
+            self._active -= 1
+            self._wake()
+
+    async def close(self):
+        """Stops the dispatcher; requests still queued are cancelled."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for queue in self._queues.values():
+            for job in queue:
+                job.result.cancel()
+        self._queues.clear()
+        self._ready.clear()
+
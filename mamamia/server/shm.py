@@ -0,0 +1,351 @@
+import fcntl
+import os
+import struct
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from mamamia.core.models import MessageState
+
+# Message states by their code in a region's state array; zeroed memory
+# reads as PENDING.
+STATE_CODES = (
+    MessageState.PENDING,
+    MessageState.IN_PROGRESS,
+    MessageState.PROCESSED,
+    MessageState.FAILED,
+    MessageState.DEAD,
+    MessageState.EXPIRED,
+)
+STATE_CODE = {state: code for code, state in enumerate(STATE_CODES)}
+# Codes of the states a group is finished with; such messages are never
+# leased again.
+FINISHED_CODES = frozenset(
+    STATE_CODE[state]
+    for state in (MessageState.PROCESSED, MessageState.DEAD, MessageState.EXPIRED)
+)
+
+LAYOUT_MAGIC = b"MMSH"
+LAYOUT_VERSION = 2
+# Directory segment: magic, layout version, max regions, window, max owners
+# and regions in use, then one key slot per region holding a 2-byte length
+# and "log_id\0group_id" in UTF-8.
+_DIRECTORY_HEADER = struct.Struct("=4sIIIII")
+DIRECTORY_HEADER_SIZE = 64
+KEY_SIZE = 256
+# Owner table entry: 1-byte length, up to 63 bytes of owner id, then the
+# latest expiry of any lease taken under that id.
+OWNER_ID_SIZE = 63
+OWNER_ENTRY_SIZE = 72
+# Seconds an owner entry stays reserved after its latest lease expires.
+OWNER_SLACK = 60.0
+# Region segment: base offset and the number of messages in each state (by
+# state code, PENDING excluded), then the expiry, owner, retry and state
+# arrays.
+REGION_HEADER_SIZE = 64
+REGION_BYTES_PER_MESSAGE = 8 + 4 + 2 + 1
+MAX_RETRY_COUNT = 0xFFFF
+# Message slots guarded by one stripe lock, and the number of lock bytes
+# stripes are spread over.
+STRIPE_SPAN = 256
+STRIPE_LOCKS = 4096
+# Lock bytes before the region header locks and stripes.
+DIRECTORY_LOCK = 0
+OWNERS_LOCK = 1
+
+
+def _open_segment(name: str, size: int) -> Tuple[shared_memory.SharedMemory, bool]:
+    """Creates a zero-filled segment, or attaches to an existing one."""
+    try:
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        created = True
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name)
+        created = False
+    # Segments outlive the process that opened them until unlink(); keep
+    # the resource tracker from removing them when it exits.
+    name = shm._name  # type: ignore[attr-defined]
+    resource_tracker.unregister(name, "shared_memory")
+    return shm, created
+
+
+class Region:
+    """Fixed-layout arrays of one (log_id, group_id).
+
+    Message ids in [base, base + window) own slot `id % window`; ids below
+    the base offset are finished and no longer stored.
+    """
+
+    def __init__(self, index: int, shm: shared_memory.SharedMemory, window: int):
+        self.index = index
+        self.shm = shm
+        self.window = window
+        buf = shm.buf
+        start = REGION_HEADER_SIZE
+        self.header = buf[:start].cast("q")
+        self.expiry = buf[start : start + 8 * window].cast("d")
+        start += 8 * window
+        self.owner = buf[start : start + 4 * window].cast("i")
+        start += 4 * window
+        self.retries = buf[start : start + 2 * window].cast("H")
+        start += 2 * window
+        self.states = buf[start : start + window]
+
+    @property
+    def base(self) -> int:
+        return self.header[0]
+
+    def in_window(self, message_id: int) -> bool:
+        base = self.header[0]
+        return base <= message_id < base + self.window
+
+    def check_window(self, message_ids: Iterable[int]):
+        """Raises if any id is past the end of the window."""
+        end = self.header[0] + self.window
+        for mid in message_ids:
+            if mid >= end:
+                raise ValueError(
+                    f"Message {mid} is beyond the shared-memory window "
+                    f"(base offset {end - self.window}, window {self.window})"
+                )
+
+    def add_counts(self, deltas: List[int]):
+        """Adjusts the per-state message counts; the caller holds the
+        region's header lock."""
+        for code in range(1, len(STATE_CODES)):
+            if deltas[code]:
+                self.header[1 + code] += deltas[code]
+
+    def clear(self, start: int, end: int) -> List[int]:
+        """Zeroes the slots of ids [start, end), which must share a stripe,
+        and returns how many held each state code."""
+        lo = start % self.window
+        hi = lo + end - start
+        states = bytes(self.states[lo:hi])
+        counts = [states.count(code) for code in range(len(STATE_CODES))]
+        n = hi - lo
+        self.states[lo:hi] = bytes(n)
+        self.retries[lo:hi] = memoryview(bytes(2 * n)).cast("H")
+        self.owner[lo:hi] = memoryview(bytes(4 * n)).cast("i")
+        self.expiry[lo:hi] = memoryview(bytes(8 * n)).cast("d")
+        return counts
+
+    def close(self):
+        for view in (self.header, self.expiry, self.owner, self.retries, self.states):
+            view.release()
+        self.shm.close()
+
+
+class SharedMemoryArena:
+    """State and lease arrays in POSIX shared memory, shared by every
+    process on the host that opens the same name.
+
+    Each (log_id, group_id) gets its own segment of fixed-layout arrays
+    covering a sliding window of message ids from its base offset: a state
+    byte, a retry count, a lease expiry and a lease owner slot per message.
+    Owner ids are interned in a shared table. Writes take a per-stripe lock
+    (an fcntl byte-range lock on a lock file, so unrelated processes can
+    share them), and a lease is taken by compare-and-swap under it, so
+    processes serving the same log never hand out a message twice. Locks
+    are held only for synchronous sections, never across an await.
+
+    The arena persists until unlink() is called; the first process to open
+    a name fixes its layout. The messages themselves are not in the arena:
+    processes sharing it need storage they all see, like SharedSqliteStorage.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 1 << 20,
+        max_regions: int = 256,
+        max_owners: int = 65536,
+    ):
+        if window <= 0 or window % STRIPE_SPAN:
+            raise ValueError(f"window must be a positive multiple of {STRIPE_SPAN}")
+        self.name = name
+        self.lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._regions: Dict[Tuple[str, str], Region] = {}
+        # owner id -> 0-based owner table slot last seen for it
+        self._owner_slots: Dict[str, int] = {}
+
+        with self.locked(DIRECTORY_LOCK):
+            size = DIRECTORY_HEADER_SIZE + max_regions * KEY_SIZE
+            self._directory, created = _open_segment(name, size)
+            if created:
+                _DIRECTORY_HEADER.pack_into(
+                    self._directory.buf,
+                    0,
+                    LAYOUT_MAGIC,
+                    LAYOUT_VERSION,
+                    max_regions,
+                    window,
+                    max_owners,
+                    0,
+                )
+            magic, version, max_regions, window, max_owners, _ = (
+                _DIRECTORY_HEADER.unpack_from(self._directory.buf, 0)
+            )
+            if magic != LAYOUT_MAGIC or version != LAYOUT_VERSION:
+                self._directory.close()
+                raise ValueError(f"Shared memory {name!r} is not a mamamia arena")
+            self._owners, _ = _open_segment(
+                f"{name}-owners", max_owners * OWNER_ENTRY_SIZE
+            )
+        self.window = window
+        self.max_regions = max_regions
+        self.max_owners = max_owners
+        self._owner_expiry = self._owners.buf.cast("d")
+        self._stripe_base = 2 + max_regions
+
+    @contextmanager
+    def locked(self, lock: int) -> Iterator[None]:
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, lock)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, lock)
+
+    def header_lock(self, region: Region) -> int:
+        """Guards a region's base offset and state counts."""
+        return 2 + region.index
+
+    def stripe(self, region: Region, message_id: int) -> int:
+        slot = region.index * self.window + message_id % self.window
+        return self._stripe_base + slot // STRIPE_SPAN % STRIPE_LOCKS
+
+    def by_stripe(
+        self, region: Region, message_ids: Iterable[int]
+    ) -> Dict[int, List[int]]:
+        stripes: Dict[int, List[int]] = {}
+        for mid in message_ids:
+            stripes.setdefault(self.stripe(region, mid), []).append(mid)
+        return stripes
+
+    def region(self, log_id: str, group_id: str) -> Region:
+        key = (log_id, group_id)
+        region = self._regions.get(key)
+        if region is None:
+            region = self._regions[key] = self._open_region(log_id, group_id)
+        return region
+
+    def _open_region(self, log_id: str, group_id: str) -> Region:
+        data = f"{log_id}\0{group_id}".encode()
+        if len(data) > KEY_SIZE - 2:
+            raise ValueError(f"Log and group ids too long for shared memory: {data!r}")
+        buf = self._directory.buf
+        with self.locked(DIRECTORY_LOCK):
+            count = _DIRECTORY_HEADER.unpack_from(buf, 0)[5]
+            for index in range(count):
+                offset = DIRECTORY_HEADER_SIZE + index * KEY_SIZE
+                n = int.from_bytes(buf[offset : offset + 2], "little")
+                if buf[offset + 2 : offset + 2 + n] == data:
+                    break
+            else:
+                if count == self.max_regions:
+                    raise RuntimeError(
+                        f"Shared-memory arena {self.name!r} is full "
+                        f"({self.max_regions} log/group pairs)"
+                    )
+                index = count
+                offset = DIRECTORY_HEADER_SIZE + index * KEY_SIZE
+                buf[offset : offset + 2] = len(data).to_bytes(2, "little")
+                buf[offset + 2 : offset + 2 + len(data)] = data
+                struct.pack_into("=I", buf, _DIRECTORY_HEADER.size - 4, count + 1)
+            # Created under the directory lock, so no process attaches to a
+            # region before it exists.
+            shm, _ = _open_segment(
+                f"{self.name}-{index}",
+                REGION_HEADER_SIZE + REGION_BYTES_PER_MESSAGE * self.window,
+            )
+        return Region(index, shm, self.window)
+
+    def owner_slot(self, owner_id: str, expiry: float) -> int:
+        """Interns owner_id for a lease expiring at `expiry` and returns its
+        1-based slot (0 means no owner).
+
+        An entry outlives its owner's leases by OWNER_SLACK, so a busy
+        owner finds its cached slot still reserved without taking the lock.
+        An entry past that is reused for a new owner. Entries are never
+        emptied, so probe chains stay intact.
+        """
+        expiries = self._owner_expiry
+        # An entry's expiry, in the table viewed as doubles
+        stride = OWNER_ENTRY_SIZE // 8
+        buf = self._owners.buf
+        data = owner_id.encode()
+        cached = self._owner_slots.get(owner_id)
+        # Expiry first: while it is ahead, the entry cannot change hands.
+        if cached is not None and expiries[cached * stride + stride - 1] >= expiry:
+            offset = cached * OWNER_ENTRY_SIZE
+            if buf[offset + 1 : offset + 1 + buf[offset]] == data:
+                return cached + 1
+
+        if len(data) > OWNER_ID_SIZE:
+            raise ValueError(
+                f"Owner id longer than {OWNER_ID_SIZE} bytes: {owner_id!r}"
+            )
+        start = zlib.crc32(data) % self.max_owners
+        with self.locked(OWNERS_LOCK):
+            now = time.time()
+            target: Optional[int] = None
+            for i in range(self.max_owners):
+                slot = (start + i) % self.max_owners
+                offset = slot * OWNER_ENTRY_SIZE
+                n = buf[offset]
+                if n == 0:
+                    if target is None:
+                        target = slot
+                    break
+                if buf[offset + 1 : offset + 1 + n] == data:
+                    target = slot
+                    break
+                if target is None and expiries[slot * stride + stride - 1] < now:
+                    target = slot
+            if target is None:
+                raise RuntimeError(
+                    f"Shared-memory arena {self.name!r} has no free owner slots "
+                    f"({self.max_owners} with live leases)"
+                )
+            offset = target * OWNER_ENTRY_SIZE
+            if buf[offset + 1 : offset + 1 + buf[offset]] != data:
+                buf[offset] = len(data)
+                buf[offset + 1 : offset + 1 + len(data)] = data
+                expiries[target * stride + stride - 1] = 0.0
+            index = target * stride + stride - 1
+            expiries[index] = max(expiries[index], expiry + OWNER_SLACK)
+        self._owner_slots[owner_id] = target
+        return target + 1
+
+    def owner_id(self, slot: int) -> str:
+        offset = (slot - 1) * OWNER_ENTRY_SIZE
+        buf = self._owners.buf
+        return bytes(buf[offset + 1 : offset + 1 + buf[offset]]).decode()
+
+    def close(self):
+        for region in self._regions.values():
+            region.close()
+        self._regions.clear()
+        self._owner_expiry.release()
+        self._owners.close()
+        self._directory.close()
+        os.close(self._lock_fd)
+
+    def unlink(self):
+        """Removes the arena's segments and lock file from the host.
+
+        Processes that have it open keep their mappings until they close.
+        """
+        count = _DIRECTORY_HEADER.unpack_from(self._directory.buf, 0)[5]
+        names = [f"{self.name}-{index}" for index in range(count)]
+        for name in names + [f"{self.name}-owners", self.name]:
+            # Opened afresh so the resource tracker's bookkeeping balances
+            # the unregister done by unlink().
+            shm = shared_memory.SharedMemory(name)
+            shm.close()
+            shm.unlink()
+        if os.path.exists(self.lock_path):
+            os.unlink(self.lock_path)
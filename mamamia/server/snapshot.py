@@ -0,0 +1,64 @@
+import asyncio
+import argparse
+import time
+from mamamia.client.admin import AdminClient
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Export a Mamamia log to a snapshot file, or import one"
+    )
+    parser.add_argument(
+        "--addr", default="localhost:9000", help="Server address (HOST:PORT)"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser(
+        "export", help="Write a log and its consumer groups' states to a file"
+    )
+    export.add_argument("log_id", help="Log to export")
+    export.add_argument(
+        "path", help="Snapshot file (gzip-compressed if it ends in .gz)"
+    )
+    export.add_argument(
+        "--group",
+        action="append",
+        dest="groups",
+        metavar="GROUP_ID",
+        help="Export only this consumer group's state (repeatable)",
+    )
+
+    load = commands.add_parser(
+        "import", help="Load a snapshot file into an empty log in bulk"
+    )
+    load.add_argument("path", help="Snapshot file written by export")
+    load.add_argument(
+        "--log-id", help="Import into this log instead of the exported one"
+    )
+
+    args = parser.parse_args()
+
+    admin = AdminClient(args.addr)
+    started = time.perf_counter()
+    try:
+        if args.command == "export":
+            result = await admin.export_snapshot(args.log_id, args.path, args.groups)
+            verb = "Exported"
+        else:
+            result = await admin.import_snapshot(args.path, args.log_id)
+            verb = "Imported"
+    finally:
+        await admin.close()
+    print(
+        f"{verb} {result['messages']} messages, {result['scheduled']} scheduled "
+        f"and {result['groups']} groups in {time.perf_counter() - started:.2f}s"
+    )
+    if result.get("blobs"):
+        print(
+            f"{result['blobs']} payloads are blob references: copy the server's "
+            "--blob-dir along with the snapshot"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,258 @@
+import asyncio
+import contextvars
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    log_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    metadata BLOB,
+    key TEXT,
+    PRIMARY KEY (log_id, message_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS offsets (
+    log_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    base_offset INTEGER NOT NULL,
+    PRIMARY KEY (log_id, group_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS message_states (
+    log_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    retries INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (log_id, group_id, message_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS leases (
+    log_id TEXT NOT NULL,
+    group_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    owner_id TEXT NOT NULL,
+    expiry REAL NOT NULL,
+    PRIMARY KEY (log_id, group_id, message_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS leases_expiry ON leases (expiry);
+"""
+
+# Keeps IN (...) lists well under SQLite's bound-parameter limit.
+MAX_QUERY_PARAMS = 500
+
+_Op = Tuple[Callable[[sqlite3.Connection], Any], asyncio.Future, asyncio.AbstractEventLoop]
+# A write deferred by transaction(), with its commit and rollback hooks.
+_Deferred = Tuple[
+    Callable[[sqlite3.Connection], Any],
+    Optional[Callable[[], None]],
+    Optional[Callable[[], None]],
+]
+
+
+class SqliteDatabase:
+    """A SQLite database in WAL mode shared by the SQLite-backed stores.
+
+    Mutations are queued to a dedicated writer thread, which drains whatever
+    has accumulated and applies it in a single transaction (group commit).
+    Each operation runs in its own savepoint so one failure does not roll
+    back its neighbours. Callers are only resumed after the commit.
+    Reads run on a separate thread with their own connection, which WAL
+    allows to proceed concurrently with the writer.
+
+    `transaction()` groups a task's writes into one operation, so they
+    commit or roll back together.
+    """
+
+    def __init__(self, path: str, max_batch: int = 1024, synchronous: str = "NORMAL"):
+        self.path = path
+        self.max_batch = max_batch
+        self._queue: "queue.SimpleQueue[Optional[_Op]]" = queue.SimpleQueue()
+
+        self._write_conn = self._connect(synchronous)
+        self._write_conn.executescript(SCHEMA)
+
+        # A private in-memory database cannot be opened twice, so reads share
+        # the writer thread in that case.
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._reader: Optional[ThreadPoolExecutor] = None
+        if path != ":memory:":
+            self._read_conn = self._connect(synchronous)
+            self._reader = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="mamamia-sqlite-reader"
+            )
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="mamamia-sqlite-writer", daemon=True
+        )
+        self._writer.start()
+        # The writes deferred by the current task's transaction(), if any
+        self._deferred: contextvars.ContextVar[Optional[List[_Deferred]]] = (
+            contextvars.ContextVar(f"mamamia-sqlite-{id(self):x}", default=None)
+        )
+
+    def _connect(self, synchronous: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def write(
+        self,
+        fn: Callable[[sqlite3.Connection], Any],
+        on_commit: Optional[Callable[[], None]] = None,
+        on_rollback: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """Runs fn(conn) inside the next group-committed transaction, then
+        calls on_commit(), or on_rollback() if fn or the commit failed.
+
+        Inside transaction(), fn is deferred to the end of the block and
+        None is returned at once.
+        """
+        deferred = self._deferred.get()
+        if deferred is not None:
+            deferred.append((fn, on_commit, on_rollback))
+            return None
+        try:
+            result = await self._submit(fn)
+        except BaseException:
+            if on_rollback is not None:
+                on_rollback()
+            raise
+        if on_commit is not None:
+            on_commit()
+        return result
+
+    def _submit(self, fn: Callable[[sqlite3.Connection], Any]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((fn, future, loop))
+        return future
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Applies the writes the current task makes inside the block as one
+        operation when it exits, so they commit or roll back together. If
+        the block raises, none of them is applied.
+
+        Writes inside return None at once, so only writes whose result is
+        not needed belong there, and reads raise RuntimeError. The block
+        must not wait on anything else either: SqliteStorage hands out ids
+        that are only written at the end, and no other append may be
+        queued in between.
+        """
+        if self._deferred.get() is not None:
+            raise RuntimeError("SQLite transactions do not nest")
+        ops: List[_Deferred] = []
+        token = self._deferred.set(ops)
+        committed = False
+        try:
+            try:
+                yield
+            finally:
+                self._deferred.reset(token)
+            if ops:
+
+                def op(conn: sqlite3.Connection):
+                    for fn, _, _ in ops:
+                        fn(conn)
+
+                await self._submit(op)
+            committed = True
+        finally:
+            for _, on_commit, on_rollback in ops:
+                hook = on_commit if committed else on_rollback
+                if hook is not None:
+                    hook()
+
+    async def read(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Runs fn(conn) against committed data."""
+        if self._deferred.get() is not None:
+            raise RuntimeError("Reads inside a transaction would miss its writes")
+        if self._reader is None:
+            return await self._submit(fn)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader, fn, self._read_conn)
+
+    def _write_loop(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            batch: List[_Op] = [op]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+
+            self._commit_batch(batch)
+            if stop:
+                return
+
+    def _commit_batch(self, batch: List[_Op]):
+        conn = self._write_conn
+        results: List[Tuple[bool, Any]] = []
+        try:
+            # Take the write lock up front: a deferred transaction that read
+            # first could not upgrade once another process had committed.
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, _, _ in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((True, fn(conn)))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.exception("SQLite group commit failed")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(False, e)] * len(batch)
+
+        for (_, future, loop), (ok, value) in zip(batch, results):
+            loop.call_soon_threadsafe(_resolve, future, ok, value)
+
+    async def close(self):
+        self._queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.join)
+        if self._reader is not None:
+            self._reader.shutdown(wait=True)
+        if self._read_conn is not None:
+            self._read_conn.close()
+        self._write_conn.close()
+
+
+def _resolve(future: asyncio.Future, ok: bool, value: Any):
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+def chunked(items: List[Any], size: int = MAX_QUERY_PARAMS):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
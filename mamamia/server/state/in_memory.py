@@ -8,8 +8,8 @@ class InMemoryStateStore(IStateStore):
     def __init__(self):
         # (log_id, group_id) -> base_offset
         self._offsets: Dict[Tuple[str, str], int] = {}
-        # (log_id, group_id, message_id) -> MessageState
-        self._states: Dict[Tuple[str, str, int], MessageState] = {}
+        # (log_id, group_id) -> message_id -> MessageState
+        self._states: Dict[Tuple[str, str], Dict[int, MessageState]] = {}
         # (log_id, group_id, message_id) -> retry_count
         self._retries: Dict[Tuple[str, str, int], int] = {}
         # (log_id, group_id) -> Lock
@@ -40,9 +40,10 @@ class InMemoryStateStore(IStateStore):
         async with self._global_lock:
             lock = self._get_lock(log_id, group_id)
         async with lock:
-            return self._states.get(
-                (log_id, group_id, message_id), MessageState.PENDING
-            )
+            states = self._states.get((log_id, group_id))
+            if states is None:
+                return MessageState.PENDING
+            return states.get(message_id, MessageState.PENDING)
 
     async def get_message_states(
         self, log_id: str, group_id: str, message_ids: List[int]
@@ -50,10 +51,8 @@ class InMemoryStateStore(IStateStore):
         async with self._global_lock:
             lock = self._get_lock(log_id, group_id)
         async with lock:
-            return {
-                mid: self._states.get((log_id, group_id, mid), MessageState.PENDING)
-                for mid in message_ids
-            }
+            states = self._states.get((log_id, group_id), {})
+            return {mid: states.get(mid, MessageState.PENDING) for mid in message_ids}
 
     async def set_message_state(
         self, log_id: str, group_id: str, message_id: int, state: MessageState
@@ -61,7 +60,31 @@ class InMemoryStateStore(IStateStore):
         async with self._global_lock:
             lock = self._get_lock(log_id, group_id)
         async with lock:
-            self._states[(log_id, group_id, message_id)] = state
+            self._states.setdefault((log_id, group_id), {})[message_id] = state
+
+    async def set_message_states(
+        self,
+        log_id: str,
+        group_id: str,
+        message_ids: List[int],
+        state: MessageState,
+    ) -> List[int]:
+        async with self._global_lock:
+            lock = self._get_lock(log_id, group_id)
+        async with lock:
+            states = self._states.setdefault((log_id, group_id), {})
+            for mid in message_ids:
+                states[mid] = state
+        return []
+
+    async def count_states(self, log_id: str, group_id: str) -> Dict[MessageState, int]:
+        async with self._global_lock:
+            lock = self._get_lock(log_id, group_id)
+        async with lock:
+            counts: Dict[MessageState, int] = {}
+            for state in self._states.get((log_id, group_id), {}).values():
+                counts[state] = counts.get(state, 0) + 1
+            return counts
 
     async def get_retry_count(self, log_id: str, group_id: str, message_id: int) -> int:
         async with self._global_lock:
@@ -69,6 +92,20 @@ class InMemoryStateStore(IStateStore):
         async with lock:
             return self._retries.get((log_id, group_id, message_id), 0)
 
+    async def get_retry_counts(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, int]:
+        async with self._global_lock:
+            lock = self._get_lock(log_id, group_id)
+        async with lock:
+            retries = self._retries
+            counts = {}
+            for mid in message_ids:
+                count = retries.get((log_id, group_id, mid), 0)
+                if count:
+                    counts[mid] = count
+            return counts
+
     async def increment_retry_count(
         self, log_id: str, group_id: str, message_id: int
     ) -> int:
@@ -79,3 +116,12 @@ class InMemoryStateStore(IStateStore):
             count = self._retries.get(key, 0) + 1
             self._retries[key] = count
             return count
+
+    async def set_retry_counts(
+        self, log_id: str, group_id: str, counts: Dict[int, int]
+    ):
+        async with self._global_lock:
+            lock = self._get_lock(log_id, group_id)
+        async with lock:
+            for mid, count in counts.items():
+                self._retries[(log_id, group_id, mid)] = count
@@ -0,0 +1,171 @@
+from typing import Dict, List
+from mamamia.core.interfaces import IStateStore
+from mamamia.core.models import MessageState
+from mamamia.server.shm import (
+    MAX_RETRY_COUNT,
+    STATE_CODE,
+    STATE_CODES,
+    STRIPE_SPAN,
+    Region,
+    SharedMemoryArena,
+)
+
+
+class SharedMemoryStateStore(IStateStore):
+    """Offsets, states and retry counts in a SharedMemoryArena.
+
+    Only a window of ids from each group's base offset is stored. Ids below
+    the base offset read as PROCESSED with no retries (count_states still
+    counts them by their real state). set_message_states refuses ids past
+    the window and returns them; retry counts past it raise ValueError.
+    The region header keeps a count per state, so count_states reads a
+    few integers that every process sharing the arena keeps current.
+    """
+
+    def __init__(self, arena: SharedMemoryArena):
+        self.arena = arena
+
+    async def get_base_offset(self, log_id: str, group_id: str) -> int:
+        return self.arena.region(log_id, group_id).base
+
+    async def set_base_offset(self, log_id: str, group_id: str, offset: int):
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        window = region.window
+        with arena.locked(arena.header_lock(region)):
+            old = region.base
+            # Published before any slot is cleared: a writer that still saw
+            # the old base holds its stripe lock until it is done. Retired
+            # ids keep being counted in their state.
+            region.header[0] = offset
+            if offset > old:
+                self._clear(region, old, min(offset, old + window))
+            elif offset < old:
+                # Slots of ids that have just left the window
+                dropped = self._clear(region, max(old, offset + window), old + window)
+                region.add_counts([-count for count in dropped])
+
+    def _clear(self, region: Region, start: int, end: int) -> List[int]:
+        counts = [0] * len(STATE_CODES)
+        while start < end:
+            stop = min(end, (start // STRIPE_SPAN + 1) * STRIPE_SPAN)
+            with self.arena.locked(self.arena.stripe(region, start)):
+                for code, count in enumerate(region.clear(start, stop)):
+                    counts[code] += count
+            start = stop
+        return counts
+
+    async def get_message_state(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> MessageState:
+        region = self.arena.region(log_id, group_id)
+        return self._state(region, message_id)
+
+    def _state(self, region: Region, message_id: int) -> MessageState:
+        base = region.base
+        if message_id < base:
+            return MessageState.PROCESSED
+        if message_id >= base + region.window:
+            return MessageState.PENDING
+        return STATE_CODES[region.states[message_id % region.window]]
+
+    async def get_message_states(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, MessageState]:
+        region = self.arena.region(log_id, group_id)
+        return {mid: self._state(region, mid) for mid in message_ids}
+
+    async def set_message_state(
+        self, log_id: str, group_id: str, message_id: int, state: MessageState
+    ):
+        await self.set_message_states(log_id, group_id, [message_id], state)
+
+    async def set_message_states(
+        self,
+        log_id: str,
+        group_id: str,
+        message_ids: List[int],
+        state: MessageState,
+    ) -> List[int]:
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        window = region.window
+        # The base offset only moves forward in use, so an id inside the
+        # window now is still inside it once its stripe is locked.
+        end = region.base + window
+        refused = [mid for mid in message_ids if mid >= end]
+        if refused:
+            message_ids = [mid for mid in message_ids if mid < end]
+        code = STATE_CODE[state]
+        deltas = [0] * len(STATE_CODES)
+        for stripe, ids in arena.by_stripe(region, message_ids).items():
+            with arena.locked(stripe):
+                base = region.base
+                states = region.states
+                for mid in ids:
+                    # Below the base offset: finished and already retired
+                    if mid >= base:
+                        slot = mid % window
+                        deltas[states[slot]] -= 1
+                        deltas[code] += 1
+                        states[slot] = code
+        if any(deltas):
+            with arena.locked(arena.header_lock(region)):
+                region.add_counts(deltas)
+        return refused
+
+    async def count_states(self, log_id: str, group_id: str) -> Dict[MessageState, int]:
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        with arena.locked(arena.header_lock(region)):
+            return {
+                STATE_CODES[code]: region.header[1 + code]
+                for code in range(1, len(STATE_CODES))
+                if region.header[1 + code]
+            }
+
+    async def get_retry_count(self, log_id: str, group_id: str, message_id: int) -> int:
+        region = self.arena.region(log_id, group_id)
+        if not region.in_window(message_id):
+            return 0
+        return region.retries[message_id % region.window]
+
+    async def get_retry_counts(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, int]:
+        region = self.arena.region(log_id, group_id)
+        retries = region.retries
+        window = region.window
+        counts = {}
+        for mid in message_ids:
+            if region.in_window(mid) and retries[mid % window]:
+                counts[mid] = retries[mid % window]
+        return counts
+
+    async def increment_retry_count(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> int:
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        region.check_window([message_id])
+        with arena.locked(arena.stripe(region, message_id)):
+            if message_id < region.base:
+                return 0
+            slot = message_id % region.window
+            count = min(region.retries[slot] + 1, MAX_RETRY_COUNT)
+            region.retries[slot] = count
+            return count
+
+    async def set_retry_counts(
+        self, log_id: str, group_id: str, counts: Dict[int, int]
+    ):
+        arena = self.arena
+        region = arena.region(log_id, group_id)
+        region.check_window(counts)
+        window = region.window
+        for stripe, ids in arena.by_stripe(region, counts).items():
+            with arena.locked(stripe):
+                base = region.base
+                for mid in ids:
+                    if mid >= base:
+                        region.retries[mid % window] = min(counts[mid], MAX_RETRY_COUNT)
@@ -0,0 +1,166 @@
+import sqlite3
+from typing import Dict, List
+from mamamia.core.interfaces import IStateStore
+from mamamia.core.models import MessageState
+from mamamia.server.sqlite import SqliteDatabase, chunked
+
+
+class SqliteStateStore(IStateStore):
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+
+    async def get_base_offset(self, log_id: str, group_id: str) -> int:
+        def op(conn: sqlite3.Connection) -> int:
+            row = conn.execute(
+                "SELECT base_offset FROM offsets WHERE log_id = ? AND group_id = ?",
+                (log_id, group_id),
+            ).fetchone()
+            return row[0] if row else 0
+
+        return await self.db.read(op)
+
+    async def set_base_offset(self, log_id: str, group_id: str, offset: int):
+        def op(conn: sqlite3.Connection):
+            conn.execute(
+                "INSERT INTO offsets (log_id, group_id, base_offset) VALUES (?, ?, ?) "
+                "ON CONFLICT (log_id, group_id) DO UPDATE SET base_offset = excluded.base_offset",
+                (log_id, group_id, offset),
+            )
+
+        await self.db.write(op)
+
+    async def get_message_state(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> MessageState:
+        def op(conn: sqlite3.Connection) -> MessageState:
+            row = conn.execute(
+                "SELECT state FROM message_states "
+                "WHERE log_id = ? AND group_id = ? AND message_id = ?",
+                (log_id, group_id, message_id),
+            ).fetchone()
+            return MessageState(row[0]) if row else MessageState.PENDING
+
+        return await self.db.read(op)
+
+    async def get_message_states(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, MessageState]:
+        def op(conn: sqlite3.Connection) -> Dict[int, MessageState]:
+            results = {mid: MessageState.PENDING for mid in message_ids}
+            for chunk in chunked(message_ids):
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    "SELECT message_id, state FROM message_states "
+                    f"WHERE log_id = ? AND group_id = ? AND message_id IN ({placeholders})",
+                    (log_id, group_id, *chunk),
+                )
+                for mid, state in rows:
+                    results[mid] = MessageState(state)
+            return results
+
+        return await self.db.read(op)
+
+    async def set_message_state(
+        self, log_id: str, group_id: str, message_id: int, state: MessageState
+    ):
+        def op(conn: sqlite3.Connection):
+            conn.execute(
+                "INSERT INTO message_states (log_id, group_id, message_id, state) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (log_id, group_id, message_id) DO UPDATE SET state = excluded.state",
+                (log_id, group_id, message_id, state.value),
+            )
+
+        await self.db.write(op)
+
+    async def set_message_states(
+        self,
+        log_id: str,
+        group_id: str,
+        message_ids: List[int],
+        state: MessageState,
+    ) -> List[int]:
+        def op(conn: sqlite3.Connection):
+            conn.executemany(
+                "INSERT INTO message_states (log_id, group_id, message_id, state) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (log_id, group_id, message_id) DO UPDATE SET state = excluded.state",
+                [(log_id, group_id, mid, state.value) for mid in message_ids],
+            )
+
+        await self.db.write(op)
+        return []
+
+    async def count_states(self, log_id: str, group_id: str) -> Dict[MessageState, int]:
+        def op(conn: sqlite3.Connection) -> Dict[MessageState, int]:
+            rows = conn.execute(
+                "SELECT state, COUNT(*) FROM message_states "
+                "WHERE log_id = ? AND group_id = ? GROUP BY state",
+                (log_id, group_id),
+            )
+            return {MessageState(state): count for state, count in rows}
+
+        # Queued behind pending writes so the counts line up with the
+        # transitions callers have already seen complete.
+        return await self.db.write(op)
+
+    async def get_retry_count(self, log_id: str, group_id: str, message_id: int) -> int:
+        def op(conn: sqlite3.Connection) -> int:
+            row = conn.execute(
+                "SELECT retries FROM message_states "
+                "WHERE log_id = ? AND group_id = ? AND message_id = ?",
+                (log_id, group_id, message_id),
+            ).fetchone()
+            return row[0] if row else 0
+
+        return await self.db.read(op)
+
+    async def get_retry_counts(
+        self, log_id: str, group_id: str, message_ids: List[int]
+    ) -> Dict[int, int]:
+        def op(conn: sqlite3.Connection) -> Dict[int, int]:
+            counts = {}
+            for chunk in chunked(message_ids):
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    "SELECT message_id, retries FROM message_states "
+                    f"WHERE log_id = ? AND group_id = ? AND message_id IN ({placeholders}) "
+                    "AND retries > 0",
+                    (log_id, group_id, *chunk),
+                )
+                counts.update(rows)
+            return counts
+
+        return await self.db.read(op)
+
+    async def increment_retry_count(
+        self, log_id: str, group_id: str, message_id: int
+    ) -> int:
+        def op(conn: sqlite3.Connection) -> int:
+            key = (log_id, group_id, message_id)
+            conn.execute(
+                "INSERT INTO message_states (log_id, group_id, message_id, retries) "
+                "VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (log_id, group_id, message_id) DO UPDATE SET retries = retries + 1",
+                key,
+            )
+            return conn.execute(
+                "SELECT retries FROM message_states "
+                "WHERE log_id = ? AND group_id = ? AND message_id = ?",
+                key,
+            ).fetchone()[0]
+
+        return await self.db.write(op)
+
+    async def set_retry_counts(
+        self, log_id: str, group_id: str, counts: Dict[int, int]
+    ):
+        def op(conn: sqlite3.Connection):
+            conn.executemany(
+                "INSERT INTO message_states (log_id, group_id, message_id, retries) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (log_id, group_id, message_id) DO UPDATE SET retries = excluded.retries",
+                [(log_id, group_id, mid, count) for mid, count in counts.items()],
+            )
+
+        await self.db.write(op)
@@ -1,13 +1,73 @@
 import asyncio
-from typing import List, Optional, Any, Dict
-from mamamia.core.interfaces import IMessageStorage
+import heapq
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Any, Dict, Tuple
+from mamamia.core.filters import INDEXABLE_TYPES, MetadataFilter, is_prefix, matches
+from mamamia.core.interfaces import Entry, IMessageStorage
 from mamamia.core.models import Message
 
+# Passed to model_construct so it need not work out which fields were set.
+_MESSAGE_FIELDS = set(Message.model_fields)
+# Metadata field indexes kept per log. Filters name arbitrary fields, so
+# the least recently used index is dropped to make room for a new one.
+DEFAULT_MAX_INDEXES = 16
+
+
+class _FieldIndex:
+    """Message ids by metadata value for one field of one log."""
 
-class InMemoryStorage(IMessageStorage):
     def __init__(self):
+        # value -> ascending message ids
+        self.ids: Dict[Any, List[int]] = {}
+        # distinct string values, sorted, for prefix lookups
+        self.sorted_strings: List[str] = []
+
+    def add(self, message: Message, field: str):
+        if not message.metadata or field not in message.metadata:
+            return
+        value = message.metadata[field]
+        if not isinstance(value, INDEXABLE_TYPES):
+            return
+        # Keyed with the type so that 1, 1.0 and True stay distinct.
+        ids = self.ids.get((type(value), value))
+        if ids is None:
+            self.ids[(type(value), value)] = [message.id]
+            if isinstance(value, str):
+                insort(self.sorted_strings, value)
+        else:
+            ids.append(message.id)
+
+    def ids_from(self, condition: Any, start: int) -> Iterator[int]:
+        """Yields matching ids >= start in ascending order."""
+        if is_prefix(condition):
+            prefix = condition["prefix"]
+            runs = []
+            i = bisect_left(self.sorted_strings, prefix)
+            while i < len(self.sorted_strings) and self.sorted_strings[i].startswith(
+                prefix
+            ):
+                runs.append(_tail(self.ids[(str, self.sorted_strings[i])], start))
+                i += 1
+            return heapq.merge(*runs)
+
+        return _tail(self.ids.get((type(condition), condition), []), start)
+
+
+def _tail(ids: List[int], start: int) -> Iterator[int]:
+    """Iterates the ids >= start of an ascending list without copying it."""
+    return map(ids.__getitem__, range(bisect_left(ids, start), len(ids)))
+
+
+class InMemoryStorage(IMessageStorage):
+    def __init__(self, max_indexes: int = DEFAULT_MAX_INDEXES):
         # log_id -> List[Message]
         self._logs: Dict[str, List[Message]] = {}
+        # log_id -> field -> index, least recently used first. An index is
+        # built the first time a log is filtered on that field, then kept
+        # current on every append until it is evicted.
+        self._indexes: Dict[str, "OrderedDict[str, _FieldIndex]"] = {}
+        self.max_indexes = max_indexes
         # log_id -> Lock
         self._locks: Dict[str, asyncio.Lock] = {}
         self._global_lock = asyncio.Lock()
@@ -18,7 +78,11 @@ class InMemoryStorage(IMessageStorage):
         return self._locks[log_id]
 
     async def append(
-        self, log_id: str, payload: Any, metadata: Optional[dict] = None
+        self,
+        log_id: str,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        key: Optional[str] = None,
     ) -> int:
         async with self._global_lock:
             lock = self._get_lock(log_id)
@@ -29,11 +93,70 @@ class InMemoryStorage(IMessageStorage):
 
             msg_id = len(self._logs[log_id])
             message = Message(
-                id=msg_id, log_id=log_id, payload=payload, metadata=metadata
+                id=msg_id, log_id=log_id, payload=payload, metadata=metadata, key=key
             )
             self._logs[log_id].append(message)
+            self._index(log_id, [message])
             return msg_id
 
+    async def append_batch(self, log_id: str, entries: List[Entry]) -> List[int]:
+        # Checked up front instead of by model validation, which dominates
+        # the cost of bulk appends, and so a bad entry appends nothing.
+        for _, metadata, key in entries:
+            if metadata is not None and not isinstance(metadata, dict):
+                raise ValueError(f"Message metadata must be a dict, got {metadata!r}")
+            if key is not None and not isinstance(key, str):
+                raise ValueError(f"Message key must be a string, got {key!r}")
+
+        async with self._global_lock:
+            lock = self._get_lock(log_id)
+
+        async with lock:
+            log = self._logs.setdefault(log_id, [])
+            start = len(log)
+            log.extend(
+                Message.model_construct(
+                    _MESSAGE_FIELDS,
+                    id=start + i,
+                    log_id=log_id,
+                    payload=payload,
+                    metadata=metadata,
+                    key=key,
+                )
+                for i, (payload, metadata, key) in enumerate(entries)
+            )
+            self._index(log_id, log[start:])
+            return list(range(start, len(log)))
+
+    def _index(self, log_id: str, messages: List[Message]):
+        indexes = self._indexes.get(log_id)
+        if not indexes:
+            return
+        for field, index in indexes.items():
+            for message in messages:
+                index.add(message, field)
+
+    def _get_index(
+        self, log_id: str, filters: MetadataFilter
+    ) -> Tuple[str, _FieldIndex]:
+        """Returns an index on one of the filter's fields, preferring one
+        that already exists over building one for the first field."""
+        indexes = self._indexes.setdefault(log_id, OrderedDict())
+        for field in filters:
+            index = indexes.get(field)
+            if index is not None:
+                indexes.move_to_end(field)
+                return field, index
+
+        field = next(iter(filters))
+        index = _FieldIndex()
+        for message in self._logs.get(log_id, []):
+            index.add(message, field)
+        indexes[field] = index
+        if len(indexes) > self.max_indexes:
+            indexes.popitem(last=False)
+        return field, index
+
     async def get_batch(
         self, log_id: str, start_index: int, limit: int
     ) -> List[Message]:
@@ -45,3 +168,26 @@ class InMemoryStorage(IMessageStorage):
             if start_index >= len(log):
                 return []
             return log[start_index : start_index + limit]
+
+    async def get_length(self, log_id: str) -> int:
+        return len(self._logs.get(log_id, ()))
+
+    async def get_batch_filtered(
+        self, log_id: str, start_index: int, limit: int, filters: MetadataFilter
+    ) -> List[Message]:
+        async with self._global_lock:
+            lock = self._get_lock(log_id)
+
+        async with lock:
+            log = self._logs.get(log_id, [])
+            # Walk one condition's index and check the rest directly.
+            field, index = self._get_index(log_id, filters)
+            candidates = index.ids_from(filters[field], start_index)
+            results = []
+            for mid in candidates:
+                message = log[mid]
+                if matches(message.metadata, filters):
+                    results.append(message)
+                    if len(results) >= limit:
+                        break
+            return results
@@ -0,0 +1,203 @@
+import asyncio
+import sqlite3
+from typing import Any, Dict, List, Optional
+import msgpack
+from mamamia.core.filters import MetadataFilter, matches
+from mamamia.core.interfaces import Entry, IMessageStorage
+from mamamia.core.models import Message
+from mamamia.server.sqlite import SqliteDatabase
+
+# Rows read per query while scanning for filtered messages.
+SCAN_BATCH = 1000
+
+
+class SqliteStorage(IMessageStorage):
+    """Messages in a SqliteDatabase, so logs survive a restart together with
+    the states and leases that refer to them.
+
+    Payloads and metadata are stored msgpack-encoded. Ids are handed out in
+    memory and appends are queued in id order, so a log's length only moves
+    past ids whose rows have been committed. Filtered reads scan the log
+    and match metadata in Python; there is no metadata index.
+    """
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+        # log_id -> next id to hand out, and the length readers may see
+        self._next: Dict[str, int] = {}
+        self._lengths: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _load(self, log_id: str):
+        if log_id in self._next:
+            return
+        lock = self._locks.setdefault(log_id, asyncio.Lock())
+        async with lock:
+            if log_id in self._next:
+                return
+
+            length = await self.db.read(lambda conn: _length(conn, log_id))
+            self._lengths[log_id] = length
+            self._next[log_id] = length
+
+    async def append(
+        self,
+        log_id: str,
+        payload: Any,
+        metadata: Optional[dict] = None,
+        key: Optional[str] = None,
+    ) -> int:
+        ids = await self.append_batch(log_id, [(payload, metadata, key)])
+        return ids[0]
+
+    async def append_batch(self, log_id: str, entries: List[Entry]) -> List[int]:
+        rows = [
+            (
+                msgpack.packb(payload),
+                None if metadata is None else msgpack.packb(metadata),
+                key,
+            )
+            for payload, metadata, key in entries
+        ]
+        await self._load(log_id)
+        # No await between reserving the ids and queueing the write (at the
+        # end of the transaction, inside one), so writes reach the database
+        # in id order.
+        start = self._next[log_id]
+        end = start + len(rows)
+        self._next[log_id] = end
+
+        def op(conn: sqlite3.Connection):
+            conn.executemany(
+                "INSERT INTO messages (log_id, message_id, payload, metadata, key) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(log_id, start + i, *row) for i, row in enumerate(rows)],
+            )
+
+        def publish():
+            self._lengths[log_id] = max(self._lengths[log_id], end)
+
+        def give_back():
+            # Hand the ids out again unless a later append already queued
+            if self._next[log_id] == end:
+                self._next[log_id] = start
+
+        await self.db.write(op, on_commit=publish, on_rollback=give_back)
+        return list(range(start, end))
+
+    async def get_batch(
+        self, log_id: str, start_index: int, limit: int
+    ) -> List[Message]:
+        await self._load(log_id)
+        end = min(start_index + limit, self._lengths[log_id])
+        if start_index >= end:
+            return []
+        return await self._read(log_id, start_index, end)
+
+    async def _read(self, log_id: str, start: int, end: int) -> List[Message]:
+        def op(conn: sqlite3.Connection) -> List[Message]:
+            rows = conn.execute(
+                "SELECT message_id, payload, metadata, key FROM messages "
+                "WHERE log_id = ? AND message_id >= ? AND message_id < ? "
+                "ORDER BY message_id",
+                (log_id, start, end),
+            )
+            return [
+                Message.model_construct(
+                    id=mid,
+                    log_id=log_id,
+                    payload=msgpack.unpackb(payload),
+                    metadata=None if metadata is None else msgpack.unpackb(metadata),
+                    key=key,
+                )
+                for mid, payload, metadata, key in rows
+            ]
+
+        return await self.db.read(op)
+
+    async def get_batch_filtered(
+        self, log_id: str, start_index: int, limit: int, filters: MetadataFilter
+    ) -> List[Message]:
+        await self._load(log_id)
+        length = self._lengths[log_id]
+        results: List[Message] = []
+        while start_index < length and len(results) < limit:
+            end = min(start_index + SCAN_BATCH, length)
+            for message in await self._read(log_id, start_index, end):
+                if matches(message.metadata, filters):
+                    results.append(message)
+                    if len(results) >= limit:
+                        break
+            start_index = end
+        return results
+
+    async def get_length(self, log_id: str) -> int:
+        await self._load(log_id)
+        return self._lengths[log_id]
+
+
+class SharedSqliteStorage(SqliteStorage):
+    """SqliteStorage for a database that several server processes append
+    to, e.g. the processes sharing a shared-memory arena.
+
+    Ids are allocated by the insert itself, so SQLite serializes appends
+    across processes and they commit in id order, and lengths are read from
+    the database every time instead of being cached. Appends need their
+    ids back, so they cannot join SqliteDatabase.transaction().
+    """
+
+    async def append_batch(self, log_id: str, entries: List[Entry]) -> List[int]:
+        rows = [
+            (
+                msgpack.packb(payload),
+                None if metadata is None else msgpack.packb(metadata),
+                key,
+            )
+            for payload, metadata, key in entries
+        ]
+
+        def op(conn: sqlite3.Connection) -> List[int]:
+            start = _length(conn, log_id)
+            conn.executemany(
+                "INSERT INTO messages (log_id, message_id, payload, metadata, key) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(log_id, start + i, *row) for i, row in enumerate(rows)],
+            )
+            return list(range(start, start + len(rows)))
+
+        ids = await self.db.write(op)
+        if ids is None:
+            raise RuntimeError("Shared SQLite appends cannot join a transaction")
+        return ids
+
+    async def get_batch(
+        self, log_id: str, start_index: int, limit: int
+    ) -> List[Message]:
+        if limit <= 0:
+            return []
+        return await self._read(log_id, start_index, start_index + limit)
+
+    async def get_batch_filtered(
+        self, log_id: str, start_index: int, limit: int, filters: MetadataFilter
+    ) -> List[Message]:
+        length = await self.get_length(log_id)
+        results: List[Message] = []
+        while start_index < length and len(results) < limit:
+            end = min(start_index + SCAN_BATCH, length)
+            for message in await self._read(log_id, start_index, end):
+                if matches(message.metadata, filters):
+                    results.append(message)
+                    if len(results) >= limit:
+                        break
+            start_index = end
+        return results
+
+    async def get_length(self, log_id: str) -> int:
+        return await self.db.read(lambda conn: _length(conn, log_id))
+
+
+def _length(conn: sqlite3.Connection, log_id: str) -> int:
+    row = conn.execute(
+        "SELECT MAX(message_id) FROM messages WHERE log_id = ?", (log_id,)
+    ).fetchone()
+    return 0 if row[0] is None else row[0] + 1
@@ -1,34 +1,256 @@
 import asyncio
 import logging
-from typing import Optional
-from mamamia.core.protocol import Command, read_message, pack_message
+import os
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+import msgpack
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from mamamia.core.protocol import (
+    MAX_MESSAGE_SIZE,
+    Command,
+    RawBody,
+    ResyncRequiredError,
+    ThrottledError,
+    read_message,
+    pack_message,
+)
+from mamamia.core.compression import (
+    Codec,
+    DEFAULT_COMPRESSION_THRESHOLD,
+    get_codec,
+    negotiate,
+)
+from mamamia.core.models import MessageState, ProduceQuota
+from mamamia.server.cache import FrameCache
+from mamamia.server.flow import QuotaBuckets
+from mamamia.server.orchestrator import strip_reserved
 from mamamia.server.registry import LogRegistry
+from mamamia.server.scheduling import FairScheduler, LogLatency
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on messages returned by a single paging request.
+MAX_PAGE_SIZE = 1000
+# Upper bound on change records returned by a single REPLICATE request.
+MAX_REPLICATION_BATCH = 10000
+
+# READ_RANGE limits: messages per batch, long-poll seconds, and the default
+# byte budget a reader gets per batch.
+MAX_READ_BATCH = 10000
+MAX_READ_WAIT = 30.0
+DEFAULT_READ_BYTES = 1024 * 1024
+# Upper bound on messages leased by a single ACQUIRE_BATCH request.
+MAX_ACQUIRE_BATCH = 1000
+# READ_BLOB chunk sizes: default and upper bound per request.
+DEFAULT_BLOB_CHUNK = 1024 * 1024
+MAX_BLOB_CHUNK = 4 * 1024 * 1024
+# Logs whose request latency is tracked; any log_id a client sends gets an
+# entry, so the least recently used are dropped past this.
+MAX_LATENCY_LOGS = 10000
+# Snapshot export limits: entries per EXPORT_LOG page, with the same byte
+# budget rules as READ_RANGE, and message ids per EXPORT_GROUP page.
+MAX_EXPORT_BATCH = 100000
+MAX_EXPORT_GROUP_PAGE = 100000
+
+# Commands a read-only follower refuses until it is promoted.
+WRITE_COMMANDS = frozenset(
+    {
+        Command.PRODUCE,
+        Command.PRODUCE_BATCH,
+        Command.ACQUIRE_NEXT,
+        Command.ACQUIRE_BATCH,
+        Command.SETTLE,
+        Command.SETTLE_BATCH,
+        Command.SETTLE_AND_PRODUCE,
+        Command.SETTLE_UP_TO,
+        Command.REPLAY_DLQ,
+        Command.COMMIT_OFFSET,
+        Command.IMPORT_LOG,
+        Command.IMPORT_GROUP,
+    }
+)
+
+# Commands queued by the fair scheduler and timed in per-log latency metrics.
+# Long-polling reads and replication are left out so they never hold a slot.
+SCHEDULED_COMMANDS = frozenset(
+    {
+        Command.PRODUCE,
+        Command.PRODUCE_BATCH,
+        Command.ACQUIRE_NEXT,
+        Command.ACQUIRE_BATCH,
+        Command.SETTLE,
+        Command.SETTLE_BATCH,
+        Command.SETTLE_AND_PRODUCE,
+        Command.SETTLE_UP_TO,
+        Command.COMMIT_OFFSET,
+        Command.READ_DLQ,
+        Command.REPLAY_DLQ,
+    }
+)
+
+
+def _dump(message) -> dict:
+    # Pydantic model to dict
+    data = message.model_dump() if hasattr(message, "model_dump") else message.dict()
+    # Pydantic turns a blob reference (a msgpack ExtType) into a plain tuple
+    if isinstance(message.payload, msgpack.ExtType):
+        data["payload"] = message.payload
+    # The server's own fields stay on the server
+    data["metadata"] = strip_reserved(data["metadata"])
+    return data
+
+
+def _fit_frame(records: list) -> list:
+    """Shrinks a batch of replication records until it fits in one frame."""
+    while len(records) > 1 and len(msgpack.packb(records)) > MAX_MESSAGE_SIZE // 2:
+        records = records[: len(records) // 2]
+    return records
+
+
+def _encode(message) -> bytes:
+    return msgpack.packb(_dump(message))
+
+
+def _pack_messages(field: str, encoded: list) -> RawBody:
+    """Splices already-encoded messages into a {field: [...]} response."""
+    packer = msgpack.Packer()
+    return RawBody(
+        packer.pack_map_header(1)
+        + packer.pack(field)
+        + packer.pack_array_header(len(encoded))
+        + b"".join(encoded)
+    )
+
+
+def _pack_range(
+    offset: int,
+    messages: list,
+    max_bytes: int,
+    encode: Optional[Callable[[Any], bytes]] = None,
+) -> RawBody:
+    """Encodes a READ_RANGE response, stopping at the reader's byte budget.
+
+    Messages are encoded once (with `encode`, default _encode) and spliced
+    into the response map, so the batch is never serialized twice. At
+    least one message is always sent.
+    """
+    encode = encode or _encode
+    max_bytes = min(max_bytes, MAX_MESSAGE_SIZE // 2)
+    encoded = []
+    size = 0
+    for message in messages:
+        chunk = encode(message)
+        if encoded and size + len(chunk) > max_bytes:
+            break
+        encoded.append(chunk)
+        size += len(chunk)
+
+    packer = msgpack.Packer()
+    return RawBody(
+        packer.pack_map_header(2)
+        + packer.pack("messages")
+        + packer.pack_array_header(len(encoded))
+        + b"".join(encoded)
+        + packer.pack("next_offset")
+        + packer.pack(offset + len(encoded))
+    )
+
+
+def _pack_entries(offset: int, messages: list, max_bytes: int) -> RawBody:
+    """Encodes an EXPORT_LOG page of [payload, metadata, key] entries.
+
+    Ids are implied by the offset, so entries carry nothing else. Stops at
+    the byte budget like _pack_range, always sending at least one entry.
+    The next offset follows the last entry sent, so a page may skip ids.
+    """
+    max_bytes = min(max_bytes, MAX_MESSAGE_SIZE // 2)
+    packer = msgpack.Packer()
+    encoded = []
+    size = 0
+    for message in messages:
+        chunk = packer.pack([message.payload, message.metadata, message.key])
+        if encoded and size + len(chunk) > max_bytes:
+            break
+        encoded.append(chunk)
+        size += len(chunk)
+
+    return RawBody(
+        packer.pack_map_header(2)
+        + packer.pack("entries")
+        + packer.pack_array_header(len(encoded))
+        + b"".join(encoded)
+        + packer.pack("next_offset")
+        + packer.pack(messages[len(encoded) - 1].id + 1 if encoded else offset)
+    )
+
 
 class TcpFrontend:
-    def __init__(self, registry: LogRegistry, host: str = "0.0.0.0", port: int = 9000):
+    def __init__(
+        self,
+        registry: LogRegistry,
+        host: str = "0.0.0.0",
+        port: int = 9000,
+        compression: bool = True,
+        compression_threshold: int = DEFAULT_COMPRESSION_THRESHOLD,
+        connection_quota: Optional[ProduceQuota] = None,
+        unix_path: Optional[str] = None,
+        scheduler: Optional[FairScheduler] = None,
+        frame_cache: Optional[FrameCache] = None,
+    ):
         self.registry = registry
         self.host = host
         self.port = port
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        # Produce quota applied to each connection separately.
+        self.connection_quota = connection_quota
+        # Also serve the same protocol on a Unix domain socket at this path.
+        self.unix_path = unix_path
+        # Weighted fair queuing of requests across logs; None runs every
+        # request as soon as it arrives.
+        self.scheduler = scheduler
+        self.latency: "OrderedDict[str, LogLatency]" = OrderedDict()
+        # Encoded messages shared by every connection and consumer group.
+        self.frame_cache = frame_cache
         self._server: Optional[asyncio.Server] = None
+        self._unix_server: Optional[asyncio.Server] = None
 
     async def handle_client(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
     ):
         addr = writer.get_extra_info("peername")
         logger.debug(f"New connection from {addr}")
+        # Negotiated per connection by HANDSHAKE; frames are plain until then.
+        codec: Optional[Codec] = None
+        quota: Optional[QuotaBuckets] = None
+        if self.connection_quota is not None:
+            quota = QuotaBuckets(self.connection_quota)
 
         try:
             while True:
                 try:
-                    version, command, body = await read_message(reader)
+                    version, command, body = await read_message(reader, codec)
                 except asyncio.IncompleteReadError:
                     break
+                arrived = time.perf_counter()
+
+                if command == Command.HANDSHAKE:
+                    response_body, new_codec = self.handshake(body)
+                    # The handshake reply itself is never compressed.
+                    writer.write(pack_message(command, response_body))
+                    await writer.drain()
+                    codec = new_codec
+                    continue
 
-                response_body = await self.process_command(command, body)
-                writer.write(pack_message(command, response_body))
+                response_body = await self.process_command(
+                    command, body, quota, arrived
+                )
+                writer.write(
+                    pack_message(
+                        command, response_body, codec, self.compression_threshold
+                    )
+                )
                 await writer.drain()
         except Exception as e:
             logger.error(f"Error handling client {addr}: {e}")
@@ -36,30 +258,231 @@ class TcpFrontend:
             writer.close()
             await writer.wait_closed()
 
-    async def process_command(self, command: int, body: dict) -> dict:
+    def _encode(self, message) -> bytes:
+        if self.frame_cache is None:
+            return _encode(message)
+        return self.frame_cache.get(
+            message.log_id, message.id, lambda: _encode(message)
+        )
+
+    def handshake(self, body: dict) -> Tuple[dict, Optional[Codec]]:
+        """Picks a compression codec from the client's offer."""
+        name = None
+        if self.compression:
+            name = negotiate(body.get("codecs") or [])
+        return {"codec": name}, get_codec(name)
+
+    async def process_command(
+        self,
+        command: int,
+        body: dict,
+        quota: Optional[QuotaBuckets] = None,
+        arrived: Optional[float] = None,
+    ) -> Union[dict, RawBody]:
+        """Runs a request, through the fair scheduler if there is one.
+
+        `arrived` is the perf_counter() time its frame was read (default
+        now); queue latency is measured from it.
+        """
+        if command not in SCHEDULED_COMMANDS or not isinstance(body, dict):
+            return await self._execute(command, body, quota)
+        log_id = body.get("log_id")
+        if not isinstance(log_id, str):
+            return await self._execute(command, body, quota)
+
+        latency = self._latency(log_id)
+        if arrived is None:
+            arrived = time.perf_counter()
+
+        async def run() -> Union[dict, RawBody]:
+            started = time.perf_counter()
+            response = await self._execute(command, body, quota)
+            latency.queued.record(started - arrived)
+            latency.service.record(time.perf_counter() - started)
+            return response
+
+        if self.scheduler is None:
+            return await run()
+        return await self.scheduler.submit(log_id, run)
+
+    def _latency(self, log_id: str) -> LogLatency:
+        latency = self.latency.get(log_id)
+        if latency is None:
+            latency = self.latency[log_id] = LogLatency()
+            if len(self.latency) > MAX_LATENCY_LOGS:
+                self.latency.popitem(last=False)
+        else:
+            self.latency.move_to_end(log_id)
+        return latency
+
+    async def _execute(
+        self, command: int, body: dict, quota: Optional[QuotaBuckets] = None
+    ) -> Union[dict, RawBody]:
         try:
+            if self.registry.read_only and command in WRITE_COMMANDS:
+                return {"error": "Server is a read-only follower; use the leader"}
+
             if command == Command.PRODUCE:
                 log_id = body["log_id"]
-                storage = self.registry.get_storage()
-                msg_id = await storage.append(
-                    log_id, body["payload"], body.get("metadata")
-                )
+                acks = body.get("acks", "leader")
+                if acks == "all" and self.registry.feed is None:
+                    raise ValueError("acks='all' requires replication on this server")
+                deliver_at = body.get("deliver_at")
+                if body.get("delay"):
+                    deliver_at = time.time() + body["delay"]
+                orch = self.registry.get_orchestrator(log_id)
+                flow = self.registry.flow
+                size = 0
+                if flow.counts_bytes(log_id, quota):
+                    size = len(msgpack.packb(body))
+                async with flow.admit(log_id, orch, 1, size, quota):
+                    msg_id = await orch.produce(
+                        log_id,
+                        body["payload"],
+                        body.get("metadata"),
+                        deliver_at,
+                        producer_id=body.get("producer_id"),
+                        sequence=body.get("sequence"),
+                        key=body.get("key"),
+                        ttl=body.get("ttl"),
+                    )
+                    if acks == "all":
+                        await self.registry.feed.wait_acked(
+                            self.registry.feed.next_seq, body.get("ack_timeout", 5.0)
+                        )
+                if msg_id is None:
+                    return {"message_id": None, "deliver_at": deliver_at}
                 return {"message_id": msg_id}
 
+            elif command == Command.PRODUCE_BATCH:
+                log_id = body["log_id"]
+                acks = body.get("acks", "leader")
+                if acks == "all" and self.registry.feed is None:
+                    raise ValueError("acks='all' requires replication on this server")
+                entries = [
+                    (m["payload"], m.get("metadata"), m.get("key"))
+                    for m in body["messages"]
+                ]
+                orch = self.registry.get_orchestrator(log_id)
+                flow = self.registry.flow
+                size = 0
+                if flow.counts_bytes(log_id, quota):
+                    size = len(msgpack.packb(body))
+                async with flow.admit(log_id, orch, len(entries), size, quota):
+                    msg_ids = await orch.produce_batch(
+                        log_id,
+                        entries,
+                        producer_id=body.get("producer_id"),
+                        sequence=body.get("sequence"),
+                        ttl=body.get("ttl"),
+                    )
+                    if acks == "all":
+                        await self.registry.feed.wait_acked(
+                            self.registry.feed.next_seq, body.get("ack_timeout", 5.0)
+                        )
+                return {"message_ids": msg_ids}
+
             elif command == Command.ACQUIRE_NEXT:
                 log_id = body["log_id"]
                 group_id = body["group_id"]
                 orch = self.registry.get_orchestrator(log_id)
                 message = await orch.acquire_next(
-                    log_id, group_id, body["client_id"], body.get("duration", 30.0)
+                    log_id,
+                    group_id,
+                    body["client_id"],
+                    body.get("duration", 30.0),
+                    filters=body.get("filter"),
                 )
                 if not message:
                     return {"message": None}
-                # Pydantic model to dict
+                packer = msgpack.Packer()
+                return RawBody(
+                    packer.pack_map_header(1)
+                    + packer.pack("message")
+                    + self._encode(message)
+                )
+
+            elif command == Command.ACQUIRE_BATCH:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                messages = await orch.acquire_batch(
+                    log_id,
+                    body["group_id"],
+                    body["client_id"],
+                    body.get("duration", 30.0),
+                    min(body.get("max_messages", 100), MAX_ACQUIRE_BATCH),
+                    filters=body.get("filter"),
+                )
+                return _pack_messages(
+                    "messages", [self._encode(m) for m in messages]
+                )
+
+            elif command == Command.SETTLE_BATCH:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                settlements = body["settlements"]
+                errors = await orch.settle_batch(
+                    log_id,
+                    body["group_id"],
+                    body["client_id"],
+                    [
+                        (s["message_id"], s["success"], s.get("error"))
+                        for s in settlements
+                    ],
+                )
+                return {
+                    "settled": len(settlements) - len(errors),
+                    "errors": [
+                        {"message_id": mid, "error": error}
+                        for mid, error in errors.items()
+                    ],
+                }
+
+            elif command == Command.SETTLE_AND_PRODUCE:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                settlements = body["settlements"]
+                outputs = [
+                    (
+                        self.registry.get_orchestrator(output["log_id"]),
+                        output["log_id"],
+                        [
+                            (m["payload"], m.get("metadata"), m.get("key"))
+                            for m in output["messages"]
+                        ],
+                    )
+                    for output in body["outputs"]
+                ]
+                # Every output log admits its messages before anything is
+                # appended, so a throttled request appends and settles nothing.
+                flow = self.registry.flow
+                async with AsyncExitStack() as admitted:
+                    for target, target_log, entries in outputs:
+                        size = 0
+                        if flow.counts_bytes(target_log, quota):
+                            size = len(msgpack.packb(entries))
+                        await admitted.enter_async_context(
+                            flow.admit(target_log, target, len(entries), size, quota)
+                        )
+                    message_ids, errors = await orch.settle_and_produce(
+                        log_id,
+                        body["group_id"],
+                        body["client_id"],
+                        [
+                            (s["message_id"], s["success"], s.get("error"))
+                            for s in settlements
+                        ],
+                        outputs,
+                        producer_id=body.get("producer_id"),
+                        sequence=body.get("sequence"),
+                    )
                 return {
-                    "message": message.model_dump()
-                    if hasattr(message, "model_dump")
-                    else message.dict()
+                    "settled": len(settlements) - len(errors),
+                    "message_ids": message_ids,
+                    "errors": [
+                        {"message_id": mid, "error": error}
+                        for mid, error in errors.items()
+                    ],
                 }
 
             elif command == Command.SETTLE:
@@ -72,10 +495,180 @@ class TcpFrontend:
                     body["message_id"],
                     body["client_id"],
                     body["success"],
+                    error=body.get("error"),
                 )
                 return {"status": "settled"}
 
+            elif command == Command.SETTLE_UP_TO:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                settled, base_offset = await orch.settle_up_to(
+                    log_id, body["group_id"], body["client_id"], body["offset"]
+                )
+                return {"settled": settled, "base_offset": base_offset}
+
+            elif command == Command.READ_DLQ:
+                log_id = body["log_id"]
+                offset = body.get("offset", 0)
+                limit = min(body.get("limit", 100), MAX_PAGE_SIZE)
+                orch = self.registry.get_orchestrator(log_id)
+                messages = await orch.read_dead_letters(log_id, offset, limit)
+                return {
+                    "messages": [_dump(m) for m in messages],
+                    "next_offset": offset + len(messages),
+                }
+
+            elif command == Command.REPLAY_DLQ:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                replayed = await orch.replay_dead_letters(
+                    log_id,
+                    body["start"],
+                    body["end"],
+                    get_orchestrator=self.registry.get_orchestrator,
+                )
+                return {"replayed": replayed}
+
+            elif command == Command.REPLICATE:
+                feed = self.registry.feed
+                if feed is None:
+                    raise ValueError("Replication is not enabled on this server")
+                from_seq = body["from_seq"]
+                feed.check(body.get("feed_id"), from_seq)
+                # Asking for from_seq acknowledges every record before it.
+                feed.ack(body["follower_id"], from_seq)
+                await feed.wait_for_records(from_seq, body.get("wait", 0.0))
+                records = feed.read(
+                    from_seq, min(body.get("limit", 1000), MAX_REPLICATION_BATCH)
+                )
+                records = _fit_frame(records)
+                return {
+                    "records": records,
+                    "next_seq": from_seq + len(records),
+                    "feed_id": feed.feed_id,
+                }
+
+            elif command == Command.READ_RANGE:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                offset, messages = await orch.read_range(
+                    log_id,
+                    body["group_id"],
+                    body.get("offset"),
+                    min(body.get("limit", 1000), MAX_READ_BATCH),
+                    min(body.get("wait", 0.0), MAX_READ_WAIT),
+                )
+                return _pack_range(
+                    offset,
+                    messages,
+                    body.get("max_bytes", DEFAULT_READ_BYTES),
+                    self._encode,
+                )
+
+            elif command == Command.COMMIT_OFFSET:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                await orch.commit_offset(log_id, body["group_id"], body["offset"])
+                return {"status": "committed"}
+
+            elif command == Command.STATS:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                group_ids = body.get("group_ids")
+                if group_ids is None:
+                    group_ids = orch.groups()
+                latency = self.latency.get(log_id) or LogLatency()
+                return {
+                    "groups": {
+                        group_id: await orch.stats(log_id, group_id)
+                        for group_id in group_ids
+                    },
+                    "latency": latency.summary(),
+                    "frame_cache": self.frame_cache.stats()
+                    if self.frame_cache is not None
+                    else None,
+                }
+
+            elif command == Command.EXPORT_LOG:
+                log_id = body["log_id"]
+                offset = body.get("offset", 0)
+                limit = min(body.get("limit", 10000), MAX_EXPORT_BATCH)
+                if body.get("scheduled"):
+                    orch = self.registry.get_orchestrator(log_id)
+                    messages = await orch.export_scheduled(log_id, offset, limit)
+                else:
+                    storage = self.registry.get_storage()
+                    messages = await storage.get_batch(log_id, offset, limit)
+                return _pack_entries(
+                    offset, messages, body.get("max_bytes", DEFAULT_READ_BYTES)
+                )
+
+            elif command == Command.EXPORT_GROUP:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                base_offset, next_offset, states, retries = await orch.export_group(
+                    log_id,
+                    body["group_id"],
+                    body.get("offset"),
+                    min(body.get("limit", 10000), MAX_EXPORT_GROUP_PAGE),
+                )
+                return {
+                    "base_offset": base_offset,
+                    "next_offset": next_offset,
+                    "states": {state.value: ids for state, ids in states.items()},
+                    "retries": [[mid, count] for mid, count in retries.items()],
+                }
+
+            elif command == Command.IMPORT_LOG:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                # [payload, metadata, key] lists unpack just like Entry tuples
+                if body.get("scheduled"):
+                    length = await orch.import_scheduled(
+                        log_id, body["offset"], body["entries"]
+                    )
+                else:
+                    length = await orch.import_entries(
+                        log_id, body["offset"], body["entries"]
+                    )
+                return {"next_offset": length}
+
+            elif command == Command.IMPORT_GROUP:
+                log_id = body["log_id"]
+                orch = self.registry.get_orchestrator(log_id)
+                await orch.import_group(
+                    log_id,
+                    body["group_id"],
+                    body["base_offset"],
+                    {
+                        MessageState(state): ids
+                        for state, ids in body.get("states", {}).items()
+                    },
+                    dict(body.get("retries", [])),
+                )
+                return {"status": "imported"}
+
+            elif command == Command.READ_BLOB:
+                blobs = self.registry.blobs
+                if blobs is None:
+                    raise ValueError("Blob storage is not enabled on this server")
+                digest = body["digest"]
+                data = await blobs.read(
+                    digest,
+                    body.get("offset", 0),
+                    min(body.get("length", DEFAULT_BLOB_CHUNK), MAX_BLOB_CHUNK),
+                )
+                return {"data": data, "size": blobs.size(digest)}
+
+            elif command == Command.PROMOTE:
+                await self.registry.promote()
+                return {"status": "promoted"}
+
             return {"error": f"Unknown command: {command}"}
+        except ThrottledError as e:
+            return {"error": str(e), "retry_after": e.retry_after}
+        except ResyncRequiredError as e:
+            return {"error": str(e), "resync": True}
         except Exception as e:
             logger.exception("Error processing command")
             return {"error": str(e)}
@@ -86,10 +679,29 @@ class TcpFrontend:
         )
         addr = self._server.sockets[0].getsockname()
         logger.info(f"TCP Frontend serving on {addr}")
-        async with self._server:
-            await self._server.serve_forever()
+        servers = [self._server]
+
+        if self.unix_path:
+            # A socket file left behind by an unclean shutdown blocks bind()
+            if os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
+            self._unix_server = await asyncio.start_unix_server(
+                self.handle_client, self.unix_path
+            )
+            logger.info(f"Unix socket Frontend serving on {self.unix_path}")
+            servers.append(self._unix_server)
+
+        await asyncio.gather(*(server.serve_forever() for server in servers))
 
     async def stop(self):
         if self._server:
             self._server.close()
             await self._server.wait_closed()
+        if self.scheduler is not None:
+            await self.scheduler.close()
+        if self._unix_server:
+            self._unix_server.close()
+            await self._unix_server.wait_closed()
+            self._unix_server = None
+            if self.unix_path and os.path.exists(self.unix_path):
+                os.unlink(self.unix_path)
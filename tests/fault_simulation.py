@@ -0,0 +1,507 @@
+"""Deterministic fault-injection simulation of a consumer group.
+
+    python tests/fault_simulation.py --seed 7 --crash-rate 0.02 --drop-every 0.5
+
+The server, producer and consumers run in one event loop on a virtual
+clock: sleeps, timeouts, leases and retry backoffs take no real time, and
+the loop jumps straight to the next timer whenever nothing is runnable.
+Connections are in-memory pipes into `TcpFrontend.handle_client`, opened
+through `TcpTransport._open_connection`, so a dropped connection goes
+through the transport's real reconnect-and-retry path. Every random choice
+comes from one seeded generator, so a seed reproduces the run exactly; the
+trace digest at the end makes that checkable (`--verify`).
+
+Injected faults:
+- consumer crashes mid-message (the message is abandoned, the consumer
+  restarts later with a new client id),
+- dropped connections (both ends see EOF),
+- slow handlers that may outlive their lease,
+- handler failures (settled as failed, so retries and backoff kick in),
+- forward jumps of the server's wall clock, which expire leases early.
+
+The report gives throughput, delivery and duplicate counts, and the
+distribution of redelivery latency per cause: how long after a message
+was lost (crash, failure, or lease expiry) it was handed out again.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import selectors
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from unittest import mock
+from mamamia.core.models import RetryPolicy
+from mamamia.server.registry import BACKENDS, LogRegistry
+from mamamia.server.tcp import TcpFrontend
+from mamamia.client.transport import TcpTransport
+from mamamia.client.producer import ProducerClient
+from mamamia.client.consumer import ConsumerClient
+
+LOG = "sim"
+GROUP = "workers"
+# Virtual wall clock at the start of every run.
+EPOCH = 1_700_000_000.0
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+        # Offset of the server's wall clock, stepped by clock-jump faults.
+        self.skew = 0.0
+
+    def wall(self) -> float:
+        return EPOCH + self.now + self.skew
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    """Never waits: a blocking select means every task is waiting on a
+    timer, so the clock jumps to it."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Simulation deadlocked: nothing left to run")
+        self.clock.now += max(timeout, 0.0)
+        return []
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        super().__init__(_VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self) -> float:
+        return self.clock.now
+
+
+class _PipeWriter:
+    """Write end of an in-memory connection: bytes go straight into the
+    peer's StreamReader."""
+
+    def __init__(self, peer: asyncio.StreamReader, name: str):
+        self._peer = peer
+        self._name = name
+        self.closed = False
+
+    def write(self, data: bytes):
+        if not self.closed:
+            self._peer.feed_data(data)
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._peer.feed_eof()
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name: str, default=None):
+        return self._name if name == "peername" else default
+
+
+class SimNetwork:
+    """Connects clients to the frontend over in-memory pipes and can cut
+    any open connection."""
+
+    def __init__(self, frontend: TcpFrontend):
+        self.frontend = frontend
+        self.connections: List[Tuple[_PipeWriter, _PipeWriter]] = []
+        self.opened = 0
+        self.dropped = 0
+        self._server_tasks: List[asyncio.Task] = []
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, _PipeWriter]:
+        self.opened += 1
+        name = f"sim-{self.opened}"
+        client_reader = asyncio.StreamReader()
+        server_reader = asyncio.StreamReader()
+        client_writer = _PipeWriter(server_reader, name)
+        server_writer = _PipeWriter(client_reader, name)
+        self.connections.append((client_writer, server_writer))
+        self._server_tasks.append(
+            asyncio.create_task(
+                self.frontend.handle_client(server_reader, server_writer)  # type: ignore[arg-type]
+            )
+        )
+        return client_reader, client_writer
+
+    def drop(self, rng: random.Random) -> bool:
+        """Cuts a random open connection; both ends read EOF."""
+        self.connections = [
+            c for c in self.connections if not (c[0].closed and c[1].closed)
+        ]
+        if not self.connections:
+            return False
+        client_writer, server_writer = self.connections.pop(
+            rng.randrange(len(self.connections))
+        )
+        client_writer.close()
+        server_writer.close()
+        self.dropped += 1
+        return True
+
+    async def close(self):
+        for client_writer, server_writer in self.connections:
+            client_writer.close()
+            server_writer.close()
+        await asyncio.gather(*self._server_tasks, return_exceptions=True)
+
+
+class SimTransport(TcpTransport):
+    def __init__(self, network: SimNetwork):
+        super().__init__("sim", 0, timeout=30.0)
+        self.network = network
+
+    async def _open_connection(self):
+        return await self.network.connect()  # type: ignore[return-value]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+class Simulation:
+    def __init__(self, args: argparse.Namespace, clock: VirtualClock):
+        self.args = args
+        self.clock = clock
+        self.rng = random.Random(args.seed)
+        self.trace = hashlib.sha256()
+        self.deliveries: Counter = Counter()
+        self.handled: Counter = Counter()  # successful handler runs
+        # message id -> (time it was lost, cause) while waiting to come back
+        self.lost: Dict[int, Tuple[float, str]] = {}
+        self.lease_end: Dict[int, float] = {}
+        self.redelivery: Dict[str, List[float]] = {
+            "crash": [],
+            "failure": [],
+            "lease_expired": [],
+        }
+        self.crashes = 0
+        self.failures = 0
+        self.request_errors = 0
+        self.settle_errors = 0
+        self.clock_jumps = 0
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def record(self, *event):
+        self.trace.update(repr((round(self.clock.now, 9),) + event).encode())
+
+    # Consumer-side bookkeeping
+
+    def on_delivery(self, message_id: int, client_id: str):
+        now = self.clock.now
+        self.deliveries[message_id] += 1
+        if self.deliveries[message_id] > 1:
+            lost = self.lost.pop(message_id, None)
+            if lost is None:
+                # Nobody gave it up: the previous holder's lease ran out
+                lost = (self.lease_end.get(message_id, now), "lease_expired")
+            self.redelivery[lost[1]].append(max(0.0, now - lost[0]))
+        self.lease_end[message_id] = now + self.args.lease
+        self.record("deliver", message_id, client_id)
+
+    def on_crash(self, message_id: int, client_id: str):
+        self.crashes += 1
+        self.lost[message_id] = (self.clock.now, "crash")
+        self.record("crash", message_id, client_id)
+
+    def on_handled(self, message_id: int, client_id: str, success: bool):
+        if success:
+            self.handled[message_id] += 1
+        else:
+            self.failures += 1
+            self.lost[message_id] = (self.clock.now, "failure")
+        self.record("handled", message_id, client_id, success)
+
+    # Actors
+
+    async def produce(self, network: SimNetwork):
+        producer = ProducerClient(
+            SimTransport(network), LOG, producer_id="sim-producer"
+        )
+        for n in range(self.args.messages):
+            while True:
+                try:
+                    await producer.send({"n": n})
+                    break
+                except Exception:
+                    self.request_errors += 1
+                    await asyncio.sleep(0.01)
+            await asyncio.sleep(self.rng.expovariate(self.args.produce_rate))
+        await producer.close()
+
+    async def consume(self, network: SimNetwork, index: int):
+        incarnation = 0
+        while not self.done.is_set():
+            client_id = f"c{index}.{incarnation}"
+            consumer = ConsumerClient(SimTransport(network), LOG, GROUP, client_id)
+            crashed = await self._run_consumer(consumer, client_id)
+            await consumer.close()
+            if crashed:
+                await asyncio.sleep(self.args.restart_delay)
+                incarnation += 1
+
+    async def _run_consumer(self, consumer: ConsumerClient, client_id: str) -> bool:
+        args = self.args
+        while not self.done.is_set():
+            try:
+                msg = await consumer.acquire_next(duration=args.lease)
+            except Exception:
+                self.request_errors += 1
+                await asyncio.sleep(args.poll_interval)
+                continue
+            if msg is None:
+                await asyncio.sleep(args.poll_interval)
+                continue
+
+            message_id = msg["id"]
+            self.on_delivery(message_id, client_id)
+            work = self.rng.expovariate(1.0 / args.handler_time)
+            if self.rng.random() < args.slow_rate:
+                work *= args.slow_factor
+            if self.rng.random() < args.crash_rate:
+                await asyncio.sleep(work * self.rng.random())
+                self.on_crash(message_id, client_id)
+                return True
+            await asyncio.sleep(work)
+
+            success = self.rng.random() >= args.fail_rate
+            self.on_handled(message_id, client_id, success)
+            try:
+                await consumer.settle(message_id, success)
+            except Exception:
+                # Lease lost to another consumer, or the retry failed too
+                self.settle_errors += 1
+        return False
+
+    async def drop_connections(self, network: SimNetwork):
+        while not self.done.is_set():
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.args.drop_every))
+            if network.drop(self.rng):
+                self.record("drop")
+
+    async def jump_clock(self):
+        while not self.done.is_set():
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.args.jump_every))
+            self.clock.skew += self.args.clock_jump
+            self.clock_jumps += 1
+            self.record("jump", self.clock.skew)
+
+    async def watch(self, registry: LogRegistry):
+        """Ends the run once every message is processed or dead."""
+        orch = registry.get_orchestrator(LOG)
+        while True:
+            await asyncio.sleep(0.1)
+            stats = await orch.stats(LOG, GROUP)
+            if stats["head"] == self.args.messages and stats["lag"] == 0:
+                self.finished_at = self.clock.now
+                self.dead = stats["dead"]
+                self.done.set()
+                return
+
+    async def run(self) -> dict:
+        args = self.args
+        registry = LogRegistry(
+            default_retry_policy=RetryPolicy(
+                max_retries=args.max_retries, base_delay=args.retry_delay
+            ),
+            backend=args.backend,
+        )
+        registry.start_reaper(interval=args.reaper_interval)
+        frontend = TcpFrontend(registry)
+        network = SimNetwork(frontend)
+        self.dead = 0
+
+        tasks = [asyncio.create_task(self.produce(network))]
+        tasks += [
+            asyncio.create_task(self.consume(network, i))
+            for i in range(args.consumers)
+        ]
+        if args.drop_every > 0:
+            tasks.append(asyncio.create_task(self.drop_connections(network)))
+        if args.jump_every > 0 and args.clock_jump > 0:
+            tasks.append(asyncio.create_task(self.jump_clock()))
+
+        try:
+            await asyncio.wait_for(self.watch(registry), args.max_time)
+        except asyncio.TimeoutError:
+            pass
+        self.done.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await network.close()
+        await registry.close()
+        return self.report(network)
+
+    def report(self, network: SimNetwork) -> dict:
+        elapsed = self.finished_at if self.finished_at is not None else self.clock.now
+        processed = len(self.handled)
+        return {
+            "seed": self.args.seed,
+            "completed": self.finished_at is not None,
+            "virtual_seconds": elapsed,
+            "messages": self.args.messages,
+            "processed": processed,
+            "dead": self.dead,
+            "throughput": processed / elapsed if elapsed else 0.0,
+            "deliveries": sum(self.deliveries.values()),
+            "redeliveries": sum(n - 1 for n in self.deliveries.values()),
+            "duplicate_processing": sum(n - 1 for n in self.handled.values()),
+            "crashes": self.crashes,
+            "handler_failures": self.failures,
+            "connections_opened": network.opened,
+            "connections_dropped": network.dropped,
+            "request_errors": self.request_errors,
+            "settle_errors": self.settle_errors,
+            "clock_jumps": self.clock_jumps,
+            "redelivery_latency": {
+                cause: percentiles(values)
+                for cause, values in self.redelivery.items()
+            },
+            "trace_digest": self.trace.hexdigest(),
+        }
+
+
+def simulate(args: argparse.Namespace) -> dict:
+    clock = VirtualClock()
+    loop = VirtualLoop(clock)
+    # The server and clients read wall and monotonic time from the module
+    with mock.patch("time.time", clock.wall), mock.patch(
+        "time.monotonic", clock.monotonic
+    ):
+        random.seed(args.seed)  # retry jitter uses the global generator
+        try:
+            return loop.run_until_complete(Simulation(args, clock).run())
+        finally:
+            loop.close()
+
+
+def print_report(report: dict):
+    for name, value in report.items():
+        if name == "redelivery_latency":
+            continue
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        print(f"{name:<22} {value}")
+    print()
+    print(f"{'Redelivery after':<16} {'count':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for cause, stats in report["redelivery_latency"].items():
+        if not stats["count"]:
+            print(f"{cause:<16} {0:>6}")
+            continue
+        print(
+            f"{cause:<16} {stats['count']:>6} {stats['p50']:>8.3f} "
+            f"{stats['p90']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mamamia fault-injection simulation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--consumers", type=int, default=8)
+    parser.add_argument(
+        "--produce-rate", type=float, default=500.0, help="Messages per second"
+    )
+    parser.add_argument("--lease", type=float, default=2.0, help="Lease seconds")
+    parser.add_argument(
+        "--handler-time", type=float, default=0.02, help="Mean handler seconds"
+    )
+    parser.add_argument("--slow-rate", type=float, default=0.01)
+    parser.add_argument(
+        "--slow-factor", type=float, default=200.0, help="Slow handler multiplier"
+    )
+    parser.add_argument("--crash-rate", type=float, default=0.01)
+    parser.add_argument("--restart-delay", type=float, default=1.0)
+    parser.add_argument("--fail-rate", type=float, default=0.02)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--retry-delay", type=float, default=0.1)
+    parser.add_argument(
+        "--drop-every",
+        type=float,
+        default=1.0,
+        help="Mean seconds between dropped connections (0 disables)",
+    )
+    parser.add_argument(
+        "--jump-every",
+        type=float,
+        default=0.0,
+        help="Mean seconds between server clock jumps (0 disables)",
+    )
+    parser.add_argument(
+        "--clock-jump", type=float, default=1.0, help="Seconds per clock jump"
+    )
+    # The sqlite backend commits on its own threads, outside the virtual loop.
+    parser.add_argument(
+        "--backend",
+        choices=[b for b in BACKENDS if b != "sqlite"],
+        default="memory",
+        help="State and lease backend",
+    )
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--reaper-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--max-time", type=float, default=3600.0, help="Virtual seconds before giving up"
+    )
+    parser.add_argument("--json", help="Also write the report to this path")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Run twice and check the runs are identical",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    started = time.perf_counter()
+    report = simulate(args)
+    print_report(report)
+    print(f"\n(real time {time.perf_counter() - started:.2f}s)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    assert report["completed"], "Simulation did not finish within --max-time"
+    assert report["processed"] + report["dead"] == args.messages
+
+    if args.verify:
+        again = simulate(args)
+        assert again == report, "Same seed produced a different run"
+        print("Verified: a second run with the same seed is identical")
+
+
+if __name__ == "__main__":
+    main()
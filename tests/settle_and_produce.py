@@ -0,0 +1,134 @@
+"""Checks that SETTLE_AND_PRODUCE appends and settles all or nothing.
+
+    python tests/settle_and_produce.py
+
+A consumer on a SQLite-backed server leases an input and settles it while
+producing an output. The state store is rigged so the settle's write fails
+inside the database, after every precondition (lease, metadata, flow
+control) has passed. The request must fail with no output appended, even
+after a restart, nothing sent to followers, and the input still leased and
+settleable. A
+second round checks that an expired lease is refused before anything is
+written, on every backend.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from mamamia.client.consumer import ConsumerClient
+from mamamia.client.inprocess import InProcessTransport
+from mamamia.client.producer import ProducerClient
+from mamamia.core.models import MessageState
+from mamamia.server.registry import BACKENDS, LogRegistry
+from mamamia.server.tcp import TcpFrontend
+
+INPUT_LOG = "orders"
+OUTPUT_LOG = "invoices"
+GROUP = "billing"
+
+
+def fail_state_writes(registry: LogRegistry):
+    """Makes the next state update fail inside the database, not before."""
+    state_store = registry.get_state_store()
+    # Under the replication wrapper, which must not record the write either
+    state_store = getattr(state_store, "inner", state_store)
+    db = state_store.db
+    original = state_store.set_message_states
+
+    async def set_message_states(log_id, group_id, message_ids, state):
+        def op(conn: sqlite3.Connection):
+            raise sqlite3.OperationalError("injected failure")
+
+        state_store.set_message_states = original
+        await db.write(op)
+
+    state_store.set_message_states = set_message_states
+
+
+async def check_rollback(path: str):
+    registry = LogRegistry(backend="sqlite", sqlite_path=path, replicate=True)
+    transport = InProcessTransport(TcpFrontend(registry))
+    producer = ProducerClient(transport, INPUT_LOG)
+    await producer.send({"order": 1})
+    consumer = ConsumerClient(transport, INPUT_LOG, GROUP, "worker-1")
+    msg = await consumer.acquire_next(duration=30.0)
+    assert msg is not None
+
+    replicated = registry.feed.next_seq
+    fail_state_writes(registry)
+    try:
+        await consumer.settle_and_produce(
+            [{"message_id": msg["id"], "success": True}],
+            {OUTPUT_LOG: [{"payload": {"invoice": 1}}]},
+        )
+    except Exception as e:
+        print(f"[Rollback] Request failed as injected: {e}")
+    else:
+        raise AssertionError("The injected failure did not fail the request")
+
+    orch = registry.get_orchestrator(INPUT_LOG)
+    assert await registry.get_storage().get_length(OUTPUT_LOG) == 0
+    assert registry.feed.next_seq == replicated
+    assert (
+        await registry.get_state_store().get_message_state(INPUT_LOG, GROUP, msg["id"])
+        == MessageState.IN_PROGRESS
+    )
+    lease = await orch.lease_manager.get_lease(INPUT_LOG, GROUP, msg["id"])
+    assert lease is not None and lease.owner_id == "worker-1"
+    await registry.close()
+
+    # Nothing was committed either
+    registry = LogRegistry(backend="sqlite", sqlite_path=path)
+    assert await registry.get_storage().get_length(OUTPUT_LOG) == 0
+    transport = InProcessTransport(TcpFrontend(registry))
+    consumer = ConsumerClient(transport, INPUT_LOG, GROUP, "worker-1")
+    result = await consumer.settle_and_produce(
+        [{"message_id": msg["id"], "success": True}],
+        {OUTPUT_LOG: [{"payload": {"invoice": 1}}]},
+    )
+    assert result["message_ids"] == {OUTPUT_LOG: [0]}, result
+    stats = await registry.get_orchestrator(INPUT_LOG).stats(INPUT_LOG, GROUP)
+    assert stats["processed"] == 1, stats
+    print("[Rollback] Retried request appended and settled once")
+    await registry.close()
+
+
+async def check_expired_lease(backend: str, path: str):
+    registry = LogRegistry(backend=backend, sqlite_path=path)
+    transport = InProcessTransport(TcpFrontend(registry))
+    producer = ProducerClient(transport, INPUT_LOG)
+    await producer.send({"order": 2})
+    consumer = ConsumerClient(transport, INPUT_LOG, GROUP, "worker-2")
+    msg = await consumer.acquire_next(duration=0.05)
+    assert msg is not None
+    await asyncio.sleep(0.1)
+
+    try:
+        await consumer.settle_and_produce(
+            [{"message_id": msg["id"], "success": True}],
+            {OUTPUT_LOG: [{"payload": {"invoice": 2}}]},
+        )
+    except Exception as e:
+        print(f"[{backend}] Expired lease refused: {e}")
+    else:
+        raise AssertionError("An expired lease was accepted")
+    assert await registry.get_storage().get_length(OUTPUT_LOG) == 0
+    await registry.close()
+
+
+async def main():
+    # The server logs every refused request with its traceback
+    logging.getLogger("mamamia.server.tcp").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        await check_rollback(os.path.join(tmp, "rollback.db"))
+        for backend in BACKENDS:
+            await check_expired_lease(backend, os.path.join(tmp, f"{backend}.db"))
+        print(f"All checks passed in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())